@@ -258,6 +258,32 @@ DATA_DIRS = [
 
 NOTEBOOK_DIR = os.path.join(MEDIA_ROOT, 'uploads', "{username}", "notebooks")
 
+# Maximal number of instantiated data sources kept in memory by each process
+DATASOURCE_CACHE_SIZE = int(os.environ.get("DATASOURCE_CACHE_SIZE", 16))
+
+# How often the files behind a cached data source are checked for changes (seconds)
+DATASOURCE_FINGERPRINT_TTL = int(os.environ.get("DATASOURCE_FINGERPRINT_TTL", 30))
+
+# How often the catalogues of the data sources in use are checked for changes in the background (seconds)
+CATALOGUE_CHECK_INTERVAL = int(os.environ.get("CATALOGUE_CHECK_INTERVAL", 600))
+
+# Where the persisted indices of the lazily loaded data sources are stored
+DATASOURCE_INDEX_DIR = os.environ.get("DATASOURCE_INDEX_DIR", os.path.join(BASE_DIR, 'indices'))
+
+# Defaults for the data sources using Texts API (can be overridden in the specification of each data source)
+TEXTS_API_TIMEOUT = float(os.environ.get("TEXTS_API_TIMEOUT", 10))   # seconds
+TEXTS_API_RETRIES = int(os.environ.get("TEXTS_API_RETRIES", 3))
+TEXTS_API_CACHE_TTL = int(os.environ.get("TEXTS_API_CACHE_TTL", 60)) # seconds, 0 disables caching
+
+# How long the next datapoint, prepared for each annotator in the background, is kept in the cache (seconds)
+NEXT_DATAPOINT_CACHE_TIMEOUT = int(os.environ.get("NEXT_DATAPOINT_CACHE_TIMEOUT", 600))
+
+# Compression of the exports produced in the background ('gzip' or 'zstd', the latter requires zstandard)
+EXPORT_COMPRESSION = os.environ.get("EXPORT_COMPRESSION", 'gzip')
+
+# The minimal trigram word similarity (0..1) of fuzzy search results
+FUZZY_SEARCH_THRESHOLD = float(os.environ.get("FUZZY_SEARCH_THRESHOLD", 0.5))
+
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 20240
 DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600 # 100MB
 
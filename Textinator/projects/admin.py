@@ -225,7 +225,7 @@ class ProjectForm(forms.ModelForm):
             'temporary_message', 'reminders', 'dt_publish', 'dt_finish', 'collaborators',
             'task_type', 'guidelines', 'video_summary', 'datasources', 'show_datasource_identifiers',
             'is_open', 'is_peer_reviewed', 'allow_selecting_labels', 'disable_submitted_labels',
-            'disjoint_annotation', 'auto_text_switch', 'data_order', 'modal_configs'
+            'disjoint_annotation', 'lease_expiry', 'auto_text_switch', 'data_order', 'modal_configs'
             #'max_markers_per_input', 'has_intro_tour', 'round_length', 'points_scope', 'points_unit'
         ]
         widgets = {
@@ -338,7 +338,7 @@ class ProjectAdmin(nested_admin.NestedModelAdmin):
         }),
         (_('settings').title(), {
             'fields': ('data_order', 'is_open', 'allow_selecting_labels', 'disable_submitted_labels',
-                'disjoint_annotation', 'auto_text_switch', 'allow_editing', 'allow_post_editing',
+                'disjoint_annotation', 'lease_expiry', 'auto_text_switch', 'allow_editing', 'allow_post_editing',
                 'editing_as_revision', 'allow_reviewing', 'editing_title_regex')
         }),
         (_('administration').title(), {
@@ -484,6 +484,14 @@ class DataSourceAdmin(CommonModelAdmin):
 
     form = DataSourceForm
     list_display = ['name', 'source_type']
+    readonly_fields = CommonModelAdmin.readonly_fields + ['search_index']
+
+    @admin.display(description=_("search index"))
+    def search_index(self, obj):
+        progress = obj.search_reindex_progress() if obj and obj.pk else None
+        if progress is None or progress['finished']:
+            return _("Up to date")
+        return _("Re-indexing: {} of {} texts").format(progress['done'], progress['total'])
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+#
+# This is a file for the machinery supporting data sources (caching, indexing, etc.)
+#
+import os
+import re
+import sys
+import json
+import mmap
+import array
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def hash_spec(spec):
+    m = hashlib.sha256()
+    m.update(json.dumps(spec, sort_keys=True, default=str).encode('utf8'))
+    return m.hexdigest()
+
+
+class SourceCache:
+    """
+    A bounded LRU cache of instantiated data sources, shared by all requests served by the same process.
+
+    Each entry is keyed by the primary key of the `DataSource`, the user it was instantiated for and a hash of
+    its (final) specification, so editing the specification produces a new key. Entries for the same `DataSource`
+    and user with an outdated key are dropped as soon as a new one is loaded (entries for other users stay,
+    since each user might have different data dirs).
+
+    Each entry also remembers the fingerprint of the backing files computed when it was loaded. Computing
+    a fingerprint might require walking large folders, so it is re-checked at most once every
+    `settings.DATASOURCE_FINGERPRINT_TTL` seconds and the entry is reloaded if the files have changed.
+
+    **NOTE**: the cache is per-process, so `invalidate` affects only the process that received the `post_save`
+    signal. Other processes will pick up the change via the specification hash on their next lookup.
+    """
+    def __init__(self, maxsize=None):
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def maxsize(self):
+        if self.__maxsize is None:
+            return getattr(settings, 'DATASOURCE_CACHE_SIZE', 16)
+        return self.__maxsize
+
+    @property
+    def fingerprint_ttl(self):
+        return getattr(settings, 'DATASOURCE_FINGERPRINT_TTL', 30)
+
+    def get(self, ds_pk, spec, source_cls):
+        key = (ds_pk, spec.get('username'), hash_spec(spec))
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+
+        fingerprint = None
+        if entry is not None:
+            instance, loaded_fingerprint, checked_at = entry
+            if time.monotonic() - checked_at < self.fingerprint_ttl:
+                with self.__lock:
+                    self.__hits += 1
+                return instance
+
+            fingerprint = source_cls.fingerprint(spec)
+            if fingerprint == loaded_fingerprint:
+                with self.__lock:
+                    if key in self.__entries:
+                        self.__entries[key] = (instance, fingerprint, time.monotonic())
+                    self.__hits += 1
+                return instance
+
+        with self.__lock:
+            self.__misses += 1
+
+        # loading might take a while, so we don't hold the lock here
+        if fingerprint is None:
+            fingerprint = source_cls.fingerprint(spec)
+        instance = source_cls(spec)
+
+        with self.__lock:
+            for stale_key in [k for k in self.__entries if k[:2] == key[:2] and k != key]:
+                del self.__entries[stale_key]
+            self.__entries[key] = (instance, fingerprint, time.monotonic())
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+        return instance
+
+    def invalidate(self, ds_pk=None):
+        with self.__lock:
+            if ds_pk is None:
+                self.__entries.clear()
+            else:
+                for key in [k for k in self.__entries if k[0] == ds_pk]:
+                    del self.__entries[key]
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'hits': self.__hits,
+                'misses': self.__misses,
+                'size': len(self.__entries),
+                'maxsize': self.maxsize
+            }
+
+
+source_cache = SourceCache()
+
+
+class TTLCache:
+    """
+    A small thread-safe cache, where each entry expires `ttl` seconds after being set.
+    When full, the entry that was set the earliest is dropped.
+    """
+    def __init__(self, ttl, maxsize=1024):
+        self.__ttl = ttl
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.__entries[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        if self.__ttl <= 0:
+            return
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (time.monotonic() + self.__ttl, value)
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+
+class OffsetIndex:
+    """
+    A compact index of records spread across several files. For each record we keep the id of the file
+    holding it, its byte offset in that file and its length (in bytes), all stored in typed arrays.
+
+    The index is persisted in `settings.DATASOURCE_INDEX_DIR` on the first load and memory-mapped afterwards,
+    so that an already indexed data source costs neither a parse, nor memory proportional to its size.
+    The persisted index is rebuilt whenever the size or modification time of any indexed file changes.
+
+    The file layout is as follows:
+
+    - magic bytes + the length of the JSON header (as unsigned 64-bit integer)
+    - JSON header with the indexed files, their stats, number of records per file and build parameters
+    - padding to 8 bytes
+    - offsets ('Q'), file ids ('I') and lengths ('I'), `count` items each
+    """
+    MAGIC = b'TTIDX1\n'
+
+    def __init__(self, files, counts, offsets, file_ids, lengths, handle=None):
+        self.__files = files
+        self.__starts = [0]
+        for c in counts:
+            self.__starts.append(self.__starts[-1] + c)
+        self.__offsets = offsets
+        self.__file_ids = file_ids
+        self.__lengths = lengths
+        self.__handle = handle # keeps the memory map alive
+
+    @property
+    def files(self):
+        return self.__files
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def locate(self, idx):
+        """
+        Returns:
+            tuple: (file id, position of the record within the file)
+        """
+        fid = self.__file_ids[idx]
+        if idx < 0:
+            idx += len(self)
+        return fid, idx - self.__starts[fid]
+
+    def read(self, idx):
+        """
+        Returns:
+            bytes: The raw bytes of the record with the index `idx`
+        """
+        fid = self.__file_ids[idx]
+        with open(self.__files[fid], 'rb') as f:
+            f.seek(self.__offsets[idx])
+            return f.read(self.__lengths[idx])
+
+    @staticmethod
+    def file_stats(files):
+        res = []
+        for fname in files:
+            st = os.stat(fname)
+            res.append([str(fname), st.st_size, st.st_mtime_ns])
+        return res
+
+    @classmethod
+    def index_path(cls, stats, params):
+        index_dir = getattr(settings, 'DATASOURCE_INDEX_DIR', None)
+        if not index_dir:
+            return None
+        return os.path.join(index_dir, "{}.idx".format(hash_spec({
+            'files': [s[0] for s in stats],
+            'params': params
+        })))
+
+    @classmethod
+    def load_or_build(cls, files, records, params=None):
+        """
+        Args:
+            files (list): paths to the files that should be indexed
+            records (callable): a function taking a file name and yielding (offset, length) for each record in the file
+            params (dict, optional): any parameters affecting `records` (the index is rebuilt if they change)
+
+        Returns:
+            OffsetIndex: the index of all records in the given files (in the order of the files)
+        """
+        files = [str(f) for f in files]
+        stats = cls.file_stats(files)
+        path = cls.index_path(stats, params)
+
+        if path and os.path.exists(path):
+            try:
+                index = cls.load(path, stats, params)
+                if index is not None:
+                    return index
+            except (OSError, ValueError) as e:
+                logger.warning("Could not load the index {}: {}".format(path, e))
+
+        offsets, file_ids, lengths = array.array('Q'), array.array('I'), array.array('I')
+        counts = []
+        for fid, fname in enumerate(files):
+            cnt = 0
+            for offset, length in records(fname):
+                offsets.append(offset)
+                file_ids.append(fid)
+                lengths.append(length)
+                cnt += 1
+            counts.append(cnt)
+
+        if path:
+            try:
+                cls.save(path, stats, params, counts, offsets, file_ids, lengths)
+                index = cls.load(path, stats, params)
+                if index is not None:
+                    return index
+            except OSError as e:
+                logger.warning("Could not persist the index {}: {}".format(path, e))
+        return cls(files, counts, offsets, file_ids, lengths)
+
+    @classmethod
+    def save(cls, path, stats, params, counts, offsets, file_ids, lengths):
+        header = json.dumps({
+            'files': stats,
+            'counts': counts,
+            'params': params,
+            'byteorder': sys.byteorder
+        }).encode('utf8')
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(cls.MAGIC)
+                f.write(struct.pack('<Q', len(header)))
+                f.write(header)
+                f.write(b'\0' * (-f.tell() % 8))
+                offsets.tofile(f)
+                file_ids.tofile(f)
+                lengths.tofile(f)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, stats, params):
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        pos = len(cls.MAGIC)
+        if mm[:pos] != cls.MAGIC:
+            raise ValueError("not an index file")
+        header_len, = struct.unpack('<Q', mm[pos:pos + 8])
+        pos += 8
+        header = json.loads(mm[pos:pos + header_len])
+        if header['files'] != stats or header['params'] != params or header['byteorder'] != sys.byteorder:
+            # the index is outdated
+            mm.close()
+            return None
+        pos += header_len
+        pos += -pos % 8
+
+        N = sum(header['counts'])
+        view = memoryview(mm)
+        offsets = view[pos:pos + 8 * N].cast('Q')
+        pos += 8 * N
+        file_ids = view[pos:pos + 4 * N].cast('I')
+        pos += 4 * N
+        lengths = view[pos:pos + 4 * N].cast('I')
+        return cls([s[0] for s in stats], header['counts'], offsets, file_ids, lengths, handle=mm)
+
+
+def jsonl_records(fname):
+    offset = 0
+    with open(fname, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield offset, len(line)
+            offset += len(line)
+
+
+class JsonPathScanner:
+    """
+    Walks a JSON document (typically memory-mapped) along a dot-separated key path without decoding it
+    and yields the byte positions of the matched elements. The semantics follow `helpers.follow` with `flat=True`,
+    i.e. arrays are traversed element-wise (and flattened) at any point of the path.
+
+    Only strings are matched, unless an element was reached through an array, in which case
+    any non-object value is matched, exactly as `JsonSource` does when reading whole documents.
+    """
+    WS_RE = re.compile(rb'[ \t\n\r]*')
+    STRING_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+    SCALAR_RE = re.compile(rb'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null')
+    STRUCT_RE = re.compile(rb'["\[\]{}]')
+
+    def __init__(self, buf):
+        self.__buf = buf
+
+    def __ws(self, pos):
+        return self.WS_RE.match(self.__buf, pos).end()
+
+    def __char(self, pos):
+        return self.__buf[pos:pos + 1]
+
+    def __string_end(self, pos):
+        m = self.STRING_RE.match(self.__buf, pos)
+        if m is None:
+            raise ValueError("Malformed JSON string at byte {}".format(pos))
+        return m.end()
+
+    def __skip(self, pos):
+        c = self.__char(pos)
+        if c == b'"':
+            return self.__string_end(pos)
+        elif c in (b'[', b'{'):
+            depth = 0
+            while True:
+                m = self.STRUCT_RE.search(self.__buf, pos)
+                if m is None:
+                    raise ValueError("Unexpected end of JSON")
+                ch = m.group()
+                if ch == b'"':
+                    pos = self.__string_end(m.start())
+                    continue
+                depth += 1 if ch in (b'[', b'{') else -1
+                pos = m.end()
+                if depth == 0:
+                    return pos
+        else:
+            m = self.SCALAR_RE.match(self.__buf, pos)
+            if m is None:
+                raise ValueError("Malformed JSON value at byte {}".format(pos))
+            return m.end()
+
+    def __expect(self, pos, chars):
+        pos = self.__ws(pos)
+        c = self.__char(pos)
+        if c not in chars:
+            raise ValueError("Expected one of {} at byte {}".format(chars, pos))
+        return pos + 1, c
+
+    def __follow(self, pos, path, in_list):
+        pos = self.__ws(pos)
+        c = self.__char(pos)
+        if c == b'[':
+            pos = self.__ws(pos + 1)
+            if self.__char(pos) == b']':
+                return pos + 1
+            while True:
+                pos = yield from self.__follow(pos, path, True)
+                pos, c = self.__expect(pos, (b',', b']'))
+                if c == b']':
+                    return pos
+        elif c == b'{':
+            if not path:
+                return self.__skip(pos)
+            pos = self.__ws(pos + 1)
+            if self.__char(pos) == b'}':
+                return pos + 1
+            while True:
+                pos = self.__ws(pos)
+                key_end = self.__string_end(pos)
+                key = json.loads(bytes(self.__buf[pos:key_end]))
+                pos, _ = self.__expect(key_end, (b':',))
+                if key == path[0]:
+                    pos = yield from self.__follow(pos, path[1:], in_list)
+                else:
+                    pos = self.__skip(self.__ws(pos))
+                pos, c = self.__expect(pos, (b',', b'}'))
+                if c == b'}':
+                    return pos
+        else:
+            end = self.__skip(pos)
+            if not path and (in_list or c == b'"'):
+                yield pos, end - pos
+            return end
+
+    def find(self, key):
+        """
+        Yields:
+            tuple: (offset, length) of each element matched by the key path
+        """
+        yield from self.__follow(0, key.split('.'), False)
+
+
+def json_path_records(fname, key):
+    with open(fname, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from JsonPathScanner(mm).find(key)
@@ -1,17 +1,23 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import mmap
+import array
 import random
 import string
 import logging
 from pathlib import Path
+from functools import partial
 
 from django.conf import settings
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import jsonlines as jsl
 
 from .helpers import follow
+from .datasource_helpers import OffsetIndex, TTLCache, jsonl_records, json_path_records
 
 
 logger = logging.getLogger(__name__)
@@ -28,7 +34,7 @@ class AllowedDirsMixin:
     def set_allowed_dirs(self, username):
         self.__allowed_dirs = None
         if username:
-            self.__allowed_dirs = map(lambda x: x.format(username=username), settings.DATA_DIRS)
+            self.__allowed_dirs = [d.format(username=username) for d in settings.DATA_DIRS]
         else:
             fmt = string.Formatter()
             self.__allowed_dirs = [d for d in settings.DATA_DIRS if all([tup[1] is None for tup in fmt.parse(d)])]
@@ -57,6 +63,20 @@ class AllowedDirsMixin:
                     break
         return sorted(found_files)
 
+    def collect_files(self, files, folders, extension):
+        """
+        Returns:
+            list: The given files and the files with the given extension found recursively in the given folders
+        """
+        res = []
+        if files:
+            res.extend(self.find_files(files))
+
+        if folders:
+            for found_folder in self.find_folders(folders):
+                res.extend(sorted(Path(found_folder).rglob('*.{}'.format(extension))))
+        return res
+
 
 class TextDatapoint:
     def __init__(self, text=None):
@@ -100,6 +120,15 @@ class AbstractDataSource:
     def get_spec(self, key):
         return self.__spec.get(key)
 
+    @classmethod
+    def fingerprint(cls, spec_data):
+        """
+        Returns:
+            tuple: A cheap summary of the underlying data that changes whenever the data changes
+                   (used for invalidating the cached instances of the data source)
+        """
+        return ()
+
     def _add_datapoint(self, txt):
         self.__data.append(txt)
         self.__size += 1
@@ -114,6 +143,13 @@ class AbstractDataSource:
     def get_source_name(self, dp_id):
         pass
 
+    def get_many(self, keys):
+        """
+        Returns:
+            list: The datapoints under the given keys (in the same order)
+        """
+        return [self[k] for k in keys]
+
     def size(self):
         return self.__size
 
@@ -126,7 +162,9 @@ class AbstractDataSource:
 
 
 class FileBasedSource(AbstractDataSource, AllowedDirsMixin):
-    def __init__(self, spec_data, extension="txt", required_keys=None):
+    extension = "txt"
+
+    def __init__(self, spec_data, extension=None, required_keys=None):
         super().__init__(spec_data)
 
         if required_keys:
@@ -137,24 +175,41 @@ class FileBasedSource(AbstractDataSource, AllowedDirsMixin):
         self._mapping = []
 
         self.set_allowed_dirs(self.get_spec('username'))
-        self._files = []
-        if self.get_spec('files'):
-            found_files = self.find_files(self.get_spec('files'))
+        self._files = self.collect_files(self.get_spec('files'), self.get_spec('folders'), extension or self.extension)
 
-            for found_file in found_files:
-                self._files.append(found_file)
-
-        if self.get_spec('folders'):
-            found_folders = self.find_folders(self.get_spec('folders'))
+        if self.get_spec('lazy'):
+            self.build_index(self._files)
+        else:
+            for fname in self._files:
+                self.reader(fname)
 
-            for found_folder in found_folders:
-                self._files.extend(sorted(Path(found_folder).rglob('*.{}'.format(extension))))
+    def reader(self, fname):
+        raise NotImplementedError("You need to implement the reader method yourself!")
 
-        for fname in self._files:
+    def build_index(self, files):
+        # By default lazy loading is not supported, so we read all the files
+        for fname in files:
             self.reader(fname)
 
-    def reader(self, fname):
-        raise NotImplementedError("You need to implement the reader method yourself!")
+    @classmethod
+    def fingerprint(cls, spec_data):
+        # The stats of the files that would actually be loaded, so that editing a file in place
+        # or adding/removing a file anywhere in the (recursively read) folders changes the fingerprint.
+        # Walking the folders might be expensive, so `SourceCache` re-checks it at most once in a while.
+        spec = spec_data if isinstance(spec_data, dict) else json.loads(str(spec_data))
+        resolver = AllowedDirsMixin()
+        resolver.set_allowed_dirs(spec.get('username'))
+
+        paths = [str(p) for p in resolver.collect_files(spec.get('files'), spec.get('folders'), cls.extension)]
+
+        res = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                res.append((path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                res.append((path, -1, -1))
+        return tuple(res)
 
     def get_random_datapoint(self):
         idx = random.randint(0, self.size() - 1)
@@ -180,8 +235,13 @@ class PlainTextSource(AbstractDataSource):
 
 
 class TextFileSource(FileBasedSource):
+    """
+    If `lazy` is on in the specification, only the catalogue of files (paths and sizes) is kept in memory
+    and each file is read when requested (via `mmap` if `mmap` is on in the specification).
+    """
     def __init__(self, spec_data):
-        super().__init__(spec_data, extension="txt")
+        self._catalogue, self._sizes = None, None
+        super().__init__(spec_data)
 
     def reader(self, fname):
         # encoding to remove Byte Order Mark \ufeff (not sure if compatible with others)
@@ -189,29 +249,105 @@ class TextFileSource(FileBasedSource):
             self._add_datapoint(f.read())
             self._mapping.append(os.path.basename(fname))
 
+    def build_index(self, files):
+        self._catalogue = [str(fname) for fname in files]
+        self._sizes = array.array('Q', [os.path.getsize(fname) for fname in self._catalogue])
+        self._files = self._catalogue
+
+    def size(self):
+        if self._catalogue is None:
+            return super().size()
+        return len(self._catalogue)
+
+    def __getitem__(self, key):
+        if self._catalogue is None:
+            return super().__getitem__(key)
+
+        try:
+            idx = int(key)
+            fname = self._catalogue[idx]
+            if self.get_spec('mmap') and self._sizes[idx] > 0:
+                with open(fname, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    text = mm[:].decode('utf-8-sig')
+                # the same newline handling as when reading in text mode
+                return text.replace('\r\n', '\n').replace('\r', '\n')
+            else:
+                with open(fname, encoding='utf-8-sig') as f:
+                    return f.read()
+        except (ValueError, IndexError, OSError) as e:
+            logger.error(e)
+            return None
+
+    def get_source_name(self, dp_id):
+        if self._catalogue is None:
+            return super().get_source_name(dp_id)
+        return os.path.basename(self._catalogue[int(dp_id)])
+
 
 class JsonSource(FileBasedSource):
+    """
+    If `lazy` is on in the specification, the files are scanned along the `key` path without being decoded,
+    only the positions of the matched elements are indexed (and persisted) and each datapoint is decoded when requested.
+    """
+    extension = "json"
+
     def __init__(self, spec_data):
-        super().__init__(spec_data, extension="json", required_keys=["key"])
+        self._index = None
+        super().__init__(spec_data, required_keys=["key"])
 
     def reader(self, fname):
-        d = json.load(open(fname))
+        with open(fname) as f:
+            d = json.load(f)
         res = follow(d, self.get_spec('key'), flat=True)
 
         if isinstance(res, list):
             for el in res:
-                # this is all in-memory, of course
-                # TODO: think of fixing
+                # this is all in-memory, use `lazy` mode for large files
                 self._add_datapoint(el)
                 self._mapping.append(os.path.basename(fname))
         elif isinstance(res, str):
             self._add_datapoint(res)
             self._mapping.append(os.path.basename(fname))
 
+    def build_index(self, files):
+        key = self.get_spec('key')
+        self._index = OffsetIndex.load_or_build(
+            files, partial(json_path_records, key=key), params={'key': key}
+        )
+
+    def size(self):
+        if self._index is None:
+            return super().size()
+        return len(self._index)
+
+    def __getitem__(self, key):
+        if self._index is None:
+            return super().__getitem__(key)
+
+        try:
+            return json.loads(self._index.read(int(key)))
+        except (ValueError, IndexError) as e:
+            logger.error(e)
+            return None
+
+    def get_source_name(self, dp_id):
+        if self._index is None:
+            return super().get_source_name(dp_id)
+
+        fid, _ = self._index.locate(int(dp_id))
+        return os.path.basename(self._index.files[fid])
+
 
 class JsonLinesSource(FileBasedSource):
+    """
+    If `lazy` is on in the specification, only the offsets of the lines are indexed (and persisted)
+    and each datapoint is parsed when requested.
+    """
+    extension = "jsonl"
+
     def __init__(self, spec_data):
-        super().__init__(spec_data, extension="jsonl", required_keys=["key"])
+        self._index = None
+        super().__init__(spec_data, required_keys=["key"])
 
     def reader(self, fname):
         with jsl.open(fname) as reader:
@@ -221,40 +357,152 @@ class JsonLinesSource(FileBasedSource):
                     os.path.basename(fname), i
                 ))
 
+    def build_index(self, files):
+        self._index = OffsetIndex.load_or_build(files, jsonl_records)
+
+    def size(self):
+        if self._index is None:
+            return super().size()
+        return len(self._index)
+
+    def __getitem__(self, key):
+        if self._index is None:
+            return super().__getitem__(key)
+
+        try:
+            obj = json.loads(self._index.read(int(key)))
+            return obj[self.get_spec('key')]
+        except (ValueError, IndexError, KeyError) as e:
+            logger.error(e)
+            return None
+
+    def get_source_name(self, dp_id):
+        if self._index is None:
+            return super().get_source_name(dp_id)
+
+        fid, line_no = self._index.locate(int(dp_id))
+        return "{}.{}".format(os.path.basename(self._index.files[fid]), line_no)
+
 
 class TextsAPISource(AbstractDataSource):
+    """
+    A data source backed by a server compatible with Texts API.
+
+    All requests go through a pooled HTTP session with timeouts and retries. The size of the dataset,
+    the source names and recently seen texts are cached for `cache_ttl` seconds, since `DatapointInfo`
+    asks for them on every page. If the server supports `/get_datapoints`, several datapoints
+    are fetched in a single request by `get_many`.
+
+    The defaults for `timeout`, `retries` and `cache_ttl` come from the settings,
+    but can be overridden in the specification.
+    """
+    BATCH_SIZE = 100
+
     def __init__(self, spec_data):
         super().__init__(spec_data)
         self.__endpoint = self.get_spec('endpoint').rstrip('/')
+        self.__timeout = self.__setting('timeout', 'TEXTS_API_TIMEOUT', 10)
+
+        retries = Retry(
+            total=self.__setting('retries', 'TEXTS_API_RETRIES', 3),
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=('GET',)
+        )
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(max_retries=retries)
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
+
+        ttl = self.__setting('cache_ttl', 'TEXTS_API_CACHE_TTL', 60)
+        self.__cache = TTLCache(ttl)
+        self.__batch_supported = None
+
+    def __setting(self, key, setting, default):
+        value = self.get_spec(key)
+        if value is None:
+            value = getattr(settings, setting, default)
+        return value
+
+    def __request(self, path, **params):
+        """
+        Returns:
+            tuple: (HTTP status code or None if the request failed, decoded JSON response or None)
+        """
+        try:
+            r = self.__session.get(
+                "{}/{}".format(self.__endpoint, path), params=params, timeout=self.__timeout
+            )
+        except requests.RequestException as e:
+            logger.error("Texts API request to {} failed: {}".format(self.__endpoint, e))
+            return None, None
+        if r.status_code == 200:
+            try:
+                return r.status_code, r.json()
+            except ValueError as e:
+                logger.error(e)
+        return r.status_code, None
+
+    def __get(self, path, **params):
+        return self.__request(path, **params)[1]
 
     def __getitem__(self, key):
-        r = requests.get("{}/get_datapoint?key={}".format(self.__endpoint, key))
-        if r.status_code == 200:
-            data = r.json()
-            return data['text']
-        else:
+        text = self.__cache.get(('text', str(key)))
+        if text is not None:
+            return text
+
+        data = self.__get("get_datapoint", key=key)
+        if data is None:
             return ""
+        self.__cache.set(('text', str(key)), data['text'])
+        return data['text']
+
+    def get_many(self, keys):
+        keys = [str(k) for k in keys]
+        texts = {k: self.__cache.get(('text', k)) for k in keys}
+        missing = [k for k in keys if texts[k] is None]
+
+        if missing and self.__batch_supported is not False:
+            for i in range(0, len(missing), self.BATCH_SIZE):
+                status, data = self.__request("get_datapoints", keys=",".join(missing[i:i + self.BATCH_SIZE]))
+                if data is None:
+                    # use single requests, for good only if the server doesn't implement batching
+                    if status in (404, 405):
+                        self.__batch_supported = False
+                    break
+                self.__batch_supported = True
+                for k, text in data.get('texts', {}).items():
+                    texts[str(k)] = text
+                    self.__cache.set(('text', str(k)), text)
+
+        return [texts[k] if texts[k] is not None else self[k] for k in keys]
 
     def get_random_datapoint(self):
-        r = requests.get("{}/get_random_datapoint".format(self.__endpoint))
-        if r.status_code == 200:
-            data = r.json()
-            return data['key'], data['text']
-        else:
+        data = self.__get("get_random_datapoint")
+        if data is None:
             return -1, ""
+        self.__cache.set(('text', str(data['key'])), data['text'])
+        return data['key'], data['text']
 
     def size(self):
-        r = requests.get("{}/size".format(self.__endpoint))
-        if r.status_code == 200:
-            data = r.json()
-            return data['size']
-        else:
+        size = self.__cache.get('size')
+        if size is not None:
+            return size
+
+        data = self.__get("size")
+        if data is None:
             return 0
+        size = int(data['size'])
+        self.__cache.set('size', size)
+        return size
 
     def get_source_name(self, dp_id):
-        r = requests.get("{}/get_source_name?key={}".format(self.__endpoint, dp_id))
-        if r.status_code == 200:
-            data = r.json()
-            return data['name']
-        else:
+        name = self.__cache.get(('name', str(dp_id)))
+        if name is not None:
+            return name
+
+        data = self.__get("get_source_name", key=dp_id)
+        if data is None:
             return ""
+        self.__cache.set(('name', str(dp_id)), data['name'])
+        return data['name']
@@ -1,10 +1,22 @@
 # -*- coding: utf-8 -*-
+import gzip
+import itertools
+import datetime as dt
 from collections import abc
+from operator import itemgetter
 
-from django.db.models import F, Window
-from django.db.models.functions import RowNumber
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q, Count, Max, Func, OuterRef, Prefetch, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 from .models import *
+from .datasource_helpers import hash_spec
 
 
 # Taken from:
@@ -18,36 +30,214 @@ def dict_update(d, u):
     return d
 
 
-def have_the_same_relation(group):
-    return len(set([r['type'] for r in group])) == 1
+# Everything `to_minimal_json` and `to_short_rel_json` of Labels and Inputs need
+MARKER_FIELDS = ('marker__marker', 'marker__unit')
+
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    chunk = list(itertools.islice(it, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(it, size))
 
 
-def merge2cluster(group):
-    nodes = {}
-    for r in group:
-        nodes["{}:{}".format(r['first']['start'], r['first']['end'])] = r['first']
-        nodes["{}:{}".format(r['second']['start'], r['second']['end'])] = r['second']
-    return {
-        'type': group[0]['type'],
-        'nodes': list(nodes.values()),
-        'extra': group[0]['extra'] if 'extra' in group[0] else '',
-        "annotator": group[0]['annotator'] if 'annotator' in group[0] else ''
-    }
+class CorefClusterBuilder:
+    """
+    Builds coreference clusters of a project, one context at a time.
 
+    Relations are fetched as flat tuples in a single query ordered by context. The relations of
+    each annotated group (i.e., a batch and a cluster within it) are merged into clusters using
+    union-find if they are all of the same bidirectional type and are kept as a list of relations otherwise.
+    The labels not participating in any relation (singletons) are fetched with one more query
+    and merged into the stream of contexts.
+    """
+    REL_FIELDS = ('first_label__context_id', 'batch__uuid', 'cluster', 'rule_id', 'extra', 'batch__user__username')
+    LABEL_FIELDS = ('id', 'start', 'end', 'marker_id', 'group_order', 'extra')
+
+    def __init__(self, project, include_usernames=False, chunk_size=2000):
+        self.__project = project
+        self.__include_usernames = include_usernames
+        self.__chunk_size = chunk_size
 
-def group2hash(group):
-    if isinstance(group, list):
-        group = sorted(group, key=lambda x: x['first']['start'])
-        return ";".join(["{}:{}:{}:{}:{}".format(
-            x['type'], x['first']['start'], x['first']['end'],
-            x['second']['start'], x['second']['end']
-        ) for x in group])
-    elif isinstance(group, dict):
-        nodes = sorted(group['nodes'], key=lambda x: x['start'])
-        return "{}:{}".format(group['type'], ";".join(["{},{}".format(x['start'], x['end']) for x in nodes]))
+        self.__markers = {
+            mv.pk: (mv.name, mv.unit_id is not None)
+            for mv in MarkerVariant.objects.filter(project=project).select_related('marker')
+        }
+        self.__rules = {
+            rv.pk: (rv.name, rv.direction == '2')
+            for rv in RelationVariant.objects.filter(project=project).select_related('relation')
+        }
+
+    def __relations(self):
+        return LabelRelation.objects.filter(
+            first_label__marker__project=self.__project, undone=False
+        )
+
+    def __context_groups(self):
+        """
+        Yields triples (context id, content, relation rows) one context at a time. The contents are fetched
+        for a chunk of rows at once and are kept only until the context's rows end, which might be
+        in one of the next chunks.
+        """
+        rows = self.__relations().values_list(
+            *self.REL_FIELDS,
+            *['first_label__{}'.format(f) for f in self.LABEL_FIELDS],
+            *['second_label__{}'.format(f) for f in self.LABEL_FIELDS]
+        ).order_by('first_label__context_id', 'batch_id', 'cluster', 'pk')
+
+        contents, open_id, open_rows = {}, None, []
+        for chunk in chunked(rows.iterator(chunk_size=self.__chunk_size), self.__chunk_size):
+            missing = {r[0] for r in chunk} - contents.keys()
+            contents.update(Context.objects.filter(pk__in=missing).values_list('pk', 'content'))
+            for row in chunk:
+                if row[0] != open_id:
+                    if open_id is not None:
+                        yield open_id, contents.pop(open_id), open_rows
+                    open_id, open_rows = row[0], []
+                open_rows.append(row)
+        if open_id is not None:
+            yield open_id, contents.pop(open_id), open_rows
+
+    def __rule(self, rule_id):
+        # relations might (erroneously) use the rules of other projects, which are fetched on demand
+        if rule_id not in self.__rules:
+            rv = RelationVariant.objects.filter(pk=rule_id).select_related('relation').first()
+            self.__rules[rule_id] = (rv.name, rv.direction == '2') if rv else ("", False)
+        return self.__rules[rule_id]
+
+    def __singleton_rows(self):
+        related = self.__relations()
+        return Label.objects.filter(
+            marker__project=self.__project,
+            context_id__in=related.values('first_label__context_id'),
+            undone=False
+        ).exclude(
+            pk__in=related.values('first_label_id')
+        ).exclude(
+            pk__in=related.values('second_label_id')
+        ).values_list(
+            'context_id', *self.LABEL_FIELDS, 'batch__user__username'
+        ).order_by('context_id', 'pk').iterator(chunk_size=self.__chunk_size)
+
+    def __label(self, content, label_id, start, end, marker_id, group_order, extra):
+        # mirrors `Label.to_short_rel_json`
+        marker_name, has_unit = self.__markers.get(marker_id, ("", False))
+        res = {
+            'marker': marker_name,
+            'text': content[start:end] if start is not None and end is not None else "{}<Text>".format(marker_name)
+        }
+        if has_unit:
+            res['group_order'] = group_order
+        for x, val in (('extra', extra), ('start', start), ('end', end)):
+            is_not_empty = val if type(val) == dict else True
+            if val is not None and is_not_empty:
+                res[x] = val
+        return res
+
+    def __clusters(self, rows):
+        # union-find over the labels connected by the relations of the group
+        parent = {}
+
+        def find(x):
+            root = x
+            while parent[root] != root:
+                root = parent[root]
+            while parent[x] != root:
+                parent[x], x = root, parent[x]
+            return root
+
+        for row in rows:
+            first, second = row[6], row[12]
+            parent.setdefault(first, first)
+            parent.setdefault(second, second)
+            parent[find(first)] = find(second)
+
+        components = {}
+        for row in rows:
+            components.setdefault(find(row[6]), []).append(row)
+        return list(components.values())
+
+    def __group(self, content, rows):
+        """
+        Returns a list of pairs (key, group) for the relations in `rows` sharing the same batch and cluster
+        """
+        rule_ids = {r[3] for r in rows}
+        rule_name, is_bidirectional = self.__rule(rows[0][3])
+
+        if len(rule_ids) == 1 and is_bidirectional:
+            groups = []
+            for component in self.__clusters(rows):
+                nodes = {}
+                for r in component:
+                    for offset in (6, 12):
+                        nodes.setdefault((r[offset + 1], r[offset + 2]), self.__label(content, *r[offset:offset + 6]))
+                cluster = {
+                    'type': rule_name,
+                    'nodes': list(nodes.values()),
+                    'extra': component[0][4] or '',
+                    'annotator': component[0][5] if self.__include_usernames else ''
+                }
+                dedup_key = (rule_name, frozenset(nodes.keys()))
+                groups.append((dedup_key, cluster))
+            return groups
+        else:
+            group = []
+            for r in rows:
+                rel = {
+                    'type': self.__rule(r[3])[0],
+                    'first': self.__label(content, *r[6:12]),
+                    'second': self.__label(content, *r[12:18])
+                }
+                if r[4]:
+                    rel["extra"] = r[4]
+                if self.__include_usernames:
+                    rel["annotator"] = r[5]
+                group.append(rel)
+            dedup_key = tuple(sorted((r[3], r[7], r[8], r[13], r[14]) for r in rows))
+            return [(dedup_key, group)]
+
+    def build(self):
+        singletons = self.__singleton_rows()
+        sng = next(singletons, None)
+
+        for context_id, content, ctx_rows in self.__context_groups():
+            obj = {
+                'context': content,
+                "relations": {}
+            }
+
+            seen = set()
+            for (batch_uuid, cluster), rows in itertools.groupby(ctx_rows, key=itemgetter(1, 2)):
+                groups = self.__group(content, list(rows))
+                for i, (dedup_key, group) in enumerate(groups):
+                    if dedup_key in seen: continue
+                    seen.add(dedup_key)
+                    key = "{}_{}".format(batch_uuid, cluster)
+                    obj["relations"][key if i == 0 else "{}_{}".format(key, i + 1)] = group
+
+            while sng is not None and sng[0] <= context_id:
+                if sng[0] == context_id:
+                    sng_obj = self.__label(content, *sng[1:7])
+                    if self.__include_usernames:
+                        sng_obj['annotator'] = sng[7]
+                    obj.setdefault("labels", []).append(sng_obj)
+                sng = next(singletons, None)
+            yield obj
 
 
 class AnnotationExporter:
+    """
+    Exports the annotations of a project one context group at a time.
+
+    Every `_export_<task_type>` method is a generator walking the underlying querysets
+    ordered by context with server-side cursors, so the memory footprint is bounded by
+    the largest context group, not by the size of the project. `stream` yields these groups
+    as they become ready, whereas `export` collects them into a list.
+    """
+    chunk_size = 2000
+    watermark_overlap = dt.timedelta(minutes=1)
+
     def __init__(self, project, config):
         self.__project = project
         self.__config = {
@@ -58,200 +248,178 @@ class AnnotationExporter:
         }
         self.__config.update(config)
 
+    def __chunks(self, qs):
+        return chunked(qs.iterator(chunk_size=self.chunk_size), self.chunk_size)
+
+    def __contexts(self, ids):
+        fields = ('content', 'datasource', 'datapoint') if self.__config['include_flags'] else ('content',)
+        return Context.objects.only(*fields).in_bulk(ids)
+
+    def __attach_contexts(self, labels, contexts):
+        # `Label.text` is sliced out of the context, which would otherwise be fetched label by label
+        missing = {l.context_id for l in labels} - contexts.keys()
+        if missing:
+            contexts.update(self.__contexts(missing))
+        for l in labels:
+            l.context = contexts[l.context_id]
+
+    def __batch_labels(self, batch):
+        for l in batch.label_set.all():
+            yield l
+        for r in batch.labelrelation_set.all():
+            yield r.first_label
+            yield r.second_label
+
+    def __flags(self, contexts):
+        flags = {}
+        if self.__config['include_flags'] and contexts:
+            keys = {(c.datasource_id, c.datapoint) for c in contexts}
+            dals = DataAccessLog.objects.filter(
+                datasource_id__in={k[0] for k in keys}, datapoint__in={k[1] for k in keys},
+                is_deleted=False
+            ).values_list('datasource_id', 'datapoint', 'flags').order_by('pk')
+            for ds_id, dp, dal_flags in dals:
+                if (ds_id, dp) in keys and dal_flags:
+                    flags[(ds_id, dp)] = dict_update(flags.get((ds_id, dp), {}), dal_flags)
+        return flags
+
     def _export_corr(self):
         # The problem is that the context exists in every label and if this is the whole text, then it's a problem
         # So if the context is the whole text, we need to group by batches and send over contexts only once
         # Otherwise we'll need to have contexts for every label
         # We also skip non-relation labels for corr even if they exist
-        json_exporter = 'to_short_rel_json'
-        relations = LabelRelation.objects.filter(
-            first_label__marker__project=self.__project, undone=False
-        ).order_by('first_label__context_id', 'batch', 'cluster')
-
-        grouped_relations = []
-        labels_in_relation = set()
-        is_bidirectional, hashes = {}, set()
-        group, context, context_id, batch, cluster = [], None, -1, -1, -1
-        for r in relations.prefetch_related('first_label', 'second_label', 'rule', 'batch'):
-            if batch == -1 or r.batch != batch or r.cluster != cluster:
-                if group:
-                    if have_the_same_relation(group) and is_bidirectional.get(group[0]['type'], False):
-                        group = merge2cluster(group)
-                    ghash = group2hash(group)
-
-                    if ghash not in hashes:
-                        hashes.add(ghash)
-
-                        if group not in grouped_relations[-1]["relations"].values():
-                            grouped_relations[-1]["relations"]["{}_{}".format(batch, cluster)] = group
-                group = []
-
-            if context_id == -1 or (
-                context_id != r.first_label.context_id and
-                context == r.first_label.context.content):
-                if context_id == -1:
-                    context_id = r.first_label.context_id
-                    context = r.first_label.context.content
-                else:
-                    singletons = Label.objects.filter(
-                        marker__project=self.__project,
-                        context_id=context_id,
-                        undone=False
-                    ).exclude(pk__in=list(labels_in_relation))
-
-                    if singletons.count():
-                        grouped_relations[-1]["labels"] = []
-                        for sng in singletons.all():
-                            sng_obj = getattr(sng, json_exporter)()
-                            if self.__config['include_usernames']:
-                                sng_obj['annotator'] = sng.batch.user.username
-                            grouped_relations[-1]["labels"].append(sng_obj)
-
-                    labels_in_relation = set()
-                context = r.first_label.context.content
-                grouped_relations.append({
-                    'context': context,
-                    "relations": {}
-                })
-
-            group.append({
-                'type': r.rule.name,
-                'first': getattr(r.first_label, json_exporter)(),
-                'second': getattr(r.second_label, json_exporter)()
-            })
-            if r.extra:
-                group[-1]["extra"] = r.extra
-            if self.__config['include_usernames']:
-                group[-1]["annotator"] = r.batch.user.username
-            batch = r.batch
-            cluster = r.cluster
-            context_id = r.first_label.context_id
-            labels_in_relation.add(r.first_label.pk)
-            labels_in_relation.add(r.second_label.pk)
-            is_bidirectional[r.rule.name] = r.rule.direction == '2'
-        if group:
-            if have_the_same_relation(group) and is_bidirectional.get(group[0]['type'], False):
-                group = merge2cluster(group)
-            ghash = group2hash(group)
-
-            if ghash not in hashes:
-                hashes.add(ghash)
-
-                if group not in grouped_relations[-1]["relations"].values():
-                    grouped_relations[-1]["relations"]["{}_{}".format(batch, cluster)] = group
-
-        singletons = Label.objects.filter(
-            marker__project=self.__project,
-            context_id=context_id,
-            undone=False
-        ).exclude(pk__in=list(labels_in_relation))
-
-        if singletons.count():
-            grouped_relations[-1]["labels"] = []
-            for sng in singletons.all():
-                sng_obj = getattr(sng, json_exporter)()
-                if self.__config['include_usernames']:
-                    sng_obj['annotator'] = sng.batch.user.username
-                grouped_relations[-1]["labels"].append(sng_obj)
-        return grouped_relations
+        return CorefClusterBuilder(
+            self.__project, include_usernames=self.__config['include_usernames'], chunk_size=self.chunk_size
+        ).build()
 
     def _export_pronr(self):
         return self._export_corr()
 
     def _export_qa(self):
-        inputs = Input.objects.filter(marker__project=self.__project).order_by('context_id')
+        inputs = Input.objects.filter(
+            marker__project=self.__project
+        ).select_related('batch', *MARKER_FIELDS).prefetch_related(
+            Prefetch('batch__label_set', queryset=Label.objects.select_related(*MARKER_FIELDS).order_by('pk'))
+        ).order_by('context_id', 'pk')
 
         cur_context_id = None
-        resp = []
         obj = None
-        for inp in inputs.all():
-            if cur_context_id != inp.context_id:
-                if obj:
-                    resp.append(obj)
-                obj = {}
-                obj["context"] = inp.context.content
-                obj["annotations"] = []
+        for chunk in self.__chunks(inputs):
+            contexts = self.__contexts({inp.context_id for inp in chunk})
+            self.__attach_contexts([l for inp in chunk for l in inp.batch.label_set.all()], contexts)
+            for inp in chunk:
+                if cur_context_id != inp.context_id:
+                    if obj:
+                        yield obj
+                    obj = {}
+                    obj["context"] = contexts[inp.context_id].content
+                    obj["annotations"] = []
 
-            ann = {}
-            inp_marker = (inp.marker.export_name or inp.marker.name_en.lower() or inp.marker.name.lower()) if inp.marker else "question"
-            ann[inp_marker] = inp.content
-
-            inp_labels = Label.objects.filter(batch=inp.batch).all()
-
-            if inp_labels:
-                ann["choices"] = []
-                for label in inp_labels:
-                    ann["choices"].append({
-                        "text": label.text,
-                        "start": label.start,
-                        "end": label.end,
-                        "type": label.marker.export_name or label.marker.name_en.lower() or label.marker.name.lower(),
-                    })
-                    if label.extra:
-                        ann["choices"][-1]["extra"] = label.extra
-                obj["annotations"].append(ann)
-
-            cur_context_id = inp.context_id
+                ann = {}
+                inp_marker = (inp.marker.export_name or inp.marker.name_en.lower() or inp.marker.name.lower()) if inp.marker else "question"
+                ann[inp_marker] = inp.content
+
+                inp_labels = inp.batch.label_set.all()
+
+                if inp_labels:
+                    ann["choices"] = []
+                    for label in inp_labels:
+                        ann["choices"].append({
+                            "text": label.text,
+                            "start": label.start,
+                            "end": label.end,
+                            "type": label.marker.export_name or label.marker.name_en.lower() or label.marker.name.lower(),
+                        })
+                        if label.extra:
+                            ann["choices"][-1]["extra"] = label.extra
+                    obj["annotations"].append(ann)
+
+                cur_context_id = inp.context_id
         if obj:
-            resp.append(obj)
-        return resp
+            yield obj
 
     def _export_mcqa(self):
         return self._export_qa()
 
-    def _export_mcqar(self):
-        input_batches = Input.objects.filter(marker__project=self.__project).values_list('batch', flat=True)
-        batches = Batch.objects.filter(pk__in=input_batches).prefetch_related('label_set', 'input_set')
-
-        resp = {}
-        for batch in batches:
-            inputs = batch.input_set
-
-            if inputs.count():
-                context_id = inputs.first().context_id
-                if context_id not in resp:
-                    resp[context_id] = {
-                        "context": inputs.first().context.content,
-                        "annotations": []
-                    }
+    def __batches_by_context(self, batches):
+        # The context of a batch is the one of its first input or, if there are none, of its first label.
+        # Ordering by it lets us emit every context as soon as the cursor moves past it.
+        first_input = Input.objects.filter(batch=OuterRef('pk')).order_by('pk').values('context_id')[:1]
+        first_label = Label.objects.filter(batch=OuterRef('pk')).order_by('pk').values('context_id')[:1]
+        return batches.annotate(
+            ctx_id=Coalesce(Subquery(first_input), Subquery(first_label))
+        ).order_by('ctx_id', 'pk')
 
-                if inputs.count():
-                    resp[context_id]["annotations"].append([i.to_minimal_json() for i in inputs.all()])
+    def _export_mcqar(self):
+        input_batches = Input.objects.filter(marker__project=self.__project).values('batch')
+        batches = self.__batches_by_context(
+            Batch.objects.filter(pk__in=input_batches)
+        ).prefetch_related(
+            Prefetch('input_set', queryset=Input.objects.select_related(*MARKER_FIELDS).order_by('pk'))
+        )
 
-        return list(resp.values())
+        obj, context_id = None, None
+        for chunk in self.__chunks(batches):
+            contexts = self.__contexts({batch.ctx_id for batch in chunk})
+            for batch in chunk:
+                inputs = batch.input_set.all()
+
+                if inputs:
+                    if context_id != batch.ctx_id:
+                        if obj:
+                            yield obj
+                        context_id = batch.ctx_id
+                        obj = {
+                            "context": contexts[context_id].content,
+                            "annotations": []
+                        }
+
+                    obj["annotations"].append([i.to_minimal_json() for i in inputs])
+        if obj:
+            yield obj
 
     def _export_ner(self):
         label_batches = Label.objects.filter(
             marker__project=self.__project, undone=False
-        ).values_list('batch', flat=True)
+        ).values('batch')
 
-        batches = Batch.objects.filter(pk__in=label_batches).prefetch_related('label_set')
-        resp = {}
-        for batch in batches:
-            labels = batch.label_set
-
-            if labels.count():
-                context_id = labels.first().context_id
-                if context_id not in resp:
-                    resp[context_id] = {
-                        "context": labels.first().context.content,
-                        "annotations": []
-                    }
-
-                ann = {}
-                if labels.count():
-                    ann["named_entities"] = [l.to_minimal_json() for l in labels.all()]
+        batches = self.__batches_by_context(
+            Batch.objects.filter(pk__in=label_batches)
+        ).prefetch_related(
+            Prefetch('label_set', queryset=Label.objects.select_related(*MARKER_FIELDS).order_by('pk'))
+        )
 
-                resp[context_id]["annotations"].append(ann)
-        return list(resp.values())
+        obj, context_id = None, None
+        for chunk in self.__chunks(batches):
+            contexts = self.__contexts({batch.ctx_id for batch in chunk})
+            self.__attach_contexts([l for batch in chunk for l in batch.label_set.all()], contexts)
+            for batch in chunk:
+                labels = batch.label_set.all()
+
+                if labels:
+                    if context_id != batch.ctx_id:
+                        if obj:
+                            yield obj
+                        context_id = batch.ctx_id
+                        obj = {
+                            "context": contexts[context_id].content,
+                            "annotations": []
+                        }
+
+                    obj["annotations"].append({
+                        "named_entities": [l.to_minimal_json() for l in labels]
+                    })
+        if obj:
+            yield obj
 
     def _export_mt(self):
         return self._export_mcqar()
 
-    def __export_batch(self, batch, is_revision=False):
-        labels = batch.label_set
-        inputs = batch.input_set
-        relations = batch.labelrelation_set
+    def __export_batch(self, batch, is_revision=False, context=None, flags=None):
+        # all annotations of the batch are expected to be prefetched (see `__batch_prefetches`)
+        labels = batch.label_set.all()
+        inputs = batch.input_set.all()
+        relations = batch.labelrelation_set.all()
         res = {
             "annotations": []
         }
@@ -259,39 +427,32 @@ class AnnotationExporter:
         if not is_revision:
             res['context'] = None
 
-        if labels.count() or inputs.count():
-            context_id = inputs.first().context_id if inputs.count() else labels.first().context_id
+        if labels or inputs:
+            context_id = inputs[0].context_id if inputs else labels[0].context_id
             if not is_revision and res['context'] is None:
-                ctx = inputs.first().context if inputs.count() else labels.first().context
-                res["context"] = ctx.content
+                res["context"] = context.content
                 # TODO: should revisions allow for flags?
                 if self.__config["include_flags"]:
-                    res["flags"] = {}
-                    dals = DataAccessLog.objects.filter(
-                        datapoint=ctx.datapoint, datasource_id=ctx.datasource_id,
-                        is_deleted=False
-                    )
-                    for dal in dals.all():
-                        res['flags'] = dict_update(res['flags'], dal.flags)
+                    res["flags"] = flags or {}
                 if self.__config["include_batch_no"]:
                     res["num"] = batch.index
 
             ann = {}
             exclude_labels = set()
-            if relations.count():
+            if relations:
                 ann["relations"] = []
-                for r in relations.all():
+                for r in relations:
                     ann["relations"].append(r.to_minimal_json())
-                    exclude_labels.add(r.first_label)
-                    exclude_labels.add(r.second_label)
+                    exclude_labels.add(r.first_label_id)
+                    exclude_labels.add(r.second_label_id)
 
-            if labels.count():
-                ann["labels"] = [l.to_minimal_json() for l in labels.all() if l not in exclude_labels]
+            if labels:
+                ann["labels"] = [l.to_minimal_json() for l in labels if l.pk not in exclude_labels]
                 if not ann["labels"]:
                     del ann["labels"]
 
-            if inputs.count():
-                ann["inputs"] = [i.to_minimal_json() for i in inputs.all()]
+            if inputs:
+                ann["inputs"] = [i.to_minimal_json() for i in inputs]
 
             if self.__config["include_usernames"]:
                 ann["annotator"] = batch.user.username
@@ -301,53 +462,240 @@ class AnnotationExporter:
         else:
             return None, None
 
+    def __batch_prefetches(self):
+        return [
+            Prefetch('label_set', queryset=Label.objects.select_related(*MARKER_FIELDS).order_by('pk')),
+            Prefetch('input_set', queryset=Input.objects.select_related(*MARKER_FIELDS).order_by('pk')),
+            Prefetch('labelrelation_set', queryset=LabelRelation.objects.select_related(
+                'rule__relation',
+                *['{}__{}'.format(l, f) for l in ('first_label', 'second_label') for f in MARKER_FIELDS]
+            ).order_by('pk'))
+        ]
+
+    def __generic_batches(self):
+        label_batches = Label.objects.filter(
+            marker__project=self.__project, undone=False
+        ).values('batch')
+        input_batches = Input.objects.filter(
+            marker__project=self.__project
+        ).values('batch')
+
+        return Batch.objects.filter(
+            Q(pk__in=label_batches) | Q(pk__in=input_batches)
+        ).filter(
+            revision_of__isnull=True
+        )
 
-    def _export_generic(self):
-        if self.__config['consolidate_clusters']:
-            return self._export_corr()
-        else:
-            label_batches = Label.objects.filter(
-                marker__project=self.__project, undone=False
-            ).values_list('batch', flat=True)
-            input_batches = Input.objects.filter(
-                marker__project=self.__project
-            ).values_list('batch', flat=True)
-
-            batches = Batch.objects.filter(
-                pk__in=set(label_batches) | set(input_batches)
-            ).filter(
-                revision_of__isnull=True
-            ).prefetch_related('label_set', 'input_set')
-
-            window_exp = Window(
-                expression=RowNumber(),
-                order_by=F('dt_created').asc()
+    def __export_batches(self, batches, include_uuid=False):
+        revisions = Batch.objects.select_related('user').prefetch_related(*self.__batch_prefetches()).order_by('pk')
+        batches = self.__batches_by_context(
+            batches.select_related('user').prefetch_related(
+                *self.__batch_prefetches(), Prefetch('revisions', queryset=revisions)
             )
-            batches = batches.annotate(index=window_exp)
-
-            resp = defaultdict(lambda: defaultdict(dict))
-            for batch in batches:
-                context_id, res = self.__export_batch(batch)
-                resp[context_id][batch.index] = dict_update(
-                    resp[context_id][batch.index], res
-                )
-                if batch.revisions.count() > 0:
+        )
+
+        for chunk in self.__chunks(batches):
+            contexts = self.__contexts({batch.ctx_id for batch in chunk})
+            flags = self.__flags(contexts.values())
+            self.__attach_contexts([
+                l for batch in chunk for b in itertools.chain([batch], batch.revisions.all())
+                for l in self.__batch_labels(b)
+            ], contexts)
+            for batch in chunk:
+                context = contexts.get(batch.ctx_id)
+                batch_flags = flags.get((context.datasource_id, context.datapoint)) if flags and context else None
+                _, res = self.__export_batch(batch, context=context, flags=batch_flags)
+                if res is None: continue
+                if include_uuid:
+                    res["batch"] = str(batch.uuid)
+                if batch.revisions.all():
                     rev = []
                     for rb in batch.revisions.all():
                         _, rb_res = self.__export_batch(rb, is_revision=True)
                         if rb_res is None: continue
                         rev.append(rb_res)
-                    resp[context_id][batch.index]["_rev"] = rev
+                    res["_rev"] = rev
+                yield res
 
+    def _export_generic(self):
+        if self.__config['consolidate_clusters']:
+            yield from self._export_corr()
+            return
 
-        final_res = []
-        for d in resp.values():
-            final_res.extend(d.values())
-        return final_res
+        window_exp = Window(
+            expression=RowNumber(),
+            order_by=F('dt_created').asc()
+        )
+        yield from self.__export_batches(self.__generic_batches().annotate(index=window_exp))
+
+    def changes(self, since=None):
+        """
+        Exports only the annotations that changed after the `since` watermark (all of them if `since` is None).
+
+        Returns a triple (`watermark`, `batches`, `tombstones`), where `batches` yields every new or changed batch
+        in the generic format (each with its UUID under the key "batch" and the revisions under "_rev")
+        and `tombstones` yields the deleted or undone annotations, as well as the deleted batches.
+        A changed batch is always exported as a whole, so it should replace the previously exported version.
+        The returned `watermark` is to be passed as `since` on the next call.
+        """
+        # Annotations committed slightly after we started might carry earlier timestamps,
+        # so the next watermark overlaps with the current export a bit (exporting a batch twice is harmless).
+        watermark = timezone.now() - self.watermark_overlap
+
+        batches = self.__generic_batches()
+        if self.__config['include_batch_no']:
+            # the window function would number the changed batches only, so count all preceding batches instead
+            preceding = self.__generic_batches().filter(
+                dt_created__lte=OuterRef('dt_created')
+            ).order_by().annotate(n=Func(F('pk'), function='Count')).values('n')
+            batches = batches.annotate(index=Subquery(preceding))
+
+        if since is None:
+            return watermark, self.__export_batches(batches, include_uuid=True), iter([])
+
+        changed = Q(dt_created__gt=since) | Q(dt_updated__gt=since)
+        tombstones = Tombstone.objects.filter(project=self.__project, dt_deleted__gt=since)
+        changed_batches = Batch.objects.filter(
+            Q(pk__in=Label.objects.filter(changed, marker__project=self.__project).values('batch')) |
+            Q(pk__in=Input.objects.filter(changed, marker__project=self.__project).values('batch')) |
+            Q(pk__in=LabelRelation.objects.filter(changed, first_label__marker__project=self.__project).values('batch')) |
+            Q(uuid__in=tombstones.exclude(batch_uuid=None).values('batch_uuid')) |
+            (changed & (
+                Q(pk__in=Label.objects.filter(marker__project=self.__project).values('batch')) |
+                Q(pk__in=Input.objects.filter(marker__project=self.__project).values('batch'))
+            ))
+        ).values(root=Coalesce('revision_of', 'pk'))
+        batches = batches.filter(pk__in=changed_batches)
+
+        return watermark, self.__export_batches(batches, include_uuid=True), self.__tombstones(since, tombstones)
+
+    def __tombstones(self, since, tombstones):
+        for tombstone in tombstones.order_by('pk').iterator(chunk_size=self.chunk_size):
+            yield tombstone.to_json()
+
+        undone = {
+            'label': Label.objects.filter(marker__project=self.__project),
+            'relation': LabelRelation.objects.filter(first_label__marker__project=self.__project)
+        }
+        for name, qs in undone.items():
+            undone_items = qs.filter(undone=True, dt_updated__gt=since).values_list('pk', 'batch__uuid')
+            for pk, batch_uuid in undone_items.iterator(chunk_size=self.chunk_size):
+                yield {
+                    'type': name,
+                    'id': pk,
+                    'batch': str(batch_uuid) if batch_uuid else None,
+                    'reason': 'undone'
+                }
+
+        # batches that lost all of their annotations are gone for good
+        deleted_batches = tombstones.exclude(batch_uuid=None).exclude(
+            batch_uuid__in=Batch.objects.values('uuid')
+        ).values_list('batch_uuid', flat=True).distinct()
+        for batch_uuid in deleted_batches.iterator(chunk_size=self.chunk_size):
+            yield {
+                'type': 'batch',
+                'id': None,
+                'batch': str(batch_uuid),
+                'reason': 'deleted'
+            }
+
+    def fingerprint(self, export_format=None, compression=None):
+        """
+        Returns a hash of the export configuration (including the format and compression of the exported file)
+        and of the current state of the project's annotations.
+        The hash changes whenever an annotation is added, updated (e.g., undone) or deleted.
+        """
+        state = {
+            'task_type': self.__project.task_type,
+            'config': self.__config,
+            'config_version': self.__project.config_version,
+            'format': export_format,
+            'compression': compression
+        }
+        annotations = {
+            'label': Label.objects.filter(marker__project=self.__project),
+            'input': Input.objects.filter(marker__project=self.__project),
+            'relation': LabelRelation.objects.filter(first_label__marker__project=self.__project),
+        }
+        if self.__config['include_flags']:
+            annotations['log'] = DataAccessLog.objects.filter(project=self.__project)
 
-    def export(self):
+        for name, qs in annotations.items():
+            state[name] = qs.order_by().aggregate(n=Count('pk'), last_id=Max('pk'), last_update=Max('dt_updated'))
+        return hash_spec(state)
+
+    def stream(self):
         return getattr(self, "_export_{}".format(self.__project.task_type))()
 
+    def export(self):
+        return list(self.stream())
+
+
+def stream_json_lines(objects):
+    encoder = DjangoJSONEncoder()
+    for obj in objects:
+        yield encoder.encode(obj) + "\n"
+
+
+def stream_changes(watermark, batches, tombstones):
+    encoder = DjangoJSONEncoder()
+    yield '{{"watermark": {}, "data": ['.format(encoder.encode(watermark))
+    for i, obj in enumerate(batches):
+        yield ("," if i else "") + encoder.encode(obj)
+    yield '], "tombstones": ['
+    for i, obj in enumerate(tombstones):
+        yield ("," if i else "") + encoder.encode(obj)
+    yield ']}'
+
+
+def stream_json_array(objects):
+    # Produces the same document as the non-streaming export, i.e. {"data": [...]}
+    encoder = DjangoJSONEncoder()
+    yield '{"data": ['
+    for i, obj in enumerate(objects):
+        yield ("," if i else "") + encoder.encode(obj)
+    yield ']}'
+
+
+EXPORT_FORMATS = {
+    'json': ('json', stream_json_array),
+    'jsonl': ('jsonl', stream_json_lines)
+}
+
+EXPORT_COMPRESSIONS = ['gzip', 'zstd'] if zstandard else ['gzip']
+
+
+def open_compressed(path, compression):
+    if compression == 'zstd':
+        return zstandard.open(path, 'wt', encoding='utf-8')
+    return gzip.open(path, 'wt', encoding='utf-8')
+
+
+def export_extension(export_format, compression):
+    return "{}.{}".format(EXPORT_FORMATS[export_format][0], 'zst' if compression == 'zstd' else 'gz')
+
+
+def write_export(exporter, path, export_format='jsonl', compression='gzip', callback=None, every=1000):
+    """
+    Writes the output of `exporter` into a compressed file at `path`,
+    calling `callback` with the number of exported items every `every` items.
+    """
+    _, serialize = EXPORT_FORMATS[export_format]
+    N = 0
+
+    def counted(objects):
+        nonlocal N
+        for obj in objects:
+            yield obj
+            N += 1
+            if callback and N % every == 0:
+                callback(N)
+
+    with open_compressed(path, compression) as f:
+        for chunk in serialize(counted(exporter.stream())):
+            f.write(chunk)
+    return N
+
 
 class ProjectSettingsExporter:
     def __init__(self, proj):
@@ -10,7 +10,6 @@ import hashlib
 import requests
 
 
-# TODO: fix collisions sometimes
 def hash_text(text):
     m = hashlib.sha256()
     if isinstance(text, str):
@@ -20,17 +19,39 @@ def hash_text(text):
     return m.hexdigest()
 
 
-def retrieve_by_hash(key, model_cls, cache):
+def hash_cache_key(key_hash, model_cls, **filters):
+    # only primary keys make it into the key, since string representations of objects are neither unique
+    # nor safe to use as memcached keys (e.g. they might contain whitespace)
+    parts = [model_cls._meta.model_name]
+    parts.extend(str(getattr(v, 'pk', v)) for _, v in sorted(filters.items()))
+    parts.append(key_hash)
+    return "_".join(parts)
+
+
+def cache_by_hash(obj, cache, **filters):
+    """
+    Caches the primary key of `obj` to be found by `retrieve_by_hash` with the same filters
+    """
+    cache.set(hash_cache_key(obj.content_hash, type(obj), **filters), obj.pk, 600)
+
+
+def retrieve_by_hash(key, model_cls, cache, **filters):
+    """
+    Retrieves an object of `model_cls` (which should have an indexed `content_hash` field) with the content `key`,
+    trying the cache first. Any additional filters are passed as keyword arguments.
+    """
     key_hash = hash_text(key)
-    obj_id = cache.get(key_hash)
-    try:
-        if obj_id:
-            obj = model_cls.objects.get(pk=obj_id)
-        else:
-            obj = model_cls.objects.get(content=key)
-            cache.set(obj.content_hash, obj.pk, 600)
-    except model_cls.DoesNotExist:
-        obj = None
+    cache_key = hash_cache_key(key_hash, model_cls, **filters)
+    obj_id = cache.get(cache_key)
+    if obj_id:
+        # the cached object might have been changed or deleted since, so the filters are checked again
+        obj = model_cls.objects.filter(pk=obj_id, content_hash=key_hash, **filters).first()
+        if obj is not None:
+            return obj
+
+    obj = model_cls.objects.filter(content_hash=key_hash, **filters).order_by('pk').first()
+    if obj is not None:
+        cache.set(cache_key, obj.pk, 600)
     return obj
 
 
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from projects.models import Context
+
+
+class Command(BaseCommand):
+    help = 'Compute missing content hashes of Contexts in chunks and merge the duplicate Contexts (can be safely interrupted and re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Number of contexts processed per transaction")
+        parser.add_argument('--skip-merging', action='store_true', help="Only compute hashes, don't merge duplicates")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        bounds = Context.objects.filter(content_hash__isnull=True).aggregate(lo=Min('id'), hi=Max('id'))
+
+        updated = 0
+        if bounds['lo'] is not None:
+            for start in range(bounds['lo'], bounds['hi'] + 1, chunk_size):
+                # each chunk is committed separately, so an interrupted run resumes where it stopped
+                updated += Context.backfill_hashes(start, start + chunk_size)
+                self.stdout.write("Hashed contexts up to ID {} ({} in total)".format(
+                    min(start + chunk_size, bounds['hi'] + 1) - 1, updated
+                ))
+        self.stdout.write(self.style.SUCCESS(f'Computed hashes for {updated} Context object(s)'))
+
+        if not options['skip_merging']:
+            merged = 0
+            while True:
+                just_merged = Context.merge_duplicates(limit=chunk_size)
+                if not just_merged:
+                    break
+                merged += just_merged
+            if merged > 0:
+                self.stdout.write(self.style.SUCCESS(f'Merged {merged} duplicate Context object(s)'))
+            else:
+                self.stdout.write("No duplicate Contexts found!")
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from projects.models import Input
+
+
+class Command(BaseCommand):
+    help = 'Compute missing full-text search vectors of Inputs in chunks (can be safely interrupted and re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Number of inputs processed per transaction")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        bounds = Input.objects.filter(content_vector__isnull=True).aggregate(lo=Min('id'), hi=Max('id'))
+
+        updated = 0
+        if bounds['lo'] is not None:
+            for start in range(bounds['lo'], bounds['hi'] + 1, chunk_size):
+                # each chunk is committed separately, so an interrupted run resumes where it stopped
+                updated += Input.backfill_vectors(start, start + chunk_size)
+                self.stdout.write("Vectorized inputs up to ID {} ({} in total)".format(
+                    min(start + chunk_size, bounds['hi'] + 1) - 1, updated
+                ))
+        self.stdout.write(self.style.SUCCESS(f'Computed search vectors for {updated} Input object(s)'))
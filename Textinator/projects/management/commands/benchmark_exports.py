@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import time
+import uuid
+import datetime as dt
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import projects.models as Tm
+from projects.export import AnnotationExporter
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Export synthetic projects of growing sizes with every exporter, report the number of queries and wall time, '\
+           'and fail if the number of queries grows with the project size (all data is rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100],
+            help="Numbers of contexts in the synthetic projects")
+        parser.add_argument('--batches-per-context', type=int, default=3, help="Number of annotation batches per context")
+        parser.add_argument('--task-types', nargs='+', help="Task types to benchmark (all with an exporter by default)")
+
+    def handle(self, *args, **options):
+        task_types = options['task_types'] or [
+            t for t, _ in settings.TASK_TYPES if hasattr(AnnotationExporter, '_export_{}'.format(t))
+        ]
+        configs = {
+            'default': {},
+            'full': {'include_usernames': True, 'include_batch_no': True, 'include_flags': True}
+        }
+
+        results = {}
+        try:
+            with transaction.atomic():
+                for size in sorted(options['sizes']):
+                    project = self.create_project(size, options['batches_per_context'])
+                    for task_type in task_types:
+                        project.task_type = task_type
+                        for config_name, config in configs.items():
+                            exporter = AnnotationExporter(project, config=config)
+                            # a single chunk per export, so that the number of queries must not depend on the size
+                            exporter.chunk_size = 10 * size * options['batches_per_context']
+                            with CaptureQueriesContext(connection) as ctx:
+                                start = time.time()
+                                N = sum(1 for _ in exporter.stream())
+                                elapsed = time.time() - start
+                            results[(task_type, config_name, size)] = (len(ctx.captured_queries), N, elapsed)
+                            self.stdout.write("{:>8} {:>8} {:>6} contexts: {:>4} queries, {:>6} items, {:.3f}s".format(
+                                task_type, config_name, size, len(ctx.captured_queries), N, elapsed
+                            ))
+                raise Rollback
+        except Rollback:
+            pass
+
+        failed = []
+        for task_type in task_types:
+            for config_name in configs:
+                queries = {results[(task_type, config_name, size)][0] for size in options['sizes']}
+                if len(queries) > 1:
+                    failed.append("{} ({})".format(task_type, config_name))
+
+        if failed:
+            raise CommandError("The number of queries depends on the project size for: {}".format(", ".join(failed)))
+        self.stdout.write(self.style.SUCCESS('The number of queries is independent of the project size for all exporters'))
+
+    def create_project(self, size, batches_per_context):
+        suffix = uuid.uuid4().hex[:8]
+        user = Tm.User.objects.create(username='benchmark_{}'.format(suffix))
+        now = timezone.now()
+        project = Tm.Project.objects.create(
+            title='Benchmark {}'.format(suffix), task_type='generic', author=user,
+            dt_publish=now, dt_finish=now + dt.timedelta(days=1)
+        )
+        datasource = Tm.DataSource.objects.create(
+            name='Benchmark {}'.format(suffix), source_type='PlainText', owner=user,
+            spec='{"texts": []}', language='en', formatting='pt'
+        )
+
+        span, question = [
+            Tm.Marker.objects.create(name=name, name_en=name, code='{}_{}'.format(name[:3].upper(), suffix), color='#ff0000')
+            for name in ('Span', 'Question')
+        ]
+        span_variant = Tm.MarkerVariant.objects.create(project=project, marker=span, anno_type='m-span')
+        question_variant = Tm.MarkerVariant.objects.create(project=project, marker=question, anno_type='free-text')
+        relation = Tm.Relation.objects.create(name='Coref', name_en='Coref', direction='2')
+        rule = Tm.RelationVariant.objects.create(project=project, relation=relation)
+
+        contexts = Tm.Context.objects.bulk_create([
+            Tm.Context(
+                datasource=datasource, datapoint=i, dt_updated=now,
+                content="Synthetic text number {} used for benchmarking the exports".format(i)
+            ) for i in range(size)
+        ])
+        Tm.DataAccessLog.objects.bulk_create([
+            Tm.DataAccessLog(
+                user=user, project=project, datasource=datasource, datapoint=c.datapoint,
+                flags={'text_errors': {'benchmark': True}}, is_submitted=True, dt_updated=now
+            ) for c in contexts
+        ])
+
+        batches = Tm.Batch.objects.bulk_create([
+            Tm.Batch(uuid=uuid.uuid4(), user=user, dt_updated=now)
+            for _ in range(size * batches_per_context)
+        ])
+        # every context gets one revision of its first batch
+        revisions = Tm.Batch.objects.bulk_create([
+            Tm.Batch(uuid=uuid.uuid4(), user=user, revision_of=batches[i * batches_per_context], dt_updated=now)
+            for i in range(size)
+        ])
+
+        labels, inputs, pairs = [], [], []
+        for i, batch in enumerate(batches + revisions):
+            context = contexts[i // batches_per_context] if i < len(batches) else contexts[i - len(batches)]
+            first = Tm.Label(context=context, marker=span_variant, batch=batch, start=0, end=9, dt_updated=now)
+            second = Tm.Label(context=context, marker=span_variant, batch=batch, start=10, end=14, dt_updated=now)
+            labels.extend([first, second])
+            pairs.append((first, second, batch))
+            inputs.append(Tm.Input(
+                context=context, marker=question_variant, batch=batch, content="Question?", dt_updated=now
+            ))
+        Tm.Label.objects.bulk_create(labels)
+        Tm.Input.objects.bulk_create(inputs)
+        Tm.LabelRelation.objects.bulk_create([
+            Tm.LabelRelation(rule=rule, first_label=first, second_label=second, batch=batch, dt_updated=now)
+            for first, second, batch in pairs
+        ])
+        return project
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from projects.models import Project, StatsCounter
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the statistics counters (progress, submitted/skipped/delayed datapoints, annotation lengths) from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, nargs='+', help="IDs of the projects to rebuild (all by default)")
+
+    def handle(self, *args, **options):
+        projects = Project.objects.all().order_by('pk')
+        if options['project']:
+            projects = projects.filter(pk__in=options['project'])
+
+        N = 0
+        for project in projects.iterator():
+            # each project is rebuilt in a separate transaction
+            StatsCounter.rebuild(project)
+            N += 1
+            self.stdout.write("Rebuilt the counters of the project #{}".format(project.pk))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the statistics counters of {N} project(s)'))
@@ -9,6 +9,7 @@ from projects.models import Context, Project, Label, Input, DataSource
 
 class Command(BaseCommand):
     help = 'Recover datasource and datapoints to Contexts from access logs'
+    chunk_size = 100
 
     def add_arguments(self, parser):
         parser.add_argument('project', type=int, help="Project ID")
@@ -36,26 +37,26 @@ class Command(BaseCommand):
 
         for objects in object_groups:
             if objects.count() > 0:
-                cnt = 0
-                for obj in objects:
-                    found = False
-                    content = clean(obj.context.content)
-                    for ds_id, ds in enumerate(ds_inst):
-                        for dp_id in range(sizes[ds_id]):
-                            text = clean(ds[dp_id])
-
-                            if content in text or content == text:
-                                found = True
-                                cnt += 1
-                                obj.context.datasource = datasources[ds_id]
-                                obj.context.datapoint = dp_id
-                                obj.context.save()
-                                break
-                        if found:
+                pending = {obj.pk: (obj, clean(obj.context.content)) for obj in objects.select_related('context')}
+                total = len(pending)
+                # each datapoint is fetched once (in chunks) and matched against all contexts still to be fixed,
+                # which finds the same (first) datapoint for each context as trying the datapoints context by context
+                for ds_id, ds in enumerate(ds_inst):
+                    for start in range(0, sizes[ds_id], self.chunk_size):
+                        if not pending:
                             break
-
-                    if not found:
-                        print(content)
-                        print()
-
-                print("{} of {} contexts fixed".format(cnt, objects.count()))
+                        ids = list(range(start, min(start + self.chunk_size, sizes[ds_id])))
+                        for dp_id, text in zip(ids, ds.get_many(ids)):
+                            text = clean(text or '')
+                            for pk, (obj, content) in list(pending.items()):
+                                if content in text:
+                                    obj.context.datasource = datasources[ds_id]
+                                    obj.context.datapoint = dp_id
+                                    obj.context.save()
+                                    del pending[pk]
+
+                for obj, content in pending.values():
+                    print(content)
+                    print()
+
+                print("{} of {} contexts fixed".format(total - len(pending), total))
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from projects.models import DataSource
+from projects.tasks import reindex_datasource
+
+
+class Command(BaseCommand):
+    help = 'Re-vectorize the contexts (and their inputs) with an outdated search config or without search vectors '\
+           '(can be safely interrupted and re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasource', type=int, nargs='+', help="IDs of the data sources to re-index (all by default)")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Number of contexts processed per transaction")
+        parser.add_argument('--background', action='store_true', help="Schedule Celery tasks instead of re-indexing right away")
+
+    def handle(self, *args, **options):
+        datasources = DataSource.objects.all().order_by('pk')
+        if options['datasource']:
+            datasources = datasources.filter(pk__in=options['datasource'])
+
+        for ds in datasources:
+            if options['background']:
+                ds.schedule_search_reindex()
+                self.stdout.write("Scheduled re-indexing of the data source #{}".format(ds.pk))
+            else:
+                N = reindex_datasource(ds.pk, chunk_size=options['chunk_size'])
+                self.stdout.write("Re-indexed {} context(s) of the data source #{}".format(N or 0, ds.pk))
+        self.stdout.write(self.style.SUCCESS('Done'))
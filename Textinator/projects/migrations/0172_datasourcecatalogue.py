@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0171_alter_context_datapoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataSourceCatalogue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dt_created', models.DateTimeField(default=django.utils.timezone.now, help_text='Autofilled', null=True, verbose_name='Created at')),
+                ('dt_updated', models.DateTimeField(help_text='Autofilled', null=True, verbose_name='Updated at')),
+                ('size', models.PositiveIntegerField(default=0, help_text='Total number of datapoints', verbose_name='size')),
+                ('content_hash', models.CharField(help_text='Hash of the specification and the underlying files at the time of cataloguing', max_length=64, verbose_name='content hash')),
+                ('datasource', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='catalogue', to='projects.datasource', verbose_name='data source')),
+            ],
+            options={
+                'verbose_name': 'data source catalogue',
+                'verbose_name_plural': 'data source catalogues',
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogueEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datapoint', models.IntegerField(verbose_name='datapoint ID')),
+                ('source_name', models.CharField(max_length=255, verbose_name='source name')),
+                ('catalogue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='projects.datasourcecatalogue')),
+            ],
+            options={
+                'verbose_name': 'catalogue entry',
+                'verbose_name_plural': 'catalogue entries',
+                'unique_together': {('catalogue', 'datapoint')},
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 10:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('projects', '0172_datasourcecatalogue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatapointPool',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(blank=True, help_text='Hash of the data sources and their sizes at the time of filling the pool', max_length=64, verbose_name='signature')),
+                ('dt_filled', models.DateTimeField(blank=True, null=True, verbose_name='filled at')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='projects.project')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'datapoint pool',
+                'verbose_name_plural': 'datapoint pools',
+            },
+        ),
+        migrations.CreateModel(
+            name='PoolItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datapoint', models.IntegerField(verbose_name='datapoint ID')),
+                ('rank', models.FloatField(verbose_name='rank')),
+                ('datasource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='projects.datasource')),
+                ('pool', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='projects.datapointpool')),
+            ],
+            options={
+                'verbose_name': 'pool item',
+                'verbose_name_plural': 'pool items',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='datapointpool',
+            constraint=models.UniqueConstraint(fields=('project', 'user'), name='unique_user_pool'),
+        ),
+        migrations.AddConstraint(
+            model_name='datapointpool',
+            constraint=models.UniqueConstraint(condition=models.Q(('user', None)), fields=('project',), name='unique_shared_pool'),
+        ),
+        migrations.AddConstraint(
+            model_name='poolitem',
+            constraint=models.UniqueConstraint(fields=('pool', 'datasource', 'datapoint'), name='unique_pool_item'),
+        ),
+        migrations.AddIndex(
+            model_name='poolitem',
+            index=models.Index(fields=['pool', 'rank'], name='pool_item_rank_idx'),
+        ),
+    ]
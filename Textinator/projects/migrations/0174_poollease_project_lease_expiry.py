@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 10:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('projects', '0173_datapointpool'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='lease_expiry',
+            field=models.PositiveIntegerField(default=60, help_text='In minutes. Only applicable for disjoint annotation with random order (without replacement).\n        If the annotator neither submits, nor skips the datapoint within this time, it becomes available to others', verbose_name='for how long should a datapoint be reserved for an annotator?'),
+        ),
+        migrations.CreateModel(
+            name='PoolLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datapoint', models.IntegerField(verbose_name='datapoint ID')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='expires at')),
+                ('datasource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='projects.datasource')),
+                ('pool', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leases', to='projects.datapointpool')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'pool lease',
+                'verbose_name_plural': 'pool leases',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='poollease',
+            constraint=models.UniqueConstraint(fields=('pool', 'datasource', 'datapoint'), name='unique_pool_lease'),
+        ),
+    ]
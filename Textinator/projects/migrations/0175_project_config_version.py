@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0174_poollease_project_lease_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='config_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Autoincremented on any change of the marker or relation variants (used for invalidating caches)', verbose_name='version of the marker configuration'),
+        ),
+    ]
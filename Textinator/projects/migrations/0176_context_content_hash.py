@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0175_project_config_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='context',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='SHA-256 of the content (autofilled)', max_length=64, null=True, verbose_name='content hash'),
+        ),
+    ]
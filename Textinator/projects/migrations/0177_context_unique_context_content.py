@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 12:06
+
+from django.db import migrations, models
+
+
+def check_hashes_backfilled(apps, schema_editor):
+    # Hashing and merging every context here would rewrite the whole table in one transaction,
+    # so they are left to the chunked `backfill_context_hashes` command, which must be run
+    # after the previous migration and before this one
+    Context = apps.get_model('projects', 'Context')
+
+    unhashed = Context.objects.filter(content_hash__isnull=True).exists()
+    duplicated = Context.objects.filter(content_hash__isnull=False).values(
+        'datasource', 'datapoint', 'content_hash'
+    ).annotate(n=models.Count('id')).filter(n__gt=1).exists()
+
+    if unhashed or duplicated:
+        raise RuntimeError(
+            "Some contexts are {}. Run `python manage.py backfill_context_hashes` and migrate again.".format(
+                "not hashed yet" if unhashed else "duplicated"
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0176_context_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_hashes_backfilled, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='context',
+            constraint=models.UniqueConstraint(condition=models.Q(('content_hash__isnull', False)), fields=('datasource', 'datapoint', 'content_hash'), name='unique_context_content'),
+        ),
+    ]
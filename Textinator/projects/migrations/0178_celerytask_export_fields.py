@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0177_context_unique_context_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='celerytask',
+            name='config',
+            field=models.JSONField(blank=True, help_text='Parameters the task was started with', null=True, verbose_name='configuration'),
+        ),
+        migrations.AddField(
+            model_name='celerytask',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of the task parameters and the project state (used to reuse results)', max_length=64, null=True, verbose_name='fingerprint'),
+        ),
+        migrations.AddField(
+            model_name='celerytask',
+            name='progress',
+            field=models.PositiveIntegerField(default=0, help_text='The number of items processed so far (if reported by the task)', verbose_name='progress'),
+        ),
+        migrations.AddField(
+            model_name='celerytask',
+            name='result',
+            field=models.FileField(blank=True, help_text='A file produced by the task (if any)', null=True, upload_to='exports', verbose_name='result file'),
+        ),
+    ]
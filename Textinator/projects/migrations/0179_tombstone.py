@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 14:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0178_celerytask_export_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('label', 'label'), ('input', 'input'), ('relation', 'relation')], max_length=10, verbose_name='annotation type')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID of the deleted annotation')),
+                ('batch_uuid', models.UUIDField(blank=True, null=True, verbose_name='UUID of the annotation batch')),
+                ('dt_deleted', models.DateTimeField(default=django.utils.timezone.now, verbose_name='deleted at')),
+                ('project', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='projects.project')),
+            ],
+            options={
+                'verbose_name': 'tombstone',
+                'verbose_name_plural': 'tombstones',
+                'indexes': [models.Index(fields=['project', 'dt_deleted'], name='tombstone_project_dt_idx')],
+            },
+        ),
+    ]
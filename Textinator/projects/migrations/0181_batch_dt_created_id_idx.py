@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0180_statscounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='batch',
+            index=models.Index(models.OrderBy(models.F('dt_created'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='batch_dt_created_id_idx'),
+        ),
+    ]
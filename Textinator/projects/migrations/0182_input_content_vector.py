@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 16:48
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0181_batch_dt_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='input',
+            name='content_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='input',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['content_vector'], name='projects_in_content_08ac94_gin'),
+        ),
+        # the search config is taken from the context (i.e. its data source), which `tsvector_update_trigger_column`
+        # can't do, since the config is stored in another table.
+        # Existing inputs are vectorized by the `backfill_input_vectors` management command.
+        migrations.RunSQL(
+            sql='''
+              CREATE OR REPLACE FUNCTION projects_input_content_vector_update() RETURNS trigger AS $$
+              BEGIN
+                NEW.content_vector := to_tsvector(
+                  COALESCE((SELECT c.search_config FROM projects_context c WHERE c.id = NEW.context_id), 'english'::regconfig),
+                  COALESCE(NEW.content, '')
+                );
+                RETURN NEW;
+              END
+              $$ LANGUAGE plpgsql;
+
+              DROP TRIGGER IF EXISTS projects_input_content_vector_trigger
+              ON projects_input;
+
+              CREATE TRIGGER projects_input_content_vector_trigger
+              BEFORE INSERT OR UPDATE OF content, context_id
+              ON projects_input
+              FOR EACH ROW EXECUTE PROCEDURE
+              projects_input_content_vector_update();
+            ''',
+
+            reverse_sql = '''
+              DROP TRIGGER IF EXISTS projects_input_content_vector_trigger
+              ON projects_input;
+
+              DROP FUNCTION IF EXISTS projects_input_content_vector_update();
+            '''
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 17:20
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0182_input_content_vector'),
+    ]
+
+    operations = [
+        # requires the privilege to create extensions (or pg_trgm being installed by the DB administrator beforehand)
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='context',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['content'], name='context_content_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='input',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['content'], name='input_content_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
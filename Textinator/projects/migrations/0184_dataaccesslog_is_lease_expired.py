@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0183_content_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataaccesslog',
+            name='is_lease_expired',
+            field=models.BooleanField(default=False, help_text="Indicates whether the datapoint was returned to the pool, because the annotator's lease on it expired", verbose_name='is lease expired?'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0184_dataaccesslog_is_lease_expired'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datapointpool',
+            name='sizes',
+            field=models.JSONField(blank=True, default=dict, help_text='Sizes of the data sources at the time of filling the pool (by data source ID)', verbose_name='sizes'),
+        ),
+    ]
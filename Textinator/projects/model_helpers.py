@@ -11,7 +11,11 @@ class DatapointInfo:
     def __init__(self, dp_id=None, text=None, ds=None, ds_def=None, proj_id=None, is_empty=False, no_data=False, is_dialogue=False, is_delayed=False, is_interactive=False):
         self.id = dp_id
         self.text = text if text is None else text.replace("\r\n", "\n")
-        if ds:
+        catalogue = ds_def.get_catalogue() if ds_def else None
+        if catalogue:
+            self.source_size = catalogue.size
+            self.source_name = catalogue.source_name(self.id)
+        elif ds:
             self.source_size = ds.size()
             self.source_name = ds.get_source_name(self.id)
         else:
@@ -31,6 +35,24 @@ class DatapointInfo:
         self.project_id = proj_id
         self.is_delayed = is_delayed
         self.is_interactive = is_interactive
+        self.rendered_text = None
+
+    @classmethod
+    def from_json(cls, data, ds_def=None):
+        """
+        Restores the instance from the output of `to_json` extended with `text` and, optionally, `rendered_text`
+        (i.e. the text with premarkers applied), without instantiating the data source.
+        """
+        dp_info = cls(dp_id=data['id'], text=data.get('text'), proj_id=data['project_id'],
+                      is_delayed=data['is_delayed'], is_interactive=data['is_interactive'])
+        dp_info.source_size = data['source_size']
+        dp_info.source_name = data['source_name']
+        if ds_def:
+            dp_info.source_id = ds_def.pk
+            dp_info.source_formatting = ds_def.formatting
+            dp_info.source_spec = json.loads(ds_def.spec) if ds_def.spec else None
+        dp_info.rendered_text = data.get('rendered_text')
+        return dp_info
 
     def to_json(self):
         return {
@@ -5,19 +5,22 @@ import time
 import logging
 import json
 import hashlib
-from collections import defaultdict
+import datetime as dt
+import threading
+from collections import defaultdict, Counter
 from itertools import groupby
 from operator import itemgetter
 
-from django.db import models, transaction
+from django.db import models, transaction, connection, IntegrityError
 from django.db.models.sql.where import ExtraWhere, AND
+from django.db.models.functions import Coalesce, Concat, Substr
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.cache import caches
-from django.contrib.postgres.search import SearchVectorField, SearchVector
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.postgres.indexes import GinIndex
 
 from filebrowser.fields import FileBrowseField
@@ -28,6 +31,7 @@ from model_clone.utils import create_copy_of_instance
 from Textinator.ext import RegConfigField
 
 from .datasources import *
+from .datasource_helpers import source_cache, hash_spec
 from .helpers import *
 from .model_helpers import *
 
@@ -153,24 +157,123 @@ class DataSource(CommonModel):
                 text = globals().get(method.helper, lambda x: x)(text)
         return text
 
-    def _load(self):
+    def _load(self, username=None):
+        """
+        Instantiates the data source of the specified type (or reuses the instance cached by this process).
+
+        Args:
+            username (str, optional): the user whose data directories should be searched (the owner's by default)
+
+        Returns:
+            AbstractDataSource: an instance of the data source or None if the source type can't be instantiated
+        """
+        source_cls, spec = self._resolve(username)
+        if source_cls is None:
+            return None
+        return source_cache.get(self.pk, spec, source_cls)
+
+    def _resolve(self, username=None):
         source_cls = DataSource.type2class(self.source_type)
-        if self.owner:
-            spec = json.loads(self.spec.replace('\r\n', ' ').replace('\n', ' '))
-            spec['username'] = self.owner.username
-            ds_instance = source_cls(spec)
-        else:
-            ds_instance = source_cls(self.spec.replace('\r\n', ' ').replace('\n', ' '))
-        return ds_instance
+        spec = json.loads(self.spec.replace('\r\n', ' ').replace('\n', ' '))
+        if username is None and self.owner_id:
+            username = self.owner.username
+        if username:
+            spec['username'] = username
+        return source_cls, spec
+
+    def content_hash(self):
+        """
+        Walks the underlying files, so it should be used only in background tasks.
+
+        Returns:
+            str: A hash of the specification and the state of the underlying files (computed without reading them)
+        """
+        source_cls, spec = self._resolve()
+        return hash_spec({
+            'spec': spec,
+            'fingerprint': source_cls.fingerprint(spec) if source_cls else None
+        })
+
+    @property
+    def has_catalogue(self):
+        # Texts API can change its data behind our back, so it's never catalogued
+        return not self.is_interactive and self.source_type != 'TextsAPI'
+
+    def get_catalogue(self):
+        """
+        Returns the stored catalogue as is, without touching the underlying files. Whether it's up-to-date
+        is checked by `refresh_datasource_catalogue`, which is scheduled at most once every
+        `settings.CATALOGUE_CHECK_INTERVAL` seconds.
+
+        Returns:
+            DataSourceCatalogue: The materialized catalogue of this data source if there is one, otherwise None
+                                 (in which case building the catalogue is scheduled)
+        """
+        if not self.has_catalogue:
+            return None
+
+        try:
+            catalogue = self.catalogue
+        except DataSourceCatalogue.DoesNotExist:
+            self.schedule_catalogue_refresh()
+            return None
+
+        if caches['default'].add('catalogue_check_{}'.format(self.pk), 1, settings.CATALOGUE_CHECK_INTERVAL):
+            self.schedule_catalogue_refresh()
+        return catalogue
+
+    def schedule_catalogue_refresh(self):
+        if not self.has_catalogue:
+            return
+
+        # ensures the refresh is scheduled only once in a while
+        if caches['default'].add('catalogue_refresh_{}'.format(self.pk), 1, 300):
+            from .tasks import refresh_datasource_catalogue
+            try:
+                refresh_datasource_catalogue.delay(self.pk)
+            except Exception as e:
+                caches['default'].delete('catalogue_refresh_{}'.format(self.pk))
+                logger.error("Could not schedule a catalogue refresh for data source {}: {}".format(self.pk, e))
+
+    def schedule_search_reindex(self):
+        # ensures the re-indexing is scheduled only once in a while
+        if caches['default'].add('search_reindex_lock_{}'.format(self.pk), 1, 300):
+            from .tasks import reindex_datasource
+            try:
+                reindex_datasource.delay(self.pk)
+            except Exception as e:
+                caches['default'].delete('search_reindex_lock_{}'.format(self.pk))
+                logger.error("Could not schedule re-indexing for data source {}: {}".format(self.pk, e))
+
+    def search_reindex_progress(self):
+        """
+        Returns the progress of the latest re-indexing, e.g. {'config': ..., 'done': 100, 'total': 1000, 'finished': False},
+        or None if nothing was re-indexed recently
+        """
+        return caches['default'].get('search_reindex_{}'.format(self.pk))
 
     def get(self, idx):
         ds_instance = self._load()
         return ds_instance[idx]
 
+    def get_many(self, ids):
+        ds_instance = self._load()
+        return ds_instance.get_many(ids)
+
     def size(self):
+        catalogue = self.get_catalogue()
+        if catalogue is not None:
+            return catalogue.size
         ds_instance = self._load()
         return ds_instance.size()
 
+    def get_source_name(self, dp_id):
+        catalogue = self.get_catalogue()
+        if catalogue is not None:
+            return catalogue.source_name(dp_id)
+        ds_instance = self._load()
+        return ds_instance.get_source_name(dp_id)
+
     def __str__(self):
         return "{} ({})".format(self.name, self.language)
 
@@ -179,6 +282,53 @@ class DataSource(CommonModel):
         return self.source_type == DataSource.INTERACTIVE
 
 
+class DataSourceCatalogue(CommonModel):
+    """
+    Holds a materialized summary of a `DataSource`: the total number of datapoints and the source name
+    of each datapoint (stored as `CatalogueEntry`), so that counting or naming the datapoints does not
+    require instantiating the data source.
+
+    `content_hash` is the hash of the specification and the state of the underlying files at the time
+    the catalogue was built. If it doesn't match the current one, the catalogue is considered stale and
+    is refreshed in the background.
+    """
+    class Meta:
+        verbose_name = _('data source catalogue')
+        verbose_name_plural = _('data source catalogues')
+
+    datasource = models.OneToOneField(DataSource, on_delete=models.CASCADE, related_name='catalogue',
+        verbose_name=_("data source"))
+    size = models.PositiveIntegerField(_("size"), default=0,
+        help_text=_("Total number of datapoints"))
+    content_hash = models.CharField(_("content hash"), max_length=64,
+        help_text=_("Hash of the specification and the underlying files at the time of cataloguing"))
+
+    def source_name(self, dp_id):
+        try:
+            dp_id = int(dp_id)
+        except (TypeError, ValueError):
+            return None
+        # datapoints without a source name (e.g., of plain texts) are stored with an empty one
+        return self.entries.filter(datapoint=dp_id).values_list('source_name', flat=True).first() or None
+
+    def __str__(self):
+        return str(self.datasource)
+
+
+class CatalogueEntry(models.Model):
+    """
+    Holds the source name (e.g., a file name) of a single datapoint of a catalogued `DataSource`
+    """
+    class Meta:
+        verbose_name = _('catalogue entry')
+        verbose_name_plural = _('catalogue entries')
+        unique_together = (('catalogue', 'datapoint'),)
+
+    catalogue = models.ForeignKey(DataSourceCatalogue, on_delete=models.CASCADE, related_name='entries')
+    datapoint = models.IntegerField(_("datapoint ID"))
+    source_name = models.CharField(_("source name"), max_length=255)
+
+
 class MarkerAction(CommonModel):
     """
     Specifies an action that shows up after right-clicking the marker.
@@ -408,6 +558,9 @@ class Project(CloneMixin, CommonModel):
         ]
     )
     disjoint_annotation = models.BooleanField(_("should each annotator work with their own part of data?"), default=False)
+    lease_expiry = models.PositiveIntegerField(_("for how long should a datapoint be reserved for an annotator?"), default=60,
+        help_text=_("""In minutes. Only applicable for disjoint annotation with random order (without replacement).
+        If the annotator neither submits, nor skips the datapoint within this time, it becomes available to others"""))
     show_datasource_identifiers = models.BooleanField(_("should data source identifiers be shown?"), default=False)
     task_type = models.CharField(_("type of the annotation task"), max_length=10, choices=settings.TASK_TYPES)
     dt_publish = models.DateTimeField(verbose_name=_("publishing date"))
@@ -454,11 +607,21 @@ class Project(CloneMixin, CommonModel):
         By default editing happens directly in the annotated objects. If this setting is turned on,
         the original objects will remain intact and separate reivison objects will be created"""))
     allow_reviewing = models.BooleanField(_("should peer reviewing be enabled?"), default=False)
+    config_version = models.PositiveIntegerField(_("version of the marker configuration"), default=0, editable=False,
+        help_text=_("Autoincremented on any change of the marker or relation variants (used for invalidating caches)"))
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._original_task_type = self.task_type
 
+    def save(self, *args, **kwargs):
+        if self.pk:
+            # the version is bumped only by signals, so don't overwrite it with a possibly outdated value
+            self.config_version = Project.objects.filter(pk=self.pk).values_list(
+                'config_version', flat=True
+            ).first() or self.config_version
+        super(Project, self).save(*args, **kwargs)
+
     def is_sampled(self, replacement='*'):
         """
         Check if the data order is randomly sampled
@@ -536,12 +699,9 @@ class Project(CloneMixin, CommonModel):
 
     def get_dp_from_log(self, log):
         ds_def = log.datasource
-        source_cls = DataSource.type2class(ds_def.source_type)
-        spec = json.loads(ds_def.spec.replace('\r\n', ' ').replace('\n', ' '))
-        spec['username'] = ds_def.owner.username if ds_def.owner else ""
-        ds_instance = source_cls(spec)
+        ds_instance = ds_def._load()
         dp_id = log.datapoint
-        if ds_instance[dp_id] is not None:
+        if ds_instance is not None and ds_instance[dp_id] is not None:
             return DatapointInfo(
                 dp_id=dp_id,                                   # the point's id in the datasource
                 text=ds_def.postprocess(ds_instance[dp_id]),   # a post-processed random datapoint from the chosen dataset
@@ -552,11 +712,10 @@ class Project(CloneMixin, CommonModel):
             )
 
     def instantiate_source(self, datasource):
-        source_cls = DataSource.type2class(datasource.source_type)
-        if source_cls:
-            spec = json.loads(datasource.spec.replace('\r\n', ' ').replace('\n', ' '))
-            spec['username'] = self.author.username
-            ds_instance = source_cls(spec)
+        # the owner's data directories are searched (as for the catalogue) and the author's only for ownerless sources
+        username = None if datasource.owner_id or not self.author_id else self.author.username
+        ds_instance = datasource._load(username=username)
+        if ds_instance is not None:
             return {
                 'instance': ds_instance,
                 'postprocess': datasource.postprocess,
@@ -606,6 +765,8 @@ class Project(CloneMixin, CommonModel):
         - If the annotator has previously requested a datapoint, but neither did any annotation, nor requested a new one,
           show the very same datapoint again. Otherwise, proceed.
         - If the annotator did some annotation and the auto text switch is off, show the very same text again. Otherwise, proceed
+        - If the next datapoint was prefetched in the background (see `prefetch_data`) and is still valid, return it.
+          Otherwise, proceed.
         - If sampling with replacement is turned off, exclude the previously annotated data.
         - If disjoint annotation is turned on, then all previously annotated datapoints (by anyone) should be excluded,
           so that the sets of annotations for each annotator are disjoint.
@@ -619,7 +780,23 @@ class Project(CloneMixin, CommonModel):
         Returns:
             DatapointInfo: The instance holding the information about the datapoint to be annotated
         """
-        log = DataAccessLog.objects.filter(user=user, project=self, is_submitted=False, is_skipped=False, is_delayed=False).first()
+        dp_info = self.__resume_data(user, force_switch)
+        if dp_info: return dp_info
+
+        dp_info = self.pop_prefetched_data(user)
+        if dp_info: return dp_info
+
+        return self.draw_data(user)
+
+    def __resume_data(self, user, force_switch):
+        """
+        Returns:
+            DatapointInfo: The datapoint the annotator should continue working on (if any), otherwise None
+        """
+        log = DataAccessLog.objects.filter(
+            user=user, project=self, is_submitted=False, is_skipped=False, is_delayed=False,
+            is_deleted=False, is_lease_expired=False
+        ).first()
         log2 = DataAccessLog.objects.filter(user=user, project=self, is_submitted=True, is_skipped=False).order_by('-dt_updated').first()
 
         if log2 and not self.auto_text_switch and not force_switch:
@@ -640,7 +817,12 @@ class Project(CloneMixin, CommonModel):
             # Auto switching
             if log.datasource in self.datasources.all():
                 dp_info = self.get_dp_from_log(log)
-                if dp_info: return dp_info
+                if dp_info:
+                    if self.resume_lease(user, log.datasource_id, log.datapoint):
+                        return dp_info
+                    # someone else holds the datapoint now
+                    log.is_lease_expired = True
+                    log.save()
             else:
                 log.is_skipped = True
                 if not "data" in log.flags["errors"]:
@@ -648,6 +830,21 @@ class Project(CloneMixin, CommonModel):
                 log.flags["errors"]["data"].append("auto switching: invalid datasource")
                 log.save()
 
+        return None
+
+    def draw_data(self, user, reserve=False):
+        """
+        Chooses a new datapoint for the annotator, without taking into account the datapoint they might be working on.
+
+        Args:
+            user (User): Current user
+            reserve (bool, optional): whether the datapoint is drawn to be shown later (see `prefetch_data`),
+                                      in which case a datapoint taken from the pool is only reserved for the user
+                                      and goes back to the pool if not shown in time
+
+        Returns:
+            DatapointInfo: The instance holding the information about the datapoint to be annotated
+        """
         datasources = []
         for source in self.datasources.all():
             if source.is_interactive:
@@ -668,19 +865,33 @@ class Project(CloneMixin, CommonModel):
         data_exists = sum(sizes) > 0
 
         if data_exists:
-            if self.is_sampled():
-                dp_taboo = defaultdict(set)
-                if self.is_sampled(replacement=False):
-                    if self.disjoint_annotation:
-                        # TODO: check for race conditions here, could 2 annotators still get the same text?
-                        # meaning each user annotates whatever is not annotated
-                        logs = DataAccessLog.objects.filter(project=self).all()
+            if self.is_sampled(replacement=False):
+                # Each datapoint is drawn from the pool of the remaining ones, i.e. uniformly at random across
+                # all data sources, since all of them share the same pool
+                pool = DatapointPool.get_for(self, user)
+                pool_sizes = {ds['ds_pk']: size for ds, size in zip(datasources, sizes)}
+                pool.sync(pool_sizes)
+                item = pool.pop(user, reserve=settings.NEXT_DATAPOINT_CACHE_TIMEOUT if reserve else None)
+
+                if item is None:
+                    fetched = self.__fetch_saved_for_later(user)
+                    if fetched:
+                        return fetched
                     else:
-                        # meaning each user annotates all texts
-                        logs = DataAccessLog.objects.filter(project=self, user=user).all()
-                    for log in logs:
-                        dp_taboo[log.datasource.pk].add(log.datapoint)
+                        return DatapointInfo(is_empty=True, proj_id=self.pk)
+                else:
+                    idx, dp_id = item
+                    ds_ind = [ds['ds_pk'] for ds in datasources].index(idx)
+                    ds, postprocess, idx = self.__unpack_datasource(datasources, ds_ind)
 
+                    return DatapointInfo(
+                        dp_id=dp_id,                            # the point's id in the datasource
+                        text=postprocess(ds[dp_id]),            # a post-processed random datapoint from the chosen dataset
+                        ds=ds,                                  # instantiated DataSource of a specific type
+                        ds_def=DataSource.objects.get(pk=idx),  # DataSource id
+                        proj_id=self.pk
+                    )
+            elif self.is_sampled():
                 # TODO: introduce data source mixing strategies?
                 # TODO: choose a dataset with a prior inversely proportional to the number of datapoints in them?
 
@@ -695,46 +906,16 @@ class Project(CloneMixin, CommonModel):
                 ds_ind = self.__select_random_datasource(priors_cumsum)
                 ds, postprocess, idx = self.__unpack_datasource(datasources, ds_ind)
 
-                ds_ind_taboo, finished_all = set(), False
-                if len(dp_taboo[idx]) >= sizes[ds_ind]:
-                    # try to select a new datasource that is not finished yet
-                    while len(dp_taboo[idx]) >= sizes[ds_ind]:
-                        # means this datasource is done, add it to the taboo list
-                        ds_ind_taboo.add(ds_ind)
+                # get the id of the random datapoint and the datapoint itself
+                dp_id, dp = ds.get_random_datapoint()
 
-                        if len(ds_ind_taboo) >= nds:
-                            # means we're done
-                            finished_all = True
-                            break
-
-                        while ds_ind in ds_ind_taboo:
-                            ds_ind = self.__select_random_datasource(priors_cumsum)
-
-                        ds, postprocess, idx = self.__unpack_datasource(datasources, ds_ind)
-
-                if finished_all:
-                    fetched = self.__fetch_saved_for_later(user)
-                    if fetched:
-                        return fetched
-                    else:
-                        return DatapointInfo(is_empty=True, proj_id=self.pk)
-                else:
-                    # get the id of the random datapoint and the datapoint itself
-                    dp_id, dp = ds.get_random_datapoint()
-
-                    if idx in dp_taboo:
-                        # get a random DP that is not in taboo list
-                        # NOTE: we stringify all datapoint ids for taboo for the sake of generality
-                        while str(dp_id) in dp_taboo[idx]:
-                            dp_id, dp = ds.get_random_datapoint()
-
-                    return DatapointInfo(
-                        dp_id=dp_id,                            # the point's id in the datasource
-                        text=postprocess(dp),                   # a post-processed random datapoint from the chosen dataset
-                        ds=ds,                                  # instantiated DataSource of a specific type
-                        ds_def=DataSource.objects.get(pk=idx),  # DataSource id
-                        proj_id=self.pk
-                    )
+                return DatapointInfo(
+                    dp_id=dp_id,                            # the point's id in the datasource
+                    text=postprocess(dp),                   # a post-processed random datapoint from the chosen dataset
+                    ds=ds,                                  # instantiated DataSource of a specific type
+                    ds_def=DataSource.objects.get(pk=idx),  # DataSource id
+                    proj_id=self.pk
+                )
             else:
                 # means the order is not random
                 last_log = DataAccessLog.objects.filter(user=user, project=self).order_by('-datapoint').first()
@@ -796,6 +977,166 @@ class Project(CloneMixin, CommonModel):
         else:
             return DatapointInfo(no_data=True, proj_id=self.pk)
 
+    def taken_logs(self, user):
+        """
+        Returns:
+            QuerySet: The access logs of the datapoints that can't be given to the user anymore, when sampling
+                      without replacement. With disjoint annotation these are the datapoints taken by anyone
+                      (except for the ones skipped without submitting or saving for later, and the abandoned ones),
+                      otherwise the ones seen by the user.
+        """
+        if self.disjoint_annotation:
+            return DataAccessLog.objects.filter(project=self, is_lease_expired=False).exclude(
+                is_skipped=True, is_submitted=False, is_delayed=False
+            )
+        else:
+            return DataAccessLog.objects.filter(project=self, user=user)
+
+    def __shared_pool(self):
+        if self.is_sampled(replacement=False) and self.disjoint_annotation:
+            return DatapointPool.objects.filter(project=self, user=None).first()
+        return None
+
+    def return_to_pool(self, user, datasource, datapoint, save_for_later=False):
+        """
+        Releases the lease on a skipped datapoint and makes it available to other annotators again,
+        unless it's saved for later (only for disjoint annotation, since otherwise each annotator
+        has their own pool and skipped datapoints are not shown again).
+        """
+        pool = self.__shared_pool()
+        if pool:
+            with transaction.atomic():
+                pool.release(user, datasource.pk, datapoint)
+                if not save_for_later:
+                    pool.push(datasource.pk, datapoint)
+
+    def finish_lease(self, user, datasource, datapoint):
+        """
+        Releases the lease on a submitted datapoint and makes sure it's not in the pool anymore
+        (it could have been returned there if the lease expired before submitting).
+        """
+        pool = self.__shared_pool()
+        if pool:
+            with transaction.atomic():
+                pool.release(user, datasource.pk, datapoint)
+                pool.discard(datasource.pk, datapoint)
+
+    def renew_lease(self, user, ds_pk, datapoint, allow_expired=False):
+        pool = self.__shared_pool()
+        if pool:
+            return pool.renew(user, ds_pk, datapoint, allow_expired=allow_expired)
+        return False
+
+    def resume_lease(self, user, ds_pk, datapoint):
+        """
+        Returns:
+            bool: Whether the user may resume working on the datapoint (always, unless datapoints are leased)
+        """
+        if not (self.is_sampled(replacement=False) and self.disjoint_annotation):
+            return True
+        pool = self.__shared_pool()
+        if pool is None:
+            # nothing has been leased yet, the pool will skip the datapoints taken so far when it's filled
+            return True
+        return pool.resume(user, ds_pk, datapoint)
+
+    def __prefetch_key(self, user):
+        return 'next_dp_{}_{}'.format(self.pk, user.pk)
+
+    def schedule_prefetch(self, user):
+        """
+        Schedules preparing the next datapoint for the annotator in the background
+        (after the current transaction, if any, is committed), unless it's already prepared.
+        """
+        if caches['default'].get(self.__prefetch_key(user)) is not None:
+            return
+
+        def prefetch():
+            from .tasks import prefetch_next_datapoint
+            try:
+                prefetch_next_datapoint.delay(self.pk, user.pk)
+            except Exception as e:
+                logger.error("Could not schedule prefetching for project {}: {}".format(self.pk, e))
+
+        transaction.on_commit(prefetch)
+
+    def prefetch_data(self, user):
+        """
+        Draws the next datapoint for the annotator and stores it in the cache, ready to be rendered,
+        so that the next request for a new datapoint doesn't need to instantiate the data sources.
+        Only regular datapoints are prefetched, i.e. neither interactive, nor delayed, nor empty ones.
+        """
+        cache = caches['default']
+        key = self.__prefetch_key(user)
+        cache.delete(key)
+
+        dp_info = self.draw_data(user, reserve=True)
+        if dp_info.is_empty or dp_info.no_data or dp_info.is_delayed or dp_info.is_interactive:
+            return None
+
+        if not isinstance(dp_info.text, str):
+            self.__unreserve(user, dp_info)
+            return None
+
+        data = dp_info.to_json()
+        data['text'] = dp_info.text
+        data['rendered_text'] = apply_premarkers(self, dp_info.text)
+        try:
+            cache.set(key, data, settings.NEXT_DATAPOINT_CACHE_TIMEOUT)
+        except Exception as e:
+            # e.g., the text is too large for the cache
+            logger.warning("Could not cache the next datapoint for project {}: {}".format(self.pk, e))
+            self.__unreserve(user, dp_info)
+            return None
+        return data
+
+    def __unreserve(self, user, dp_info):
+        # puts a datapoint drawn by `prefetch_data`, but never cached, back to the pool right away
+        if self.is_sampled(replacement=False):
+            pool = DatapointPool.get_for(self, user)
+            with transaction.atomic():
+                pool.release(user, dp_info.source_id, dp_info.id)
+                pool.push(dp_info.source_id, dp_info.id)
+
+    def pop_prefetched_data(self, user):
+        """
+        Takes the datapoint prepared by `prefetch_data` from the cache (if any) and validates it,
+        i.e. checks that its data source still belongs to the project and the datapoint
+        can still be annotated by the user (taking `disjoint_annotation` into account).
+
+        Returns:
+            DatapointInfo: The prefetched datapoint if it's valid, otherwise None
+        """
+        cache = caches['default']
+        key = self.__prefetch_key(user)
+        data = cache.get(key)
+        if data is None:
+            return None
+        cache.delete(key)
+
+        try:
+            ds_def = self.datasources.get(pk=data['source_id'])
+        except DataSource.DoesNotExist:
+            return None
+
+        if self.is_sampled(replacement=False):
+            if self.disjoint_annotation:
+                if not self.renew_lease(user, ds_def.pk, data['id']):
+                    # the lease expired and the datapoint might have been given to someone else
+                    return None
+            elif not DatapointPool.get_for(self, user).release(user, ds_def.pk, data['id']):
+                # the reservation expired and the datapoint went back to the pool
+                return None
+            logs = self.taken_logs(user)
+        elif self.is_ordered():
+            logs = DataAccessLog.objects.filter(project=self, user=user)
+        else:
+            logs = DataAccessLog.objects.none()
+        if logs.filter(datasource=ds_def, datapoint=data['id']).exists():
+            return None
+
+        return DatapointInfo.from_json(data, ds_def=ds_def)
+
     def get_profile_for(self, user):
         try:
             return UserProfile.objects.get(project=self, user=user)
@@ -808,6 +1149,76 @@ class Project(CloneMixin, CommonModel):
     def shared_with(self, user):
         return user in self.collaborators.all()
 
+    def __batch_timings_sql(self, by_kind=True):
+        """
+        Returns the SQL (with its parameters) listing every annotation batch of the project with its annotator,
+        the time of its first label (or input), the number of labels (or inputs) and the time of the previous batch
+        of the same annotator. If `by_kind` is set, labels and inputs are timed separately (so a batch with both
+        is listed twice), otherwise each batch is listed once with all its labels and inputs.
+        """
+        sql = """
+            WITH items AS (
+                SELECT l.batch_id, 'label' AS kind, l.dt_created FROM {label} l
+                JOIN {variant} mv ON mv.id = l.marker_id
+                WHERE mv.project_id = %s AND NOT l.undone
+                UNION ALL
+                SELECT i.batch_id, 'input' AS kind, i.dt_created FROM {input} i
+                JOIN {variant} mv ON mv.id = i.marker_id
+                WHERE mv.project_id = %s
+            ), batches AS (
+                SELECT b.user_id, {kind} AS kind, MIN(items.dt_created) AS dt_first, COUNT(*) AS n_items
+                FROM items JOIN {batch} b ON b.id = items.batch_id
+                WHERE items.dt_created IS NOT NULL AND b.user_id IS NOT NULL
+                GROUP BY b.id, b.user_id, {kind}
+            )
+            SELECT user_id, dt_first, n_items, LAG(dt_first) OVER w AS dt_prev,
+                   EXTRACT(EPOCH FROM dt_first - LAG(dt_first) OVER w) AS seconds
+            FROM batches
+            WINDOW w AS (PARTITION BY user_id, kind ORDER BY dt_first)
+        """.format(
+            label=Label._meta.db_table, input=Input._meta.db_table,
+            variant=MarkerVariant._meta.db_table, batch=Batch._meta.db_table,
+            kind="items.kind" if by_kind else "''"
+        )
+        return sql, [self.pk, self.pk]
+
+    def timing_histogram(self, max_minutes=120):
+        """
+        Returns a list of triples (user ID, minutes, number of batches) binning the time between
+        consecutive batches of each annotator to whole minutes (zero and `max_minutes` or longer are excluded).
+        """
+        timings_sql, params = self.__batch_timings_sql()
+        sql = """
+            SELECT user_id, FLOOR(minutes)::int AS bucket, COUNT(*) FROM (
+                SELECT user_id, ROUND((seconds / 60)::numeric, 1) AS minutes FROM ({}) t
+            ) m
+            WHERE minutes > 0 AND minutes < %s
+            GROUP BY user_id, bucket
+        """.format(timings_sql)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [max_minutes])
+            return cursor.fetchall()
+
+    def time_report(self, max_hours=2):
+        """
+        Returns a list of quadruples (user ID, month, hours spent, number of annotated items) per annotator and month.
+        All items are counted, but the time between consecutive batches is counted only if both were submitted
+        on the same day, and only if it doesn't exceed `max_hours` (otherwise, the annotator is assumed to have had a break).
+        """
+        timings_sql, params = self.__batch_timings_sql(by_kind=False)
+        sql = """
+            SELECT user_id, to_char(dt_first, 'YYYY/FMMM') AS month,
+                   SUM(CASE WHEN dt_prev::date = dt_first::date AND hours <= %s THEN hours ELSE 0 END), SUM(n_items)
+            FROM (
+                SELECT user_id, dt_prev, dt_first, n_items, ROUND((seconds / 3600)::numeric, 2) AS hours FROM ({}) t
+            ) h
+            GROUP BY user_id, month
+            ORDER BY user_id, month
+        """.format(timings_sql)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [max_hours] + params)
+            return cursor.fetchall()
+
     @property
     def flags_config(self, ordered=True):
         # The structure is like this:
@@ -978,22 +1389,36 @@ class MarkerVariant(CloneMixin, CommonModel):
         return self.marker.name_en
 
     @property
-    @custom_or_default('marker', 'color')
+    def compiled(self):
+        """
+        Returns:
+            dict: The compiled metadata of this marker variant from `MarkerRegistry` (None if the variant is not saved yet)
+        """
+        if self.pk is None:
+            return None
+        return MarkerRegistry.lookup(self)
+
+    @property
     def color(self):
         """
         Returns:
            str : Custom color (if present) or a default fallback from a marker definition
         """
-        return self.custom_color
+        compiled = self.compiled
+        if compiled:
+            return compiled['color']
+        return self.custom_color or self.marker.color
 
     @property
-    @custom_or_default('marker', 'shortcut')
     def shortcut(self):
         """
         Returns:
            str : Custom hotkey (if present) or a default fallback from a marker definition
         """
-        return self.custom_shortcut
+        compiled = self.compiled
+        if compiled:
+            return compiled['shortcut']
+        return self.custom_shortcut or self.marker.shortcut
 
     @property
     @custom_or_default('marker', 'suggestion_endpoint')
@@ -1008,6 +1433,9 @@ class MarkerVariant(CloneMixin, CommonModel):
 
     @property
     def code(self):
+        compiled = self.compiled
+        if compiled:
+            return compiled['code']
         same_marker_pk = list(self.project.markervariant_set.filter(marker=self.marker).values_list('pk', flat=True))
         same_marker_pk.sort()
         return "{}_{}".format(self.marker.code, same_marker_pk.index(self.pk))
@@ -1053,6 +1481,10 @@ class MarkerVariant(CloneMixin, CommonModel):
             (str or list): Restrictions on the number of markers per submitted instance
 
         """
+        compiled = self.compiled
+        if compiled and stringify:
+            return compiled['restrictions']
+
         try:
             restrictions = list(MarkerRestriction.objects.filter(variant=self).all())
         except MarkerVariant.DoesNotExist:
@@ -1064,10 +1496,11 @@ class MarkerVariant(CloneMixin, CommonModel):
 
     def save(self, *args, **kwargs):
         if hasattr(self, 'marker'):
-            if self.color.lower() == self.marker.color.lower():
+            # NOTE: `color` and `shortcut` are not used here, since they reflect the saved state (via `MarkerRegistry`)
+            if (self.custom_color or self.marker.color).lower() == self.marker.color.lower():
                 self.custom_color = None
 
-            if self.shortcut == self.marker.shortcut:
+            if (self.custom_shortcut or self.marker.shortcut) == self.marker.shortcut:
                 self.custom_shortcut = None
 
             if self.suggestion_endpoint == self.marker.suggestion_endpoint:
@@ -1080,24 +1513,20 @@ class MarkerVariant(CloneMixin, CommonModel):
         Returns:
             int: The minimal number of markers of this kind per submitted instance
         """
-        for r in self.markerrestriction_set.all():
-            if r.kind == 'ge' or r.kind == 'eq':
-                return r.value
-            elif r.kind == 'gs':
-                return r.value + 1
-        return 1
+        compiled = self.compiled
+        if compiled:
+            return compiled['min']
+        return MarkerRestriction.lower_bound(self.markerrestriction_set.all())
 
     def max(self):
         """
         Returns:
             int: The maximal number of markers of this kind per submitted instance
         """
-        for r in self.markerrestriction_set.all():
-            if r.kind == 'le' or r.kind == 'eq':
-                return r.value
-            elif r.kind == 'ls':
-                return r.value - 1
-        return 1
+        compiled = self.compiled
+        if compiled:
+            return compiled['max']
+        return MarkerRestriction.upper_bound(self.markerrestriction_set.all())
 
     def __str__(self):
         return str(self.marker) + "<{}>".format(self.project.title)
@@ -1181,6 +1610,24 @@ class MarkerRestriction(CommonModel):
         # le2s -- less than or equals to 2, strict
         return self.kind + str(self.value) + ("i" if self.is_ignorable else "s")
 
+    @staticmethod
+    def lower_bound(restrictions):
+        for r in restrictions:
+            if r.kind == 'ge' or r.kind == 'eq':
+                return r.value
+            elif r.kind == 'gs':
+                return r.value + 1
+        return 1
+
+    @staticmethod
+    def upper_bound(restrictions):
+        for r in restrictions:
+            if r.kind == 'le' or r.kind == 'eq':
+                return r.value
+            elif r.kind == 'ls':
+                return r.value - 1
+        return 1
+
     @classmethod
     def from_string(cls, value):
         try:
@@ -1194,10 +1641,234 @@ class MarkerRestriction(CommonModel):
             return None
 
 
+class MarkerRegistry:
+    """
+    A compiled per-project registry of the marker variant metadata (codes, count restrictions, colors,
+    shortcuts and annotation types), so that rendering a page doesn't cost several queries per marker.
+
+    The registry is built with two queries and kept both in the process memory and in the shared cache,
+    keyed by `Project.config_version`, which is bumped whenever any `MarkerVariant`, `MarkerRestriction`,
+    `RelationVariant` or `Marker` of the project is saved or deleted.
+    """
+    __local = {}
+    __lock = threading.Lock()
+
+    @staticmethod
+    def __cache_key(project_pk, version):
+        return 'marker_registry_{}_{}'.format(project_pk, version)
+
+    @staticmethod
+    def __version_key(project_pk):
+        return 'marker_registry_version_{}'.format(project_pk)
+
+    @classmethod
+    def build(cls, project_pk):
+        restrictions = defaultdict(list)
+        for r in MarkerRestriction.objects.filter(variant__project_id=project_pk).order_by('pk'):
+            restrictions[r.variant_id].append(r)
+
+        variants = MarkerVariant.objects.filter(project_id=project_pk).select_related('marker').order_by('pk')
+        entries, counts = {}, defaultdict(int)
+        for mv in variants:
+            rs = restrictions[mv.pk]
+            entries[mv.pk] = {
+                # variants of the same marker are enumerated by their primary keys
+                'code': "{}_{}".format(mv.marker.code, counts[mv.marker_id]),
+                'min': MarkerRestriction.lower_bound(rs),
+                'max': MarkerRestriction.upper_bound(rs),
+                'restrictions': '&'.join([str(r) for r in rs]),
+                'color': mv.custom_color or mv.marker.color,
+                'shortcut': mv.custom_shortcut or mv.marker.shortcut,
+                'anno_type': mv.anno_type
+            }
+            counts[mv.marker_id] += 1
+        return entries
+
+    @classmethod
+    def version(cls, project_pk):
+        """
+        Returns:
+            int: The current `config_version` of the project, cached in the shared cache until the next bump
+        """
+        shared_cache = caches['default']
+        key = cls.__version_key(project_pk)
+        version = shared_cache.get(key)
+        if version is None:
+            version = Project.objects.filter(pk=project_pk).values_list('config_version', flat=True).first()
+            shared_cache.set(key, version, 3600)
+        return version
+
+    @classmethod
+    def get(cls, project):
+        """
+        Returns:
+            dict: A mapping from the primary keys of the marker variants of the project to their compiled metadata
+        """
+        return cls.__entries(project.pk, project.config_version)
+
+    @classmethod
+    def __entries(cls, project_pk, version):
+        with cls.__lock:
+            local = cls.__local.get(project_pk)
+        if local and local[0] == version:
+            return local[1]
+
+        shared_cache = caches['default']
+        key = cls.__cache_key(project_pk, version)
+        entries = shared_cache.get(key)
+        if entries is None:
+            entries = cls.build(project_pk)
+            shared_cache.set(key, entries, 86400)
+        cls.__store(project_pk, version, entries)
+        return entries
+
+    @classmethod
+    def __store(cls, project_pk, version, entries):
+        with cls.__lock:
+            cls.__local[project_pk] = (version, entries)
+
+    @classmethod
+    def lookup(cls, variant):
+        if MarkerVariant._meta.get_field('project').is_cached(variant):
+            version = variant.project.config_version
+        else:
+            # don't fetch the whole project for every variant
+            version = cls.version(variant.project_id)
+
+        entry = cls.__entries(variant.project_id, version).get(variant.pk)
+        if entry is None:
+            # the variant is newer than the registry (e.g., created during the same request)
+            entries = cls.build(variant.project_id)
+            caches['default'].set(cls.__cache_key(variant.project_id, version), entries, 86400)
+            cls.__store(variant.project_id, version, entries)
+            entry = entries.get(variant.pk)
+        return entry
+
+    @classmethod
+    def invalidate(cls, project_pk):
+        with cls.__lock:
+            cls.__local.pop(project_pk, None)
+        caches['default'].delete(cls.__version_key(project_pk))
+
+
+def bump_config_version(sender, **kwargs):
+    inst = kwargs['instance']
+    if inst is None:
+        return
+
+    if sender == MarkerRestriction:
+        project_ids = MarkerVariant.objects.filter(pk=inst.variant_id).values_list('project_id', flat=True)
+    elif sender == Marker:
+        project_ids = MarkerVariant.objects.filter(marker=inst).values_list('project_id', flat=True)
+    else:
+        project_ids = [inst.project_id]
+
+    project_ids = set(project_ids)
+    Project.objects.filter(pk__in=project_ids).update(config_version=models.F('config_version') + 1)
+    for pk in project_ids:
+        MarkerRegistry.invalidate(pk)
+
+    if sender in (MarkerVariant, RelationVariant) and sender._meta.get_field('project').is_cached(inst):
+        # keep the project instance held by the variant up-to-date
+        inst.project.config_version += 1
+
+
+class TokenCount(models.Func):
+    """
+    The number of whitespace-separated tokens in a text, i.e. `len(text.split())`, computed by PostgreSQL
+    """
+    template = r"COALESCE(array_length(regexp_split_to_array(NULLIF(regexp_replace(%(expressions)s, '^\s+|\s+$', '', 'g'), ''), '\s+'), 1), 0)"
+    output_field = models.IntegerField()
+
+
+def label_text_expression():
+    """
+    The database counterpart of `Label.text` to be used in annotations of `Label` querysets
+    """
+    return Coalesce(
+        Substr('context__content', models.F('start') + 1, models.F('end') - models.F('start')),
+        Concat('marker__marker__name', models.Value('<Text>'))
+    )
+
+
+def related_value(instance, field, path):
+    """
+    Returns the value at `path` (in the lookup notation, e.g. `marker__name`) of the object referenced by `field`,
+    reusing the cached object if there is one and querying only the value otherwise
+    (which is safe even while the referenced objects are being deleted)
+    """
+    fk = instance._meta.get_field(field)
+    if fk.is_cached(instance):
+        value = getattr(instance, field)
+        for attr in path.split('__'):
+            if value is None: break
+            value = getattr(value, attr)
+        return value
+    return fk.related_model.objects.filter(pk=getattr(instance, fk.attname)).values_list(path, flat=True).first()
+
+
+class StatsCounted:
+    """
+    A mixin for the models that contribute to `StatsCounter`s. The counters are updated in the same transaction
+    as the object is saved or deleted, based on the difference between the current state of the `stats_fields`
+    and the state they had when the object was loaded from the database.
+
+    Deleting a single object untracks it the same way, while the objects deleted in cascade or by deleting
+    a queryset are untracked by a few aggregate queries before the deletion (see `untrack_cascade`).
+
+    **NOTE**: bulk operations bypass `save`, so they must call `StatsCounter.track` explicitly.
+    """
+    stats_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(f in instance.__dict__ for f in cls.stats_fields):
+            instance._stats_state = instance.stats_state()
+        return instance
+
+    def stats_state(self):
+        return tuple(getattr(self, f) for f in self.stats_fields)
+
+    def counted_state(self):
+        """
+        The state the object is currently counted with (None if it is not counted)
+        """
+        return getattr(self, '_stats_state', None)
+
+    def stats_counters(self, state):
+        """
+        Returns the counters of the object in the given state as a dictionary
+        {(project ID, user ID, data source ID, counter name): value}
+        """
+        raise NotImplementedError
+
+    def stats_deltas(self, created=False):
+        old_state = None if created else self.counted_state()
+        new_state = self.stats_state()
+        deltas = Counter()
+        if old_state != new_state:
+            deltas.update(self.stats_counters(new_state))
+            deltas.subtract(self.stats_counters(old_state))
+        self._stats_state = new_state
+        return deltas
+
+    def save(self, *args, **kwargs):
+        # a copy of a loaded object with the primary key reset is also created anew
+        created = self._state.adding or self.pk is None
+        if not created and self.counted_state() is None:
+            # the counted state is unknown (e.g., the fields were deferred), so the counters can't be adjusted
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            StatsCounter.track([self], created=created)
+
+
 def get_default_flags_dict():
     return dict([('text_errors', dict()), ('errors', dict()), ('delayed', False)])
 
-class DataAccessLog(CommonModel):
+class DataAccessLog(StatsCounted, CommonModel):
     """
     Holds data access logs for each annotator per project. We keep track of:
 
@@ -1225,6 +1896,10 @@ class DataAccessLog(CommonModel):
         help_text=_("Indicates whether the datapoint for skipped and saved for later by an annotator"))
     is_deleted = models.BooleanField(_("is marked as deleted?"), default=False,
         help_text=_("Indicates whether the log was programmatically marked as deleted (can't be set manually)"))
+    is_lease_expired = models.BooleanField(_("is lease expired?"), default=False,
+        help_text=_("Indicates whether the datapoint was returned to the pool, because the annotator's lease on it expired"))
+
+    stats_fields = ('is_submitted', 'is_skipped', 'is_delayed')
 
     @property
     def text_errors(self):
@@ -1235,6 +1910,306 @@ class DataAccessLog(CommonModel):
         else:
             return terr
 
+    def stats_counters(self, state):
+        if state is None:
+            return {}
+        is_submitted, is_skipped, is_delayed = state
+        key = (self.project_id, self.user_id, self.datasource_id)
+        return {
+            key + ('submitted',): int(is_submitted),
+            key + ('skipped',): int(is_skipped and not is_submitted),
+            key + ('delayed',): int(is_delayed)
+        }
+
+
+class DatapointPool(models.Model):
+    """
+    Holds the datapoints that remain to be annotated in a project sampled without replacement.
+    With disjoint annotation there is a single pool per project (`user` is empty), otherwise each annotator
+    has their own pool. The remaining datapoints are stored as `PoolItem`, each with a random rank,
+    so that drawing a random datapoint costs the same regardless of how many datapoints remain.
+
+    The pool is updated whenever the set of data sources of the project or their sizes change,
+    which is tracked by `signature` (and `sizes`, so that only the difference needs to be applied).
+    """
+    class Meta:
+        verbose_name = _('datapoint pool')
+        verbose_name_plural = _('datapoint pools')
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'user'], name='unique_user_pool'),
+            models.UniqueConstraint(fields=['project'], condition=models.Q(user=None), name='unique_shared_pool')
+        ]
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    signature = models.CharField(_("signature"), max_length=64, blank=True,
+        help_text=_("Hash of the data sources and their sizes at the time of filling the pool"))
+    sizes = models.JSONField(_("sizes"), default=dict, blank=True,
+        help_text=_("Sizes of the data sources at the time of filling the pool (by data source ID)"))
+    dt_filled = models.DateTimeField(_("filled at"), null=True, blank=True)
+
+    @classmethod
+    def get_for(cls, project, user):
+        lookup = {'project': project, 'user': None if project.disjoint_annotation else user}
+        try:
+            with transaction.atomic():
+                pool, _ = cls.objects.get_or_create(**lookup)
+        except IntegrityError:
+            # a concurrent first draw has just created the pool
+            pool = cls.objects.get(**lookup)
+        return pool
+
+    def sync(self, sizes, force=False):
+        """
+        Brings the pool up-to-date, if the data sources or their sizes changed since the last time.
+        Only the difference is applied, i.e. the datapoints of the added sources (or beyond the previous size)
+        are added and those of the removed sources (or beyond the current size) are removed.
+
+        Args:
+            sizes (dict): mapping from the ids of data sources to their sizes
+            force (bool, optional): refill the pool from scratch even if nothing changed
+        """
+        signature = hash_spec(sorted(sizes.items()))
+        if signature == self.signature and not force:
+            return
+
+        with transaction.atomic():
+            pool = DatapointPool.objects.select_for_update().get(pk=self.pk)
+            if pool.signature != signature or (force and pool.dt_filled == self.dt_filled):
+                if force or (pool.signature and not pool.sizes):
+                    # a full refill (also for the pools filled before the sizes were stored)
+                    pool.items.all().delete()
+                    previous = {}
+                else:
+                    previous = {int(k): v for k, v in pool.sizes.items()}
+
+                for ds_pk in previous.keys() - sizes.keys():
+                    pool.items.filter(datasource_id=ds_pk).delete()
+                for ds_pk, size in sizes.items():
+                    old_size = previous.get(ds_pk, 0)
+                    if size > old_size:
+                        pool.add_range(ds_pk, old_size, size)
+                    elif size < old_size:
+                        pool.items.filter(datasource_id=ds_pk, datapoint__gte=size).delete()
+
+                pool.signature = signature
+                pool.sizes = {str(k): v for k, v in sizes.items()}
+                pool.dt_filled = timezone.now()
+                pool.save()
+            self.signature, self.sizes, self.dt_filled = pool.signature, pool.sizes, pool.dt_filled
+
+    def add_range(self, ds_pk, start, end):
+        """
+        Adds the datapoints with IDs from `start` (inclusive) to `end` (exclusive) of the data source to the pool
+        by a single query, skipping the ones that are already taken or leased
+        """
+        taken_sql, taken_params = self.project.taken_logs(self.user).filter(
+            datasource_id=ds_pk
+        ).values('datapoint').query.sql_with_params()
+        sql = """
+            INSERT INTO {item} (pool_id, datasource_id, datapoint, rank)
+            SELECT %s, %s, g, random() FROM generate_series(%s, %s) g
+            WHERE g NOT IN ({taken})
+              AND g NOT IN (
+                SELECT datapoint FROM {lease} WHERE pool_id = %s AND datasource_id = %s AND expires_at >= %s
+              )
+            ON CONFLICT DO NOTHING
+        """.format(item=PoolItem._meta.db_table, lease=PoolLease._meta.db_table, taken=taken_sql)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.pk, ds_pk, start, end - 1] + list(taken_params) + [self.pk, ds_pk, timezone.now()])
+
+    def pop(self, user=None, reserve=None):
+        """
+        Atomically removes a random datapoint from the pool.
+        Concurrent pops never return the same datapoint and don't wait for each other.
+
+        For the shared pool (i.e. disjoint annotation), the datapoint is leased to `user` for `lease_expiry` minutes
+        of the project. For an annotator's own pool, the datapoint is leased only if it's reserved for showing it
+        later, in which case the lease expires after `reserve` seconds. In both cases the expired leases
+        are returned to the pool beforehand.
+
+        Returns:
+            tuple: (data source id, datapoint id) or None if the pool is empty
+        """
+        is_shared = self.user_id is None and user is not None
+        if is_shared or self.user_id is not None:
+            with transaction.atomic():
+                self.reclaim_expired()
+                item = self.__pop()
+                if item is not None and (is_shared or reserve):
+                    if is_shared:
+                        expires_at = self.__lease_deadline()
+                    else:
+                        expires_at = timezone.now() + dt.timedelta(seconds=reserve)
+                    PoolLease.objects.update_or_create(
+                        pool=self, datasource_id=item[0], datapoint=item[1],
+                        defaults={'user': user if is_shared else self.user, 'expires_at': expires_at}
+                    )
+                return item
+        return self.__pop()
+
+    def __lease_deadline(self):
+        return timezone.now() + dt.timedelta(minutes=self.project.lease_expiry)
+
+    def reclaim_expired(self):
+        """
+        Returns the datapoints with expired leases to the pool and marks the lease of the corresponding access logs as expired,
+        so that the annotators who abandoned them don't resume them. Leases being reclaimed concurrently are skipped.
+
+        Returns:
+            int: The number of reclaimed datapoints
+        """
+        table = PoolLease._meta.db_table
+        sql = """
+            WITH expired AS (
+                SELECT id FROM {0}
+                WHERE pool_id = %s AND expires_at < %s
+                FOR UPDATE SKIP LOCKED
+            )
+            DELETE FROM {0} USING expired WHERE {0}.id = expired.id
+            RETURNING {0}.user_id, {0}.datasource_id, {0}.datapoint
+        """.format(table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.pk, timezone.now()])
+            expired = cursor.fetchall()
+
+        if expired:
+            PoolItem.objects.bulk_create([
+                PoolItem(pool=self, datasource_id=ds_pk, datapoint=dp_id, rank=random.random())
+                for _, ds_pk, dp_id in expired
+            ], ignore_conflicts=True)
+
+            abandoned = models.Q()
+            for user_id, ds_pk, dp_id in expired:
+                abandoned |= models.Q(user_id=user_id, datasource_id=ds_pk, datapoint=dp_id)
+            DataAccessLog.objects.filter(abandoned, project_id=self.project_id,
+                is_submitted=False, is_skipped=False, is_delayed=False).update(is_lease_expired=True)
+        return len(expired)
+
+    def renew(self, user, ds_pk, dp_id, allow_expired=False):
+        """
+        Extends the lease of the user on the datapoint, if the user still holds it.
+        With `allow_expired`, an expired lease is extended as well, unless it has been reclaimed already
+        (the update waits for a concurrent `reclaim_expired` holding the lease, so both can't succeed).
+
+        Returns:
+            bool: Whether the lease was renewed
+        """
+        leases = PoolLease.objects.filter(pool=self, user=user, datasource_id=ds_pk, datapoint=dp_id)
+        if not allow_expired:
+            leases = leases.filter(expires_at__gte=timezone.now())
+        return leases.update(expires_at=self.__lease_deadline()) > 0
+
+    def resume(self, user, ds_pk, dp_id):
+        """
+        Extends the (possibly expired, but not reclaimed) lease of the user on the datapoint. If nobody holds
+        the datapoint (e.g., it was taken before leasing was introduced), it's leased to the user instead
+        and taken out of the pool if it's there.
+
+        Returns:
+            bool: Whether the user holds the datapoint now
+        """
+        if self.renew(user, ds_pk, dp_id, allow_expired=True):
+            return True
+
+        try:
+            with transaction.atomic():
+                # deleting the item first waits for a concurrent pop of the same datapoint,
+                # whose lease then makes creating ours fail
+                self.discard(ds_pk, dp_id)
+                _, is_created = PoolLease.objects.get_or_create(
+                    pool=self, datasource_id=ds_pk, datapoint=dp_id,
+                    defaults={'user': user, 'expires_at': self.__lease_deadline()}
+                )
+                return is_created
+        except IntegrityError:
+            return False
+
+    def release(self, user, ds_pk, dp_id):
+        """
+        Returns:
+            bool: Whether the user held a lease on the datapoint
+        """
+        deleted, _ = PoolLease.objects.filter(pool=self, user=user, datasource_id=ds_pk, datapoint=dp_id).delete()
+        return deleted > 0
+
+    def __pop(self):
+        table = PoolItem._meta.db_table
+        sql = """
+            WITH picked AS (
+                SELECT id FROM {0}
+                WHERE pool_id = %s AND rank >= %s
+                ORDER BY rank LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            DELETE FROM {0} USING picked WHERE {0}.id = picked.id
+            RETURNING {0}.datasource_id, {0}.datapoint
+        """.format(table)
+
+        with connection.cursor() as cursor:
+            # if nothing is ranked above the random threshold, wrap around
+            for threshold in (random.random(), 0):
+                cursor.execute(sql, [self.pk, threshold])
+                row = cursor.fetchone()
+                if row:
+                    return row[0], row[1]
+        return None
+
+    def push(self, ds_pk, dp_id):
+        PoolItem.objects.bulk_create(
+            [PoolItem(pool=self, datasource_id=ds_pk, datapoint=dp_id, rank=random.random())],
+            ignore_conflicts=True
+        )
+
+    def discard(self, ds_pk, dp_id):
+        self.items.filter(datasource_id=ds_pk, datapoint=dp_id).delete()
+
+    def remaining(self):
+        return self.items.count()
+
+
+class PoolItem(models.Model):
+    """
+    Holds a single datapoint remaining in a `DatapointPool`
+    """
+    class Meta:
+        verbose_name = _('pool item')
+        verbose_name_plural = _('pool items')
+        constraints = [
+            models.UniqueConstraint(fields=['pool', 'datasource', 'datapoint'], name='unique_pool_item')
+        ]
+        indexes = [
+            models.Index(fields=['pool', 'rank'], name='pool_item_rank_idx')
+        ]
+
+    pool = models.ForeignKey(DatapointPool, on_delete=models.CASCADE, related_name='items')
+    datasource = models.ForeignKey(DataSource, on_delete=models.CASCADE)
+    datapoint = models.IntegerField(_("datapoint ID"))
+    rank = models.FloatField(_("rank"))
+
+
+class PoolLease(models.Model):
+    """
+    Holds a datapoint taken from a shared `DatapointPool` (i.e. with disjoint annotation) by an annotator
+    or reserved from an annotator's own pool by prefetching it (see `Project.prefetch_data`).
+    If the lease expires before the datapoint is submitted or skipped (or shown, if reserved), the datapoint
+    goes back to the pool.
+    """
+    class Meta:
+        verbose_name = _('pool lease')
+        verbose_name_plural = _('pool leases')
+        constraints = [
+            models.UniqueConstraint(fields=['pool', 'datasource', 'datapoint'], name='unique_pool_lease')
+        ]
+
+    pool = models.ForeignKey(DatapointPool, on_delete=models.CASCADE, related_name='leases')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    datasource = models.ForeignKey(DataSource, on_delete=models.CASCADE)
+    datapoint = models.IntegerField(_("datapoint ID"))
+    expires_at = models.DateTimeField(_("expires at"), db_index=True)
+
 
 # TODO: put constraints on the markers - only markers belonging to project or task_type can be put!
 # TODO: for one might want to mark pronouns 'det', 'den' iff they are really pronouns and not articles
@@ -1337,24 +2312,117 @@ class Context(CommonModel):
         verbose_name = _('context')
         verbose_name_plural = _('contexts')
         indexes = [
-            GinIndex(fields=['content_vector'])
+            GinIndex(fields=['content_vector']),
+            # for searching by fragments (ILIKE) and fuzzy search (requires pg_trgm)
+            GinIndex(fields=['content'], opclasses=['gin_trgm_ops'], name='context_content_trgm_idx')
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['datasource', 'datapoint', 'content_hash'],
+                condition=models.Q(content_hash__isnull=False), name='unique_context_content')
         ]
 
     datasource = models.ForeignKey(DataSource, on_delete=models.SET_NULL, null=True, blank=True)
     datapoint = models.IntegerField(_("datapoint ID"), null=True, blank=True,
         help_text=_("As stored in the original dataset"))
     content = models.TextField(_("content"))
+    content_hash = models.CharField(_("content hash"), max_length=64, null=True, blank=True, db_index=True,
+        editable=False, help_text=_("SHA-256 of the content (autofilled)"))
     content_vector = SearchVectorField(null=True)
     search_config = RegConfigField(_("PostgreSQL search config"), null=True, blank=True)
 
-    @property
-    def content_hash(self):
-        return hash_text(self.content)
+    # Computes the same value as `hash_text` on the database side
+    HASH_SQL = "encode(sha256(convert_to(content, 'UTF8')), 'hex')"
 
     def save(self, *args, **kwargs):
         self.search_config = self.datasource.search_config
+        self.content_hash = hash_text(self.content)
         super(Context, self).save(*args, **kwargs)
 
+    @classmethod
+    def backfill_hashes(cls, min_id, max_id):
+        """
+        Computes the missing content hashes for the contexts with IDs in [min_id, max_id)
+
+        Returns:
+            int: The number of updated contexts
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE {} SET content_hash = {} WHERE id >= %s AND id < %s AND content_hash IS NULL".format(
+                    cls._meta.db_table, cls.HASH_SQL
+                ), [min_id, max_id]
+            )
+            return cursor.rowcount
+
+    @classmethod
+    @transaction.atomic
+    def reindex_chunk(cls, ds_pk, search_config, after_id=0, limit=1000):
+        """
+        Re-vectorizes the next chunk of contexts of the data source (in the order of primary keys) that have
+        either a different search config or no search vector at all, along with the inputs for these contexts.
+        Since the processed contexts don't match anymore, an interrupted re-indexing can be resumed from the start.
+
+        Returns:
+            list: The IDs of the re-vectorized contexts
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE {table} SET search_config = %s::regconfig, content_vector = to_tsvector(%s::regconfig, COALESCE(content, ''))
+                WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE datasource_id = %s AND id > %s AND (search_config IS DISTINCT FROM %s::regconfig OR content_vector IS NULL)
+                    ORDER BY id LIMIT %s
+                ) RETURNING id
+            """.format(table=cls._meta.db_table), [search_config, search_config, ds_pk, after_id, search_config, limit])
+            ids = sorted(r[0] for r in cursor.fetchall())
+
+            if ids:
+                cursor.execute("""
+                    UPDATE {table} SET content_vector = to_tsvector(%s::regconfig, COALESCE(content, ''))
+                    WHERE context_id = ANY(%s)
+                """.format(table=Input._meta.db_table), [search_config, ids])
+        return ids
+
+    @classmethod
+    @transaction.atomic
+    def merge_duplicates(cls, limit=None):
+        """
+        Merges the contexts with the same data source, datapoint and content hash into the one created first,
+        i.e. re-points all inputs and labels to it and deletes the rest.
+
+        Args:
+            limit (int, optional): The maximal number of duplicates to merge (all of them, by default)
+
+        Returns:
+            int: The number of deleted duplicates
+        """
+        sql = """
+            SELECT id, keep_id FROM (
+                SELECT id, MIN(id) OVER (PARTITION BY datasource_id, datapoint, content_hash) AS keep_id
+                FROM {}
+                WHERE content_hash IS NOT NULL
+            ) t WHERE id <> keep_id ORDER BY id
+        """.format(cls._meta.db_table)
+        params = []
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            duplicates = cursor.fetchall()
+
+        if not duplicates:
+            return 0
+
+        keep = defaultdict(list)
+        for dup_id, keep_id in duplicates:
+            keep[keep_id].append(dup_id)
+        for keep_id, dup_ids in keep.items():
+            Input.objects.filter(context_id__in=dup_ids).update(context_id=keep_id)
+            Label.objects.filter(context_id__in=dup_ids).update(context_id=keep_id)
+        return cls.objects.filter(pk__in=[d for d, _ in duplicates]).delete()[1].get(cls._meta.label, 0)
+
     def __str__(self):
         return truncate(self.content)
 
@@ -1373,14 +2441,33 @@ def update_search_config(sender, **kwargs):
         ).first()
 
         if c is not None and c.search_config != inst.search_config:
-            Context.objects.filter(datasource=inst).update(
-                search_config=inst.search_config,
-                content_vector=SearchVector('content', config=inst.search_config)
-            )
+            # re-vectorizing a big data source takes long, so it's done in the background
+            transaction.on_commit(inst.schedule_search_reindex)
 
     
 models.signals.post_save.connect(update_search_config, sender=DataSource, dispatch_uid='project.models.update_search_config')
 
+def invalidate_source_cache(sender, **kwargs):
+    inst = kwargs['instance']
+    if inst is not None:
+        source_cache.invalidate(inst.pk)
+
+def refresh_catalogue(sender, **kwargs):
+    inst = kwargs['instance']
+    if inst is not None:
+        transaction.on_commit(inst.schedule_catalogue_refresh)
+
+models.signals.post_save.connect(refresh_catalogue, sender=DataSource, dispatch_uid='project.models.refresh_catalogue')
+
+models.signals.post_save.connect(invalidate_source_cache, sender=DataSource, dispatch_uid='project.models.invalidate_source_cache')
+models.signals.post_delete.connect(invalidate_source_cache, sender=DataSource, dispatch_uid='project.models.invalidate_source_cache_on_delete')
+
+for _sender in (MarkerVariant, MarkerRestriction, RelationVariant, Marker):
+    models.signals.post_save.connect(bump_config_version, sender=_sender,
+        dispatch_uid='project.models.bump_config_version_{}'.format(_sender.__name__.lower()))
+    models.signals.post_delete.connect(bump_config_version, sender=_sender,
+        dispatch_uid='project.models.bump_config_version_on_delete_{}'.format(_sender.__name__.lower()))
+
 class Batch(Revisable, CommonModel):
     """
     Each time an annotator submits any annotation(s), an annotation batch is created
@@ -1392,6 +2479,10 @@ class Batch(Revisable, CommonModel):
     class Meta:
         verbose_name = _("annotation batch")
         verbose_name_plural = _("annotation batches")
+        indexes = [
+            # keyset pagination of the editing board (newest first)
+            models.Index(models.F('dt_created').desc(nulls_last=True), models.F('id').desc(), name='batch_dt_created_id_idx')
+        ]
 
     uuid = models.UUIDField()
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
@@ -1466,7 +2557,7 @@ class Batch(Revisable, CommonModel):
         return "\n".join(total_changes).strip()
 
 
-class Input(Orderable, Revisable, CloneMixin, CommonModel):
+class Input(StatsCounted, Orderable, Revisable, CloneMixin, CommonModel):
     """
     Holds an **instantiation** of a `Marker` that does not require specifying the start-end boundaries
     of the text. This mostly concerns the cases when a user provides an input via HTML `<input>` tag.
@@ -1496,16 +2587,25 @@ class Input(Orderable, Revisable, CloneMixin, CommonModel):
     class Meta:
         verbose_name = _('input')
         verbose_name_plural = _('inputs')
+        indexes = [
+            GinIndex(fields=['content_vector']),
+            # for searching by fragments (ILIKE) and fuzzy search (requires pg_trgm)
+            GinIndex(fields=['content'], opclasses=['gin_trgm_ops'], name='input_content_trgm_idx')
+        ]
 
     _clone_m2o_or_o2m_fields = ['batch']
 
     content = models.TextField(_("content"))
+    # maintained by a database trigger using the search config of the context (see migration 0182)
+    content_vector = SearchVectorField(null=True, editable=False)
     marker = models.ForeignKey(MarkerVariant, on_delete=models.CASCADE, blank=True, null=True)
     context = models.ForeignKey(Context, on_delete=models.CASCADE, blank=True, null=True)
     batch = models.ForeignKey(Batch, on_delete=models.CASCADE, null=True)
     extra = models.JSONField(_("extra information"), null=True, blank=True,
         help_text=_("in a JSON format"))
 
+    stats_fields = ('content',)
+
     @property
     def hash(self):
         hash_gen = hashlib.sha256()
@@ -1518,9 +2618,48 @@ class Input(Orderable, Revisable, CloneMixin, CommonModel):
     def content_hash(self):
         return hash_text(self.content)
 
+    # Computes the same value as the database trigger maintaining `content_vector`
+    VECTOR_SQL = """to_tsvector(
+        COALESCE((SELECT c.search_config FROM projects_context c WHERE c.id = context_id), 'english'::regconfig),
+        COALESCE(content, '')
+    )"""
+
+    @classmethod
+    def backfill_vectors(cls, min_id, max_id):
+        """
+        Computes the missing search vectors of the inputs with IDs in [min_id, max_id)
+
+        Returns:
+            int: The number of updated inputs
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE {} SET content_vector = {} WHERE id >= %s AND id < %s AND content_vector IS NULL".format(
+                    cls._meta.db_table, cls.VECTOR_SQL
+                ), [min_id, max_id]
+            )
+            return cursor.rowcount
+
     def __str__(self):
         return truncate(self.content, 50)
 
+    def stats_counters(self, state):
+        if state is None or self.marker_id is None:
+            return {}
+        project_id = related_value(self, 'marker', 'project_id')
+        if project_id is None:
+            return {}
+        key = (
+            project_id,
+            related_value(self, 'batch', 'user_id') if self.batch_id else None,
+            related_value(self, 'context', 'datasource_id') if self.context_id else None
+        )
+        content, = state
+        return {
+            key + ('inputs:{}'.format(self.marker_id),): 1,
+            key + ('tokens:{}:{}'.format(self.marker_id, len((content or '').split())),): 1
+        }
+
     def to_minimal_json(self, dt_format=None, include_user=False, include_color=False, include_anno_type=False):
         res = super(Input, self).to_json(dt_format=dt_format)
         res['content'] = self.content
@@ -1546,7 +2685,7 @@ class Input(Orderable, Revisable, CloneMixin, CommonModel):
         return res
 
 
-class Label(Orderable, Revisable, CloneMixin, CommonModel):
+class Label(StatsCounted, Orderable, Revisable, CloneMixin, CommonModel):
     """
     Holds an **instantiation** of a `Marker` that requires specifying the start-end boundaries
     of the text or is **NOT** provided via HTML `<input>` tag.
@@ -1579,6 +2718,8 @@ class Label(Orderable, Revisable, CloneMixin, CommonModel):
         help_text=_("Indicates whether the annotator used 'Undo' button"))
     batch = models.ForeignKey(Batch, on_delete=models.CASCADE, null=True)
 
+    stats_fields = ('undone',)
+
     @property
     def hash(self):
         hash_gen = hashlib.sha256()
@@ -1638,6 +2779,34 @@ class Label(Orderable, Revisable, CloneMixin, CommonModel):
     def __str__(self):
         return self.text
 
+    def stats_counters(self, state):
+        # undone labels are not counted
+        if state is None or state[0] or self.marker_id is None:
+            return {}
+        project_id = related_value(self, 'marker', 'project_id')
+        if project_id is None:
+            return {}
+        key = (
+            project_id,
+            related_value(self, 'batch', 'user_id') if self.batch_id else None,
+            related_value(self, 'context', 'datasource_id')
+        )
+        # the same as `text`, but without loading the objects that are not cached
+        if self.start is not None and self.end is not None:
+            if Label._meta.get_field('context').is_cached(self):
+                text = (self.context.content if self.context else '')[self.start:self.end]
+            else:
+                # fetch only the span, since contexts can be long
+                text = Context.objects.filter(pk=self.context_id).values_list(
+                    Substr('content', self.start + 1, max(self.end - self.start, 0)), flat=True
+                ).first() or ''
+        else:
+            text = "{}<Text>".format(related_value(self, 'marker', 'marker__name'))
+        return {
+            key + ('labels:{}'.format(self.marker_id),): 1,
+            key + ('tokens:{}:{}'.format(self.marker_id, len(text.split())),): 1
+        }
+
 
 def delete_batch_if_empty(sender, **kwargs):
     try:
@@ -1722,6 +2891,311 @@ class LabelRelation(CommonModel):
         return res
 
 
+class Tombstone(models.Model):
+    """
+    Records the deletion of an annotation (`Label`, `Input` or `LabelRelation`), so that
+    incremental exports can tell downstream consumers what to remove.
+
+    **NOTE**: the project is referenced without a database constraint, since tombstones are
+    written while the project itself might be in the process of being deleted.
+    The tombstones of a deleted project are removed right after the project.
+    """
+    class Meta:
+        verbose_name = _('tombstone')
+        verbose_name_plural = _('tombstones')
+        indexes = [
+            models.Index(fields=['project', 'dt_deleted'], name='tombstone_project_dt_idx')
+        ]
+
+    MODELS = [
+        ('label', _('label')),
+        ('input', _('input')),
+        ('relation', _('relation'))
+    ]
+
+    project = models.ForeignKey(Project, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    model = models.CharField(_("annotation type"), max_length=10, choices=MODELS)
+    object_id = models.PositiveIntegerField(_("ID of the deleted annotation"))
+    batch_uuid = models.UUIDField(_("UUID of the annotation batch"), null=True, blank=True)
+    dt_deleted = models.DateTimeField(_("deleted at"), default=timezone.now)
+
+    def to_json(self, dt_format=None):
+        return {
+            'type': self.model,
+            'id': self.object_id,
+            'batch': str(self.batch_uuid) if self.batch_uuid else None,
+            'reason': 'deleted'
+        }
+
+
+def record_tombstone(sender, instance, **kwargs):
+    if sender == LabelRelation:
+        model = 'relation'
+        project_id = RelationVariant.objects.filter(pk=instance.rule_id).values_list('project_id', flat=True).first()
+    else:
+        model = 'label' if sender == Label else 'input'
+        project_id = MarkerVariant.objects.filter(pk=instance.marker_id).values_list('project_id', flat=True).first()
+
+    if project_id is None:
+        return
+
+    Tombstone.objects.create(
+        project_id=project_id,
+        model=model,
+        object_id=instance.pk,
+        batch_uuid=Batch.objects.filter(pk=instance.batch_id).values_list('uuid', flat=True).first()
+    )
+
+
+def clear_tombstones(sender, instance, **kwargs):
+    Tombstone.objects.filter(project_id=instance.pk).delete()
+
+for _sender in (Label, Input, LabelRelation):
+    models.signals.post_delete.connect(record_tombstone, sender=_sender,
+        dispatch_uid='project.models.record_tombstone_{}'.format(_sender.__name__.lower()))
+models.signals.post_delete.connect(clear_tombstones, sender=Project, dispatch_uid='project.models.clear_tombstones')
+
+
+class StatsCounter(models.Model):
+    """
+    Holds the statistics of a project per annotator and data source that are maintained incrementally
+    (see `StatsCounted`), so that dashboards and progress badges read a few rows instead of aggregating
+    all logs and annotations. The following counters (`name`) are kept:
+
+    - `submitted`, `skipped` and `delayed` -- the number of datapoints with the respective status
+    - `labels:<marker variant ID>` and `inputs:<marker variant ID>` -- the number of labels (not undone) and inputs
+    - `tokens:<marker variant ID>:<N>` -- the number of labels or inputs consisting of N tokens
+
+    The counters can be rebuilt from scratch using the `rebuild_stats_counters` management command.
+
+    **NOTE**: the related objects are referenced without database constraints, since the counters are updated
+    while the counted objects are deleted, which might be due to deleting the project, user or data source itself.
+    The counters of the deleted objects are removed right after them.
+    """
+    class Meta:
+        verbose_name = _('statistics counter')
+        verbose_name_plural = _('statistics counters')
+        constraints = [
+            models.UniqueConstraint(
+                'project', Coalesce('user', 0), Coalesce('datasource', 0), 'name', name='stats_counter_unique'
+            )
+        ]
+
+    project = models.ForeignKey(Project, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+')
+    datasource = models.ForeignKey(DataSource, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+')
+    name = models.CharField(_("name"), max_length=100)
+    value = models.BigIntegerField(_("value"), default=0)
+
+    @classmethod
+    def add(cls, deltas, batch_size=1000):
+        """
+        Adds the given deltas {(project ID, user ID, data source ID, counter name): delta} to the counters,
+        creating the missing ones. The rows are upserted in a fixed order, so that concurrent submissions
+        can't deadlock each other.
+        """
+        rows = sorted(
+            (k for k, v in deltas.items() if v),
+            key=lambda k: (k[0], k[1] or 0, k[2] or 0, k[3])
+        )
+        sql = """
+        INSERT INTO {table} (project_id, user_id, datasource_id, name, value) VALUES {values}
+        ON CONFLICT (project_id, (COALESCE(user_id, 0)), (COALESCE(datasource_id, 0)), name)
+        DO UPDATE SET value = {table}.value + EXCLUDED.value
+        """
+        with connection.cursor() as cursor:
+            for i in range(0, len(rows), batch_size):
+                chunk = rows[i:i + batch_size]
+                params = []
+                for key in chunk:
+                    params.extend(key)
+                    params.append(deltas[key])
+                cursor.execute(sql.format(
+                    table=cls._meta.db_table,
+                    values=", ".join(["(%s, %s, %s, %s, %s)"] * len(chunk))
+                ), params)
+
+    @classmethod
+    def track(cls, objects, created=False):
+        """
+        Adjusts the counters to the current state of the given `StatsCounted` objects
+        """
+        deltas = Counter()
+        for obj in objects:
+            deltas.update(obj.stats_deltas(created=created))
+        cls.add(deltas)
+
+    @classmethod
+    def untrack(cls, objects):
+        """
+        Removes the given (deleted) `StatsCounted` objects from the counters
+        """
+        deltas = Counter()
+        for obj in objects:
+            deltas.subtract(obj.stats_counters(obj.counted_state()))
+            obj._stats_state = None
+        cls.add(deltas)
+
+    @classmethod
+    def total(cls, project, **filters):
+        """
+        Returns the sum of the project's counters matching the filters, e.g., `name='submitted', user=user`
+        or `name__startswith='labels:'`
+        """
+        return cls.objects.filter(project=project, **filters).aggregate(
+            total=models.Sum('value'))['total'] or 0
+
+    @classmethod
+    def untrack_queryset(cls, queryset):
+        """
+        Removes the objects of the given queryset of `StatsCounted` objects (about to be deleted) from the counters,
+        using a single aggregate query instead of computing the counters object by object
+        """
+        deltas = Counter()
+        deltas.subtract(cls.count(queryset))
+        cls.add(deltas)
+
+    @classmethod
+    def count(cls, queryset):
+        """
+        Returns the counters the objects of the given queryset of `StatsCounted` objects contribute to,
+        aggregated by the database
+        """
+        deltas = Counter()
+        if queryset.model is DataAccessLog:
+            logs = queryset.order_by().values('project_id', 'user_id', 'datasource_id').annotate(
+                submitted=models.Count('pk', filter=models.Q(is_submitted=True)),
+                skipped=models.Count('pk', filter=models.Q(is_skipped=True, is_submitted=False)),
+                delayed=models.Count('pk', filter=models.Q(is_delayed=True))
+            )
+            for row in logs:
+                key = (row['project_id'], row['user_id'], row['datasource_id'])
+                for name in ('submitted', 'skipped', 'delayed'):
+                    deltas[key + (name,)] += row[name]
+            return deltas
+
+        if queryset.model is Label:
+            kind, items, text = 'labels', queryset.filter(undone=False), label_text_expression()
+        else:
+            kind, items, text = 'inputs', queryset, models.F('content')
+        bins = items.filter(marker__isnull=False).annotate(N_tokens=TokenCount(text)).order_by().values(
+            'marker__project_id', 'batch__user_id', 'context__datasource_id', 'marker_id', 'N_tokens'
+        ).annotate(count=models.Count('pk'))
+        for row in bins:
+            key = (row['marker__project_id'], row['batch__user_id'], row['context__datasource_id'])
+            deltas[key + ('{}:{}'.format(kind, row['marker_id']),)] += row['count']
+            deltas[key + ('tokens:{}:{}'.format(row['marker_id'], row['N_tokens']),)] += row['count']
+        return deltas
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls, project):
+        """
+        Recomputes all counters of the project from the logs and annotations
+        """
+        deltas = cls.count(DataAccessLog.objects.filter(project=project))
+        deltas.update(cls.count(Label.objects.filter(marker__project=project)))
+        deltas.update(cls.count(Input.objects.filter(marker__project=project)))
+
+        cls.objects.filter(project=project).delete()
+        cls.add(deltas)
+
+
+def with_revisions(model, pks):
+    """
+    Returns the given primary keys of a `Revisable` model together with those of all their (cascaded) revisions
+    """
+    pks, frontier = set(pks), set(pks)
+    while frontier:
+        frontier = set(model.objects.filter(revision_of__in=frontier).values_list('pk', flat=True)) - pks
+        pks |= frontier
+    return pks
+
+
+def cascaded_counted(model, pks):
+    """
+    Returns the querysets of `StatsCounted` objects deleted in cascade with the objects of `model` with the given pks
+    """
+    if model is DataAccessLog:
+        return [DataAccessLog.objects.filter(pk__in=pks)]
+    if model in (Label, Input):
+        return [model.objects.filter(pk__in=with_revisions(model, pks))]
+
+    lookup = {
+        Batch: 'batch__in',
+        MarkerVariant: 'marker__in',
+        Marker: 'marker__marker__in',
+        MarkerUnit: 'marker__unit__in',
+        Context: 'context__in'
+    }[model]
+    if model is Batch:
+        pks = with_revisions(Batch, pks)
+    return [
+        counted.objects.filter(pk__in=with_revisions(
+            counted, counted.objects.filter(**{lookup: pks}).values_list('pk', flat=True)
+        ))
+        for counted in (Label, Input)
+    ]
+
+
+# the counters of all objects related to these are removed altogether after deleting them
+STATS_CLEARED_BY = (Project, User, DataSource)
+STATS_CASCADE_ROOTS = (DataAccessLog, Label, Input, Batch, MarkerVariant, Marker, MarkerUnit, Context)
+
+
+def untrack_cascade(sender, instance, origin=None, **kwargs):
+    """
+    Removes the `StatsCounted` objects deleted along with the root of a deletion from the counters
+    by a few aggregate queries, before any of them is deleted. A single `StatsCounted` object deleted
+    on its own is untracked by `untrack_stats` instead (but its revisions are untracked here).
+    """
+    if origin is instance:
+        if sender is DataAccessLog:
+            return
+        pks = [instance.pk]
+    elif isinstance(origin, models.QuerySet) and origin.model is sender:
+        # pre_delete is sent for each object of the queryset, but all of them are handled at once
+        if getattr(origin, '_stats_untracked', False):
+            return
+        origin._stats_untracked = True
+        pks = list(origin.order_by().values_list('pk', flat=True))
+    else:
+        return
+
+    for qs in cascaded_counted(sender, pks):
+        if origin is instance and sender is qs.model:
+            qs = qs.exclude(pk=instance.pk)
+        StatsCounter.untrack_queryset(qs)
+
+
+def untrack_stats(sender, instance, origin=None, **kwargs):
+    handled = STATS_CASCADE_ROOTS + STATS_CLEARED_BY
+    if origin is not instance:
+        if isinstance(origin, handled):
+            return
+        if isinstance(origin, models.QuerySet) and issubclass(origin.model, handled):
+            return
+    # deleted on its own or in a way the aggregate untracking doesn't know about
+    StatsCounter.untrack([instance])
+
+
+def clear_stats_counters(sender, instance, **kwargs):
+    field = {Project: 'project_id', User: 'user_id', DataSource: 'datasource_id'}[sender]
+    StatsCounter.objects.filter(**{field: instance.pk}).delete()
+
+for _sender in STATS_CASCADE_ROOTS:
+    models.signals.pre_delete.connect(untrack_cascade, sender=_sender,
+        dispatch_uid='project.models.untrack_cascade_{}'.format(_sender.__name__.lower()))
+for _sender in (DataAccessLog, Label, Input):
+    models.signals.post_delete.connect(untrack_stats, sender=_sender,
+        dispatch_uid='project.models.untrack_stats_{}'.format(_sender.__name__.lower()))
+for _sender in (Project, User, DataSource):
+    models.signals.post_delete.connect(clear_stats_counters, sender=_sender,
+        dispatch_uid='project.models.clear_stats_counters_{}'.format(_sender.__name__.lower()))
+
+
 class UserProfile(CommonModel):
     """
     An M2M model binding `User` and `Project` and holding additional information
@@ -1747,3 +3221,11 @@ class CeleryTask(CommonModel):
     token = models.CharField(_("token"), max_length=36, help_text=_("Celery task ID"),
                              null=True, blank=True)
     finished = models.BooleanField(_("is finished?"), default=False)
+    progress = models.PositiveIntegerField(_("progress"), default=0,
+        help_text=_("The number of items processed so far (if reported by the task)"))
+    config = models.JSONField(_("configuration"), null=True, blank=True,
+        help_text=_("Parameters the task was started with"))
+    fingerprint = models.CharField(_("fingerprint"), max_length=64, null=True, blank=True, db_index=True,
+        help_text=_("Hash of the task parameters and the project state (used to reuse results)"))
+    result = models.FileField(_("result file"), upload_to='exports', null=True, blank=True,
+        help_text=_("A file produced by the task (if any)"))
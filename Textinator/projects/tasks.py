@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
-import bisect
-from collections import defaultdict, Counter
+import os
+import logging
+from collections import defaultdict
 
-from django.db.models import Count
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.core.cache import caches
 
 from celery import shared_task
 
 import projects.models as Tm
+import projects.export as Tex
+
+
+logger = logging.getLogger(__name__)
 
 
 def get_chartjs_datasets(providers, data):
@@ -18,33 +26,36 @@ def get_chartjs_datasets(providers, data):
         })
     return datasets
 
-def count_token_lengths(items, item_type):
-    prop = 'text' if item_type == 'label' else 'content'
+def count_token_lengths(project_pk, anno_types):
+    # only the histogram bins per marker variant are kept, see `Tm.StatsCounter`
+    bins = Tm.StatsCounter.objects.filter(
+        project_id=project_pk, name__startswith='tokens:'
+    ).values_list('name').annotate(total=Sum('value')).order_by()
+
     counts = defaultdict(lambda: defaultdict(int))
+    for name, total in bins:
+        _, mv, length = name.split(':')
+        counts[int(mv)][int(length)] += total
+
+    names = {
+        mv.pk: mv.name
+        for mv in Tm.MarkerVariant.objects.filter(pk__in=counts.keys(), anno_type__in=anno_types).select_related('marker')
+    }
+
+    res = defaultdict(lambda: defaultdict(int))
     lengths = set()
-    for item in items.all():
-        text = getattr(item, prop)
-        N_tokens = len(text.split())
-        counts[item.marker.marker.name][N_tokens] += 1
-        lengths.add(N_tokens)
-    return counts, lengths
+    for mv, mv_counts in counts.items():
+        if mv not in names: continue
+        for length, total in mv_counts.items():
+            if total <= 0: continue
+            res[names[mv]][length] += total
+            lengths.add(length)
+    return res, lengths
 
 @shared_task
 def get_label_lengths_stats(project_pk):
-    project = Tm.Project.objects.get(pk=project_pk)
-
-    labels = Tm.Label.objects.filter(
-            marker__project__id=project_pk,
-            marker__anno_type='m-span',
-            undone=False
-    )
-    inputs = Tm.Input.objects.filter(
-            marker__project__id=project_pk,
-            marker__anno_type__in=['free-text', 'lfree-text']
-    )
-
-    lab_counts, lab_lengths = count_token_lengths(labels, 'label')
-    inp_counts, inp_lengths = count_token_lengths(inputs, 'input')
+    lab_counts, lab_lengths = count_token_lengths(project_pk, ['m-span'])
+    inp_counts, inp_lengths = count_token_lengths(project_pk, ['free-text', 'lfree-text'])
     x_axis = sorted(lab_lengths | inp_lengths)
     marker_names = sorted(set(lab_counts.keys()) | set(inp_counts.keys()))
     N_markers = len(marker_names)
@@ -65,64 +76,26 @@ def get_label_lengths_stats(project_pk):
 
 @shared_task
 def get_user_timings_stats(project_pk):
-    inputs = Tm.Input.objects.filter(
-        marker__project__id=project_pk
-    ).order_by('dt_created').all()
-
-    labels = Tm.Label.objects.filter(
-        marker__project__id=project_pk, undone=False
-    ).order_by('dt_created').all()
-
-    inputs_by_user = defaultdict(lambda: defaultdict(list))
-    labels_by_user = defaultdict(lambda: defaultdict(list))
-    for inp in inputs:
-        inputs_by_user[inp.batch.user.username][str(inp.batch)].append(inp)
-    for lab in labels:
-        labels_by_user[lab.batch.user.username][str(lab.batch)].append(lab)
-
-    timings = []
-    for arr in [inputs_by_user, labels_by_user]:
-        for u in arr:
-            ll = list(arr[u].items())
-            for b1, b2 in zip(ll[:len(ll)], ll[1:]):
-                l1, l2 = b1[1][0], b2[1][0]
-                if l1 and l2 and l1.dt_created and l2.dt_created and\
-                    l1.dt_created.month == l2.dt_created.month and\
-                    l1.dt_created.day == l2.dt_created.day and\
-                    l1.dt_created.year == l2.dt_created.year:
-                    timing = round((l2.dt_created - l1.dt_created).total_seconds() / 60., 1) # in minutes
-                    if timing > 0 and timing < 120:
-                        # if timing is 0, means they were simply a part of the same batch
-                        # timing < 60 is simply a precaution
-                        timings.append(timing)
+    project = Tm.Project.objects.get(pk=project_pk)
+    histogram = project.timing_histogram()
 
     x_axis = []
-    if timings:
-        min_time, max_time = int(min(timings)), int(round(max(timings)))
-        x_axis = list(range(min_time, max_time, 1))
-        if x_axis:
-            x_axis.append(x_axis[-1] + 1)
+    if histogram:
+        buckets = [bucket for _, bucket, _ in histogram]
+        x_axis = list(range(min(buckets), max(buckets) + 1))
 
-    project = Tm.Project.objects.get(pk=project_pk)
-    participants = project.participants
-    N_participants = participants.count()
+    participants = list(project.participants.all())
+    N_participants = len(participants)
 
     if N_participants > 0:
-        providers = [p.username for p in participants.all()]
+        providers = [p.username for p in participants]
 
         data = [[0] * len(x_axis) for _ in range(N_participants)]
-        p2i = {v.username: k for k, v in enumerate(participants.all())}
-
-        for arr in [inputs_by_user, labels_by_user]:
-            for u in arr:
-                ll = list(arr[u].items())
-                for b1, b2 in zip(ll[:len(ll)], ll[1:]):
-                    l1, l2 = b1[1][0], b2[1][0]
-                    if l1 and l2 and l1.dt_created and l2.dt_created:
-                        timing = round((l2.dt_created - l1.dt_created).total_seconds() / 60., 1)
-                        if timing > 0 and timing < 120:
-                            pos = bisect.bisect(x_axis, timing)
-                            data[p2i[u]][pos - 1] += 1
+        p2i = {v.pk: k for k, v in enumerate(participants)}
+
+        for user_id, bucket, count in histogram:
+            if user_id in p2i:
+                data[p2i[user_id]][bucket - x_axis[0]] += count
 
         return {
             'labels': x_axis,
@@ -131,30 +104,19 @@ def get_user_timings_stats(project_pk):
     else:
         return {}
 
-def logs2dict(logs):
-    progress_counts = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(int))))
-
-    for l in logs:
-        progress_counts[l['is_submitted']][l['is_skipped']][l['datasource']][l['user_id']] = l['datapoint__count']
-
-    return progress_counts
-
 @shared_task
 def get_user_progress_stats(project_pk):
     project = Tm.Project.objects.get(pk=project_pk)
     participants = project.participants
     N_participants = participants.count()
 
-    logs = Tm.DataAccessLog.objects.filter(
-        project_id=project_pk
-    ).values(
-        'datasource', 'user_id', 'is_submitted', 'is_skipped'
-    ).annotate(Count('datapoint'))
-    progress_counts = logs2dict(logs)
+    counters = Tm.StatsCounter.objects.filter(
+        project_id=project_pk, name__in=['submitted', 'skipped']
+    ).values_list('user_id', 'datasource_id', 'name', 'value')
 
     dataset_info = {
         ds.pk: {'size': ds.size(), 'name': ds.name}
-        for ds in project.datasources.all()
+        for ds in project.datasources.select_related('catalogue').all()
     }
     x_axis = [v['name'] for v in dataset_info.values()]
     N_categories = len(x_axis)
@@ -165,29 +127,11 @@ def get_user_progress_stats(project_pk):
         data = [[[0] * N_categories, [0] * N_categories] for _ in range(N_participants)]
         l2i = {pk: i for i, pk in enumerate(dataset_info.keys())}
         p2i = {v.pk: k for k, v in enumerate(participants.all())}
+        stacks = {'submitted': 0, 'skipped': 1}
 
-        for stack in ['submitted', 'skipped']:
-            if stack == 'submitted':
-                logs_data, proc_ds = {}, set()
-                for ds in progress_counts[True][False]:
-                    c = Counter()
-                    c.update(progress_counts[True][False][ds])
-                    c.update(progress_counts[True][True][ds])
-                    logs_data[ds] = c
-                    proc_ds.add(ds)
-
-                for ds in progress_counts[True][True]:
-                    if ds not in proc_ds:
-                        logs_data[ds] = progress_counts[True][True][ds]
-            else:
-                logs_data = progress_counts[False][True]
-            for ds in logs_data:
-                ds_logs = logs_data[ds]
-                for u in ds_logs:
-                    if stack == 'submitted':
-                        data[p2i[u]][0][l2i[ds]] = round(ds_logs[u] * 100 / dataset_info[ds]['size'], 2)
-                    else:
-                        data[p2i[u]][1][l2i[ds]] = round(ds_logs[u] * 100 / dataset_info[ds]['size'], 2)
+        for u, ds, name, value in counters:
+            if u not in p2i or ds not in l2i or not dataset_info[ds]['size']: continue
+            data[p2i[u]][stacks[name]][l2i[ds]] = round(value * 100 / dataset_info[ds]['size'], 2)
 
         series = []
         for i, d in enumerate(data):
@@ -211,10 +155,151 @@ def get_user_progress_stats(project_pk):
 @shared_task
 def get_data_source_sizes_stats(project_pk):
     project = Tm.Project.objects.get(pk=project_pk)
-    x_axis = list(project.datasources.values_list('name', flat=True))
+    datasources = project.datasources.select_related('catalogue').all()
+    x_axis = [ds.name for ds in datasources]
     providers = ['Number of datapoints']
-    sizes = [[p.size() for p in project.datasources.all()]]
+    sizes = [[ds.size() for ds in datasources]]
     return {
         "labels": x_axis,
         "datasets": get_chartjs_datasets(providers, sizes)
     }
+
+@shared_task
+def prefetch_next_datapoint(project_pk, user_pk):
+    try:
+        project = Tm.Project.objects.get(pk=project_pk)
+        user = Tm.User.objects.get(pk=user_pk)
+    except (Tm.Project.DoesNotExist, Tm.User.DoesNotExist):
+        return
+    project.prefetch_data(user)
+
+@shared_task
+def refresh_datasource_catalogue(ds_pk, chunk_size=5000):
+    try:
+        ds_def = Tm.DataSource.objects.get(pk=ds_pk)
+    except Tm.DataSource.DoesNotExist:
+        return
+
+    try:
+        if not ds_def.has_catalogue:
+            return
+
+        content_hash = ds_def.content_hash()
+        catalogue = Tm.DataSourceCatalogue.objects.filter(datasource=ds_def).first()
+        if catalogue and catalogue.content_hash == content_hash:
+            return
+
+        ds_instance = ds_def._load()
+        if ds_instance is None:
+            return
+
+        N = ds_instance.size()
+        with transaction.atomic():
+            catalogue, _ = Tm.DataSourceCatalogue.objects.update_or_create(
+                datasource=ds_def,
+                defaults={'size': N, 'content_hash': content_hash}
+            )
+            catalogue.entries.all().delete()
+            for start in range(0, N, chunk_size):
+                Tm.CatalogueEntry.objects.bulk_create([
+                    Tm.CatalogueEntry(
+                        catalogue=catalogue,
+                        datapoint=dp_id,
+                        source_name=str(ds_instance.get_source_name(dp_id) or '')[:255]
+                    )
+                    for dp_id in range(start, min(start + chunk_size, N))
+                ])
+    except Exception as e:
+        logger.error("Could not refresh the catalogue of data source {}: {}".format(ds_pk, e))
+        raise
+    finally:
+        caches['default'].delete('catalogue_refresh_{}'.format(ds_pk))
+
+@shared_task
+def reindex_datasource(ds_pk, chunk_size=1000):
+    """
+    Re-vectorizes the contexts (and their inputs) of the data source after its search config has changed,
+    as well as the contexts without search vectors. Each chunk is committed separately, so no long transaction
+    holds the row locks and an interrupted task can simply be started again.
+    """
+    cache, key = caches['default'], 'search_reindex_{}'.format(ds_pk)
+    try:
+        search_config = Tm.DataSource.objects.filter(pk=ds_pk).values_list('search_config', flat=True).get()
+    except Tm.DataSource.DoesNotExist:
+        cache.delete('search_reindex_lock_{}'.format(ds_pk))
+        return
+
+    try:
+        total = Tm.Context.objects.filter(datasource_id=ds_pk).filter(
+            ~Q(search_config=search_config) | Q(search_config__isnull=True) | Q(content_vector__isnull=True)
+        ).count()
+        progress = {'config': search_config, 'done': 0, 'total': total, 'finished': False}
+        cache.set(key, progress, None)
+
+        after_id = 0
+        while True:
+            ids = Tm.Context.reindex_chunk(ds_pk, search_config, after_id=after_id, limit=chunk_size)
+            if not ids:
+                break
+            after_id = ids[-1]
+            progress['done'] += len(ids)
+            cache.set(key, progress, None)
+
+        progress['finished'] = True
+        cache.set(key, progress, None)
+    except Exception as e:
+        logger.error("Could not re-index data source {}: {}".format(ds_pk, e))
+        raise
+    finally:
+        cache.delete('search_reindex_lock_{}'.format(ds_pk))
+
+    # the search config might have been changed again in the meantime
+    ds = Tm.DataSource.objects.filter(pk=ds_pk).first()
+    if ds is not None and ds.search_config != search_config:
+        ds.schedule_search_reindex()
+    return progress['done']
+
+@shared_task
+def export_annotations(ctask_pk):
+    ctask = Tm.CeleryTask.objects.select_related('project').get(pk=ctask_pk)
+    config = ctask.config
+    exporter = Tex.AnnotationExporter(ctask.project, config=config['options'])
+
+    name = os.path.join(
+        'exports', str(ctask.project_id),
+        "{}.{}".format(ctask.fingerprint, Tex.export_extension(config['format'], config['compression']))
+    )
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    tmp_path = "{}.{}.tmp".format(path, ctask.pk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def report(N):
+        Tm.CeleryTask.objects.filter(pk=ctask.pk).update(progress=N)
+
+    try:
+        N = Tex.write_export(
+            exporter, tmp_path, export_format=config['format'],
+            compression=config['compression'], callback=report
+        )
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.error("Could not export the annotations of project {}: {}".format(ctask.project_id, e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        Tm.CeleryTask.objects.filter(pk=ctask.pk).update(finished=True)
+        raise
+
+    ctask.progress = N
+    ctask.result.name = name
+    ctask.finished = True
+    ctask.save()
+
+    # Only the latest artifact for the same export configuration is worth keeping
+    outdated = Tm.CeleryTask.objects.filter(
+        task=ctask.task, project_id=ctask.project_id, config=config, finished=True
+    ).exclude(pk=ctask.pk)
+    for old_task in outdated:
+        if old_task.result and old_task.result.name != name:
+            old_task.result.delete(save=False)
+    outdated.delete()
+    return N
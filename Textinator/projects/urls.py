@@ -18,7 +18,13 @@ urlpatterns = [
     path('<proj>/join', views.join_or_leave_project, name='join_or_leave'),
     path('<proj>/time_report', views.time_report, name='time_report'),
     path('<proj>/explorer', views.data_explorer, name='data_explorer'),
+    path('<proj>/explorer/summary', views.data_explorer_summary, name='data_explorer_summary'),
+    path('<proj>/explorer/contexts', views.data_explorer_contexts, name='data_explorer_contexts'),
     path('<proj>/export', views.export, name='data_exporter'),
+    path('<proj>/export/changes', views.export_changes, name='export_changes'),
+    path('<proj>/export/start', views.export_start, name='export_start'),
+    path('<proj>/export/status', views.export_status, name='export_status'),
+    path('<proj>/export/<int:task>/download', views.export_download, name='export_download'),
     path('<proj>/explorer/inputs/<inp>/delete', views.async_delete_input, name='async_delete_input'),
     path("<proj>/get/annotations", views.get_annotations, name="get_annotations"),
     path("<proj>/get/context", views.get_context, name="get_context"),
@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
+import re
 import json
 import numbers
+import datetime as dt
 from collections import defaultdict, OrderedDict
 
 from django.conf import settings
+from django.db import transaction, connection
 from django.template.loader import render_to_string
-from django.db.models import F, Window
-from django.db.models.functions import RowNumber
-from django.core.paginator import Paginator
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.db.models import BooleanField, Exists, ExpressionWrapper, F, Func, IntegerField, OuterRef, Q, Subquery, Window
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Coalesce, Length, RowNumber, Substr
+from django.contrib.postgres.search import SearchQuery, SearchRank
 from django.utils import timezone
 
 from .models import *
@@ -60,84 +63,25 @@ def listify(x):
     return x if isinstance(x, list) else [x]
 
 def get_or_create_ctx(batch_info, ctx_cache):
+    lookup = {
+        'datasource': batch_info.data_source,
+        'datapoint': batch_info.datapoint
+    }
     if ctx_cache:
-        ctx = retrieve_by_hash(batch_info.context, Context, ctx_cache)
-        if not ctx:
-            ctx = Context.objects.create(
-                datasource=batch_info.data_source,
-                datapoint=batch_info.datapoint,
-                content=batch_info.context
-            )
-            ctx_cache.set(ctx.content_hash, ctx.pk, 3600)
-    else:
-        try:
-            ctx, _ = Context.objects.get_or_create(
-                datasource=batch_info.data_source,
-                datapoint=batch_info.datapoint,
-                content=batch_info.context
-            )
-        except Context.MultipleObjectsReturned:
-            # this should not happen
-            ctx = Context.objects.filter(
-                datasource=batch_info.data_source,
-                datapoint=batch_info.datapoint,
-                content=batch_info.context
-            ).first()
+        ctx = retrieve_by_hash(batch_info.context, Context, ctx_cache, **lookup)
+        if ctx:
+            return ctx
+
+    ctx, _ = Context.objects.get_or_create(
+        content_hash=hash_text(batch_info.context),
+        defaults={'content': batch_info.context},
+        **lookup
+    )
+    if ctx_cache:
+        cache_by_hash(ctx, ctx_cache, **lookup)
     return ctx
 
 
-def process_chunk(chunk, batch, batch_info, caches, ctx_cache=None):
-    saved_labels = 0
-
-    if chunk.get('marked', False) and (not chunk.get('deleted', False)) and chunk.get('updated', True):
-        ctx_cache, label_cache = caches
-
-        ctx = get_or_create_ctx(batch_info, ctx_cache)
-
-        try:
-            if (not 'label' in chunk) or (not isinstance(chunk['label'], str)):
-                return (ctx_cache, label_cache), saved_labels
-
-            chunk_label = chunk['label'].strip()
-            code = "_".join(chunk_label.split("_")[:-1])
-            # TODO: check interaction with MarkerUnits
-            markers = MarkerVariant.objects.filter(project=batch_info.project, marker__code=code)
-
-            marker = None
-            for mv in markers:
-                if mv.code == chunk_label:
-                    marker = mv
-                    break
-        except MarkerVariant.DoesNotExist:
-            return (ctx_cache, label_cache), saved_labels
-
-        if 'lengthBefore' in chunk and 'start' in chunk and 'end' in chunk and marker:
-            new_start = chunk['lengthBefore'] + chunk['start']
-            new_end = chunk['lengthBefore'] + chunk['end']
-
-            # it's fine if input is blank
-            new_label = Label.objects.create(
-                context=ctx, start=new_start, end=new_end, marker=marker,
-                batch=batch, extra={k: v for k, v in chunk['extra'].items() if v}
-            )
-            new_label.revision_changes = "Added a new marker of type {} [{}]".format(
-                marker.name,
-                timezone.now().strftime('%Y-%m-%d %H:%M:%S %Z')
-            )
-            label_cache[chunk['id']] = new_label.id
-            saved_labels += 1
-        return (ctx_cache, label_cache), saved_labels
-
-
-def extract_ids(batches):
-    if batches:
-        batch_ids = batches.values_list('batch_id', flat=True)
-    else:
-        batch_ids = []
-
-    return batch_ids
-
-
 def verbalize_search_type(st):
     if st == "int":
         return "plain" # intersection query
@@ -146,6 +90,24 @@ def verbalize_search_type(st):
     elif st == "web":
         return "websearch" # web-like search with OR allowed
 
+def set_fuzzy_search_threshold():
+    # the threshold of the trigram operators, which (unlike comparing the similarity itself) can use the indexes
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)",
+            [str(settings.FUZZY_SEARCH_THRESHOLD)]
+        )
+
+def escape_like(query):
+    return query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def fuzzy_match(field, query):
+    """
+    Matches the texts in `field` either containing the query (case-insensitively) or containing
+    a fragment similar to it, both of which are served by the trigram indexes
+    """
+    return Q(**{'{}__icontains'.format(field): query}) | Q(**{'{}__trigram_word_similar'.format(field): query})
+
 def check_empty(var, default):
     ban = set()
     if var is None:
@@ -160,6 +122,182 @@ def check_empty(var, default):
 def get_unbanned(lst, ban):
     return [x for i, x in enumerate(lst) if i not in ban]
 
+class KeysetPage:
+    """
+    A page of batches ordered from the newest to the oldest. Instead of a page number, a page is addressed
+    by a cursor, i.e. the key (creation time, ID) of the batch right before or after it, so that each page is
+    fetched by a single query, no matter how deep into the list it is.
+
+    Cursors look like `n<microseconds since epoch>_<ID>` (the page after the batch) or `p<...>_<ID>`
+    (the page before the batch); the creation time is empty for the (old) batches without it.
+    """
+    EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+    CURSOR_RE = re.compile(r"^([np])(\d*)_(\d+)$")
+
+    def __init__(self, items, cursor='', has_previous=False, has_next=False):
+        self.items = items
+        self.cursor = cursor or ''
+        self.__has_previous = has_previous
+        self.__has_next = has_next
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def has_previous(self):
+        return self.__has_previous
+
+    def has_next(self):
+        return self.__has_next
+
+    @property
+    def previous_cursor(self):
+        return 'p' + self.key(self.items[0]) if self.items else ''
+
+    @property
+    def next_cursor(self):
+        return 'n' + self.key(self.items[-1]) if self.items else ''
+
+    @classmethod
+    def key(cls, batch):
+        if batch.dt_created is None:
+            return "_{}".format(batch.pk)
+        return "{}_{}".format((batch.dt_created - cls.EPOCH) // dt.timedelta(microseconds=1), batch.pk)
+
+    @classmethod
+    def parse(cls, cursor):
+        m = cls.CURSOR_RE.match(cursor or '')
+        if m is None:
+            return None
+        direction, ts, pk = m.groups()
+        dt_created = cls.EPOCH + dt.timedelta(microseconds=int(ts)) if ts else None
+        return direction, dt_created, int(pk)
+
+    @classmethod
+    def paginate(cls, batches, cursor=None, per_page=30):
+        parsed = cls.parse(cursor)
+        # the same order as an index on (dt_created DESC NULLS LAST, id DESC)
+        newest_first = [F('dt_created').desc(nulls_last=True), F('pk').desc()]
+
+        if parsed is None:
+            items = list(batches.order_by(*newest_first)[:per_page + 1])
+            return cls(items[:per_page], has_next=len(items) > per_page)
+
+        direction, dt_created, pk = parsed
+        if direction == 'n':
+            if dt_created is None:
+                older = Q(dt_created__isnull=True, pk__lt=pk)
+            else:
+                older = Q(dt_created__lt=dt_created) | Q(dt_created=dt_created, pk__lt=pk) | Q(dt_created__isnull=True)
+            items = list(batches.filter(older).order_by(*newest_first)[:per_page + 1])
+            return cls(items[:per_page], cursor, has_previous=True, has_next=len(items) > per_page)
+        else:
+            if dt_created is None:
+                newer = Q(dt_created__isnull=False) | Q(dt_created__isnull=True, pk__gt=pk)
+            else:
+                newer = Q(dt_created__gt=dt_created) | Q(dt_created=dt_created, pk__gt=pk)
+            items = list(batches.filter(newer).order_by(
+                F('dt_created').asc(nulls_first=True), F('pk').asc()
+            )[:per_page + 1])
+            if len(items) <= per_page:
+                # reached the newest batches, so show a full first page instead
+                return cls.paginate(batches, per_page=per_page)
+            return cls(items[:per_page][::-1], cursor, has_previous=True, has_next=True)
+
+
+def number_batches(batches, column, values):
+    """
+    Numbers the given batches chronologically (the annotation numbers shown on the editing board)
+    and returns {batch ID: number} for the batches whose `column` (`id` or `index`, i.e. the number)
+    is among the `values`
+    """
+    numbered = batches.annotate(index=Window(
+        expression=RowNumber(),
+        order_by=[F('dt_created').asc(), F('pk').asc()]
+    )).values_list('pk', 'index')
+    sql, params = numbered.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT t.id, t.index FROM ({}) t WHERE t.{} = ANY(%s)".format(sql, column),
+            list(params) + [list(values)]
+        )
+        return dict(cursor.fetchall())
+
+
+def count_subquery(qs, field='pk', function='COUNT'):
+    """
+    A scalar subquery aggregating all rows of `qs` (without grouping), so that several aggregates fit into one query
+    """
+    return Coalesce(Subquery(
+        qs.order_by().annotate(agg=Func(F(field), function=function)).values('agg'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def flagged_logs(project, user=None):
+    logs = DataAccessLog.objects.filter(project=project).annotate(
+        terrors=KeyTransform('text_errors', 'flags')
+    ).exclude(terrors={}).exclude(terrors="")
+    if user is not None:
+        logs = logs.filter(user=user)
+    return logs
+
+
+def explorer_summary(project, user, is_admin):
+    """
+    Returns the summary counts of the data explorer computed by a single query
+    (the labels and inputs are counted by `StatsCounter`s)
+    """
+    labels = Label.objects.filter(marker__project=project, undone=False)
+    inputs = Input.objects.filter(marker__project=project)
+    relations = LabelRelation.objects.filter(first_label__marker__project=project, undone=False)
+    label_counters = StatsCounter.objects.filter(project=project, name__startswith='labels:')
+    if not is_admin:
+        labels = labels.filter(batch__user=user)
+        relations = relations.filter(batch__user=user)
+        label_counters = label_counters.filter(user=user)
+    batches = Batch.objects.filter(
+        Exists(labels.filter(batch=OuterRef('pk'))) | Exists(inputs.filter(batch=OuterRef('pk')))
+    )
+
+    return Project.objects.filter(pk=project.pk).annotate(
+        total_batches=count_subquery(batches),
+        total_labels=count_subquery(label_counters, 'value', 'SUM'),
+        total_relations=count_subquery(relations),
+        total_inputs=count_subquery(
+            StatsCounter.objects.filter(project=project, name__startswith='inputs:'), 'value', 'SUM'
+        ),
+        flagged_num=count_subquery(flagged_logs(project, None if is_admin else user))
+    ).values('total_batches', 'total_labels', 'total_relations', 'total_inputs', 'flagged_num').get()
+
+
+def explorer_contexts(project, user, is_admin, after=0, limit=50, snippet_length=175):
+    """
+    Returns a page of the contexts having annotations in the project (ordered by ID, starting after the given one)
+    with their content truncated by the database, as well as the cursor of the next page (None if it's the last one)
+    """
+    labels = Label.objects.filter(context=OuterRef('pk'), marker__project=project, undone=False)
+    if not is_admin:
+        labels = labels.filter(batch__user=user)
+    inputs = Input.objects.filter(context=OuterRef('pk'), marker__project=project)
+
+    contexts = list(Context.objects.filter(
+        Exists(labels) | Exists(inputs), pk__gt=after
+    ).order_by('pk').alias(content_length=Length('content')).annotate(
+        snippet=Substr('content', 1, snippet_length),
+        is_truncated=ExpressionWrapper(Q(content_length__gt=snippet_length), output_field=BooleanField())
+    ).values('pk', 'snippet', 'is_truncated')[:limit + 1])
+
+    has_next = len(contexts) > limit
+    contexts = contexts[:limit]
+    return [
+        {'id': c['pk'], 'text': c['snippet'] + ("..." if c['is_truncated'] else "")}
+        for c in contexts
+    ], (contexts[-1]['pk'] if has_next else None)
+
+
 def render_editing_board(request, project, user, page, template='partials/components/areas/editing.html', ds_id=None, dp_id=None,
                          current_uuid=None, search_dict=None):
     is_author, is_shared = project.author == user, project.shared_with(user)
@@ -190,55 +328,35 @@ def render_editing_board(request, project, user, page, template='partials/compon
         search_queries = get_unbanned(search_queries, ban)
         search_types = get_unbanned(search_types, ban)
 
-    if is_author or is_shared:
-        label_batches = Label.objects.filter(marker__project=project).order_by('dt_created')
-        input_batches = Input.objects.filter(marker__project=project).order_by('dt_created')
-    else:
-        label_batches = Label.objects.filter(batch__user=user, marker__project=project).order_by('dt_created')
-        input_batches = Input.objects.filter(batch__user=user, marker__project=project).order_by('dt_created')
-
-    label_batch_ids, input_batch_ids = extract_ids(label_batches), extract_ids(input_batches)
+    # the batches are filtered by correlated subqueries instead of collecting their IDs first
+    label_batches = Label.objects.filter(batch=OuterRef('pk'), marker__project=project)
+    input_batches = Input.objects.filter(batch=OuterRef('pk'), marker__project=project)
+    user_scope = Q() if is_author or is_shared else Q(user=user)
 
     # Here we don't use just dataset identifiers, because
     # there can, of course, be multiple datasets with the same
     # datapoint IDs
-    window_exp = Window(
-        expression=RowNumber(),
-        order_by=F('dt_created').asc()
-    )
-
-    relevant_batches = Batch.objects.filter(
-        pk__in=set(label_batch_ids) | set(input_batch_ids)
-    ).annotate(index=window_exp)
+    relevant_batches = Batch.objects.filter(user_scope, Exists(label_batches) | Exists(input_batches))
 
+    numbers = None
     if search_dict is not None and search_dict.get('batch_ids', []):
-        sql_string, sql_params = relevant_batches.query.sql_with_params()
-        batches = Batch.objects.raw(
-            "SELECT * FROM ({}) t1 WHERE t1.uuid IN ({}) ORDER BY t1.dt_created DESC NULLS LAST;".format(
-                sql_string, ", ".join(["%s" for _ in range(len(search_dict['batch_ids']))])
-            ),
-            list(sql_params) + search_dict['batch_ids']
-        )
+        # exactly the same batches as shown before (e.g., a random sample)
+        batches = relevant_batches.filter(uuid__in=search_dict['batch_ids'])
+        is_random_order = False
     elif -2 in search_mv_pks:
         # search for specific annotation no.
         sq_id = search_mv_pks.index(-2)
         search_query = search_queries[sq_id]
 
-        sql_string, sql_params = relevant_batches.query.sql_with_params()
         try:
             search_indices = [int(x.strip()) for x in search_query.strip().split(",") if x.strip()]
         except ValueError:
             search_indices = []
-        if search_indices:
-            batches = Batch.objects.raw(
-                "SELECT * FROM ({}) t1 WHERE t1.index IN ({}) ORDER BY t1.dt_created DESC NULLS LAST;".format(
-                    sql_string, ", ".join(["%s" for _ in range(len(search_indices))])
-                ),
-                list(sql_params) + search_indices
-            )
-        else:
-            batches = []
+        numbers = number_batches(relevant_batches, 'index', search_indices) if search_indices else {}
+        batches = Batch.objects.filter(pk__in=list(numbers.keys()))
+        is_random_order = False
     else:
+        is_reviewable = True
         if ds_id and dp_id:
             # reviewing
             if ds_id > 0 and dp_id > 0:
@@ -251,7 +369,7 @@ def render_editing_board(request, project, user, page, template='partials/compon
                     context__datapoint=dp_id
                 )
             else:
-                label_batches, input_batches = None, None
+                is_reviewable = False
 
         lang_dict = dict(settings.LANGUAGES)
         sconf_dict = settings.LANG_SEARCH_CONFIG
@@ -263,25 +381,25 @@ def render_editing_board(request, project, user, page, template='partials/compon
         if search_flagged:
             # means search only among flagged
             input_batches = input_batches.filter(batch__is_flagged=True)
-            input_batch_ids = extract_ids(input_batches)
 
         vector = None
-        if search_mv_pks or search_queries:
-            input_batch_ids = []
+        if not is_reviewable:
+            batches = Batch.objects.none()
+        elif search_mv_pks or search_queries:
+            clauses = []
             for search_mv_pk, search_query, search_type in zip(search_mv_pks, search_queries, search_types):
                 search_mv_pk = int(search_mv_pk)
+                input_batches_clause = input_batches
                 if search_mv_pk is not None:
+                    # stored (and indexed) search vectors
                     if search_mv_pk == 0:
                         vector = "context__content_vector"
-                        input_batches_clause = input_batches
                     else:
                         # -2 means search by annotation number
-                        vector = SearchVector("content", config=search_config)
+                        vector = "content_vector"
 
                     if search_mv_pk > 0:
                         input_batches_clause = input_batches.filter(marker_id=search_mv_pk)
-                    elif search_mv_pk == -1:
-                        input_batches_clause = input_batches
 
                 if search_type == "nemp":
                     # check non-empty ones
@@ -289,8 +407,16 @@ def render_editing_board(request, project, user, page, template='partials/compon
 
                 if search_query and vector:
                     if search_type == "ext":
-                        # exact match
-                        input_batches_clause = input_batches_clause.filter(content=search_query)
+                        # exact match (`contains` lets PostgreSQL narrow the candidates down using the trigram index)
+                        input_batches_clause = input_batches_clause.filter(
+                            content__contains=search_query, content=search_query
+                        )
+                    elif search_type == "fzy":
+                        # contains a (similar) fragment
+                        set_fuzzy_search_threshold()
+                        input_batches_clause = input_batches_clause.filter(fuzzy_match(
+                            "context__content" if search_mv_pk == 0 else "content", search_query
+                        ))
                     else:
                         query = SearchQuery(
                             search_query,
@@ -298,53 +424,41 @@ def render_editing_board(request, project, user, page, template='partials/compon
                             config=search_config
                         )
 
-                        if search_type == "phr":
-                            # phrase queries
-                            if isinstance(vector, str):
-                                input_batches_clause = input_batches_clause.filter(**{vector: query}) # some of them get like 1e-20, which is why > 0 doesn't work'
-                            else:
-                                input_batches_clause = input_batches_clause.annotate(
-                                    search=vector
-                                ).filter(search=query) # some of them get like 1e-20, which is why > 0 doesn't work'
-                        else:
+                        # matching first lets PostgreSQL use the GIN index
+                        input_batches_clause = input_batches_clause.filter(**{vector: query})
+                        if search_type != "phr":
                             input_batches_clause = input_batches_clause.annotate(
-                                rank=SearchRank(vector, query)
+                                rank=SearchRank(F(vector), query)
                             ).filter(rank__gt=1e-3) # some of them get like 1e-20, which is why > 0 doesn't work'
-                ib_ids = extract_ids(input_batches_clause)
-                input_batch_ids.append(set(ib_ids))
+                clauses.append(Exists(input_batches_clause))
 
-            batch_ids = set.intersection(*input_batch_ids) if input_batch_ids else set()
+            # a batch should match all search clauses
+            batches = Batch.objects.filter(user_scope, *clauses) if clauses else Batch.objects.none()
         elif search_flagged:
-            batch_ids = set(input_batch_ids)
-        else:
-            batch_ids = set(label_batch_ids) | set(input_batch_ids)
-
-        if batch_ids:
-            sql_string, sql_params = relevant_batches.query.sql_with_params()
-            if is_random_order:
-                exclude_rev_clause = "WHERE s.revision_of_id IS NULL" if search_dict is None else ""
-                batches = Batch.objects.raw(
-                    "SELECT * FROM (SELECT * FROM ({}) t1 WHERE t1.id IN ({}) ORDER BY random() LIMIT 5) s {} ORDER BY s.dt_created DESC NULLS LAST;".format(
-                        sql_string, ", ".join(["%s" for _ in range(len(batch_ids))]), exclude_rev_clause
-                    ),
-                    list(sql_params) + [str(x) for x in list(batch_ids)]
-                )
-            else:
-                exclude_rev_clause = "AND t1.revision_of_id IS NULL" if search_dict is None else ""
-                batches = Batch.objects.raw(
-                    "SELECT * FROM ({}) t1 WHERE t1.id IN ({}) {} ORDER BY t1.dt_created DESC NULLS LAST;".format(
-                        sql_string, ", ".join(["%s" for _ in range(len(batch_ids))]), exclude_rev_clause
-                    ),
-                    list(sql_params) + [str(x) for x in list(batch_ids)]
-                )
+            batches = Batch.objects.filter(user_scope, Exists(input_batches))
         else:
-            batches = []
+            batches = Batch.objects.filter(user_scope, Exists(label_batches) | Exists(input_batches))
 
-    p = Paginator(batches, 30)
+        if search_dict is None:
+            batches = batches.filter(revision_of__isnull=True)
+
+    if is_random_order:
+        current_page = KeysetPage(sorted(
+            batches.order_by('?')[:5], key=lambda b: (b.dt_created or KeysetPage.EPOCH, b.pk), reverse=True
+        ))
+    else:
+        current_page = KeysetPage.paginate(batches, page)
+
+    if ds_id is None and current_page:
+        # annotation numbers are shown only on the editing board
+        if numbers is None:
+            numbers = number_batches(relevant_batches, 'id', [b.pk for b in current_page])
+        for b in current_page:
+            b.index = numbers.get(b.pk)
 
     return render_to_string(template, {
-        'paginator': p,
-        'page': page,
+        'current_page': current_page,
+        'page': current_page.cursor,
         'project': project,
         'is_admin': is_author or is_shared,
         'current_uuid': current_uuid,
@@ -352,89 +466,87 @@ def render_editing_board(request, project, user, page, template='partials/compon
     }, request=request)
 
 
-def process_inputs(batch, batch_info, short_text_markers=None, long_text_markers=None,
-    numbers=None, ranges=None, radios=None, checkboxes=None, ctx_cache=None):
-    if any([short_text_markers, long_text_markers, numbers, ranges, radios, checkboxes]):
-        stm, ltm, num, ran = short_text_markers, long_text_markers, numbers, ranges
-        rad, check = radios, checkboxes
-    else:
-        stm = batch_info.short_text_markers
-        ltm = batch_info.long_text_markers
-        num = batch_info.numbers
-        ran = batch_info.ranges
-        rad = batch_info.radios
-        check = batch_info.checkboxes
-    inputs = [stm, ltm, num, ran, rad, check]
-
-    if any(inputs):
-        new_inputs = [x for x in inputs if x]
-
-        ctx = get_or_create_ctx(batch_info, ctx_cache)
+class SubmissionEngine:
+    """
+    Builds all annotations of a submission in memory and writes them to the database
+    with at most one query per model inside a single transaction.
+
+    The marker variants of the project are resolved once per engine (instead of once per marker code)
+    and the context is created (or retrieved) at most once. Typical usage is:
+
+    .. code-block:: python
+
+        engine = SubmissionEngine(batch_info, ctx_cache=ctx_cache)
+        engine.add_inputs(batch)
+        engine.add_chunks_and_relations(batch)
+        engine.save()
+    """
+    def __init__(self, batch_info, ctx_cache=None):
+        self.__batch_info = batch_info
+        self.__ctx_cache = ctx_cache
+        self.__variants = None
+        self.__ctx = None
+        self.__inputs, self.__labels, self.__relations = [], [], []
+
+    @property
+    def variants(self):
+        """
+        Returns:
+            dict: A mapping from marker variant codes to the marker variants of the project
+        """
+        if self.__variants is None:
+            project = self.__batch_info.project
+            registry = MarkerRegistry.get(project)
+            mvs = project.markervariant_set.select_related('marker', 'unit')
+            self.__variants = {registry[mv.pk]['code']: mv for mv in mvs if mv.pk in registry}
+        return self.__variants
+
+    @property
+    def context(self):
+        if self.__ctx is None:
+            self.__ctx = get_or_create_ctx(self.__batch_info, self.__ctx_cache)
+        return self.__ctx
+
+    def __input(self, **kwargs):
+        self.__inputs.append(Input(context=self.context, dt_updated=timezone.now(), **kwargs))
+
+    def __label(self, **kwargs):
+        label = Label(context=self.context, dt_updated=timezone.now(), **kwargs)
+        self.__labels.append(label)
+        return label
+
+    def add_inputs(self, batch, short_text_markers=None, long_text_markers=None,
+                   numbers=None, ranges=None, radios=None, checkboxes=None):
+        batch_info = self.__batch_info
+        if any([short_text_markers, long_text_markers, numbers, ranges, radios, checkboxes]):
+            inputs = [short_text_markers, long_text_markers, numbers, ranges, radios, checkboxes]
+        else:
+            inputs = [
+                batch_info.short_text_markers, batch_info.long_text_markers, batch_info.numbers,
+                batch_info.ranges, batch_info.radios, batch_info.checkboxes
+            ]
 
-        mv = {}
-        for inp_type in new_inputs:
+        for inp_type in inputs:
+            if not inp_type: continue
             for code, inp_string in inp_type.items():
                 if inp_string.strip():
-                    marker_code = "_".join(code.split("_")[:-1])
-                    if marker_code not in mv:
-                        marker_variants = MarkerVariant.objects.filter(
-                            project=batch_info.project,
-                            marker__code=marker_code
-                        )
-                        mv[marker_code] = marker_variants
-
-                    for m in mv[marker_code]:
-                        if m.code == code:
-                            Input.objects.create(
-                                content=inp_string.strip(),
-                                marker=m,
-                                batch=batch,
-                                context=ctx,
-                                revision_changes="Added a new marker of type {} [{}]".format(
-                                    m.name,
-                                    timezone.now().strftime('%Y-%m-%d %H:%M:%S %Z')
-                                )
+                    m = self.variants.get(code)
+                    if m:
+                        self.__input(
+                            content=inp_string.strip(),
+                            marker=m,
+                            batch=batch,
+                            revision_changes="Added a new marker of type {} [{}]".format(
+                                m.name,
+                                timezone.now().strftime('%Y-%m-%d %H:%M:%S %Z')
                             )
-                            break
-
-
-def process_chunks_and_relations(batch, batch_info, ctx_cache=None):
-    saved_labels = 0
-    label_cache = {}
-    for chunk in batch_info.chunks:
-        # inp is typically the same for all chunks
-        res_chunk = process_chunk(
-            chunk, batch, batch_info,
-            (ctx_cache, label_cache)
-        )
-        if res_chunk:
-            ret_caches, just_saved = res_chunk
-            ctx_cache, label_cache = ret_caches
-            saved_labels += just_saved
-
-    for i, rel in enumerate(batch_info.relations):
-        for link in rel['links']:
-            source_id, target_id = int(link['s']), int(link['t'])
-
-            try:
-                source_label = Label.objects.filter(pk=label_cache.get(source_id, -1)).get()
-                target_label = Label.objects.filter(pk=label_cache.get(target_id, -1)).get()
-            except Label.DoesNotExist:
-                continue
-
-            try:
-                rule = RelationVariant.objects.filter(pk=rel['rule']).get()
-            except RelationVariant.DoesNotExist:
-                continue
-
-            LabelRelation.objects.create(
-                rule=rule, first_label=source_label, second_label=target_label, batch=batch,
-                cluster=i+1, extra=rel['extra']
-            )
+                        )
 
+    def add_marker_groups(self, batch):
+        batch_info = self.__batch_info
+        if not batch_info.marker_groups:
+            return
 
-def process_marker_groups(batch, batch_info, ctx_cache=None):
-    if batch_info.marker_groups:
         marker_groups = OrderedDict()
         for k, v in batch_info.marker_groups.items():
             name_parts = k.split("_")
@@ -450,71 +562,155 @@ def process_marker_groups(batch, batch_info, ctx_cache=None):
                 else:
                     marker_groups[prefix][mv_code].append(v)
 
-        if len([a for x in marker_groups.values() for y in x.values() for a in y]) > 0:
-            ctx = get_or_create_ctx(batch_info, ctx_cache)
-
-            mv_map = {}
-            for prefix, v in marker_groups.items():
-                unit, group_idx = prefix.split("_")
-                group_idx = int(group_idx)
-                unit_cache = []
-                for code, values in v.items():
-                    if not values: continue
-                    marker_code = "_".join(code.split("_")[:-1])
-                    if marker_code not in mv_map:
-                        marker_variants = MarkerVariant.objects.filter(
-                            project=batch_info.project, marker__code=marker_code
-                        )
-                        mv_map[marker_code] = marker_variants
-
-                    mv = None
-                    for m in mv_map[marker_code]:
-                        if m.code == code:
-                            mv = m
-                            break
-
-                    if mv.unit.name != unit:
-                        continue
-
-                    if mv.anno_type in ('radio', 'check'):
-                        # make "||" a setting and not only a variable in labeler.js
-                        unit_cache.append({
-                            'content': "||".join(values) if isinstance(values, list) else values,
-                            'marker': mv,
-                            # TODO: potentially move to 0-based later?
-                            # Depends on if the end-uses should be exposed to this number
-                            # or not. The initial idea was that they might, but should they really?
-                            'group_order': group_idx + 1 # from 0-based to 1-based
-                        })
-                    else:
-                        for val in values:
-                            if val:
-                                unit_cache.append({
-                                    'content': val,
-                                    'marker': mv,
-                                    'group_order': group_idx + 1
-                                })
-                for dct in unit_cache:
-                    Input.objects.create(context=ctx, batch=batch, **dct)
+        for prefix, v in marker_groups.items():
+            unit, group_idx = prefix.split("_")
+            group_idx = int(group_idx)
+            for code, values in v.items():
+                if not values: continue
+
+                mv = self.variants.get(code)
+                if mv is None or mv.unit is None or mv.unit.name != unit:
+                    continue
+
+                if mv.anno_type in ('radio', 'check'):
+                    # make "||" a setting and not only a variable in labeler.js
+                    self.__input(
+                        content="||".join(values) if isinstance(values, list) else values,
+                        marker=mv,
+                        batch=batch,
+                        # TODO: potentially move to 0-based later?
+                        # Depends on if the end-uses should be exposed to this number
+                        # or not. The initial idea was that they might, but should they really?
+                        group_order=group_idx + 1 # from 0-based to 1-based
+                    )
+                else:
+                    for val in values:
+                        if val:
+                            self.__input(content=val, marker=mv, batch=batch, group_order=group_idx + 1)
+
+    def add_text_markers(self, batch, text_markers=None):
+        for tm_code in (text_markers or self.__batch_info.text_markers or []):
+            m = self.variants.get(tm_code)
+            if m:
+                self.__label(marker=m, batch=batch)
+
+    def add_chunk(self, chunk, batch):
+        """
+        Returns:
+            Label: The (yet unsaved) label for the chunk, if the chunk should be saved, otherwise None
+        """
+        if not chunk.get('marked', False) or chunk.get('deleted', False) or not chunk.get('updated', True):
+            return None
+
+        if (not 'label' in chunk) or (not isinstance(chunk['label'], str)):
+            return None
+
+        # TODO: check interaction with MarkerUnits
+        marker = self.variants.get(chunk['label'].strip())
 
+        if 'lengthBefore' in chunk and 'start' in chunk and 'end' in chunk and marker:
+            # it's fine if input is blank
+            return self.__label(
+                start=chunk['lengthBefore'] + chunk['start'],
+                end=chunk['lengthBefore'] + chunk['end'],
+                marker=marker, batch=batch,
+                extra={k: v for k, v in chunk['extra'].items() if v}
+            )
+        return None
+
+    def add_chunks_and_relations(self, batch):
+        batch_info = self.__batch_info
+        label_cache = {}
+        for chunk in batch_info.chunks:
+            label = self.add_chunk(chunk, batch)
+            if label is not None:
+                label_cache[chunk['id']] = label
+
+        for i, rel in enumerate(batch_info.relations):
+            for link in rel['links']:
+                source_label = label_cache.get(int(link['s']))
+                target_label = label_cache.get(int(link['t']))
+                if source_label is None or target_label is None:
+                    continue
+                self.__relations.append((rel['rule'], source_label, target_label, batch, i + 1, rel['extra']))
+
+    @transaction.atomic
+    def save(self):
+        """
+        Writes all collected annotations to the database
+
+        Returns:
+            tuple: (the list of created inputs, the list of created labels, the list of created relations)
+        """
+        inputs = Input.objects.bulk_create(self.__inputs) if self.__inputs else []
+        # primary keys are set on the labels by bulk_create (PostgreSQL), so relations can refer to them
+        labels = Label.objects.bulk_create(self.__labels) if self.__labels else []
+        StatsCounter.track(inputs + labels, created=True)
+
+        relations = []
+        if self.__relations:
+            rule_pks = set()
+            for r in self.__relations:
+                try:
+                    rule_pks.add(int(r[0]))
+                except (TypeError, ValueError):
+                    pass
+            rules = RelationVariant.objects.in_bulk(rule_pks)
+            for rule_pk, source_label, target_label, batch, cluster, extra in self.__relations:
+                try:
+                    rule = rules.get(int(rule_pk))
+                except (TypeError, ValueError):
+                    rule = None
+                if rule is None:
+                    continue
+                relations.append(LabelRelation(
+                    rule=rule, first_label=source_label, second_label=target_label, batch=batch,
+                    cluster=cluster, extra=extra, dt_updated=timezone.now()
+                ))
+            if relations:
+                relations = LabelRelation.objects.bulk_create(relations)
+
+        self.__inputs, self.__labels, self.__relations = [], [], []
+        return inputs, labels, relations
 
-def process_text_markers(batch, batch_info, text_markers=None, ctx_cache=None):
-    sent_text_markers = text_markers or batch_info.text_markers
 
-    if sent_text_markers:
-        ctx = get_or_create_ctx(batch_info, ctx_cache)
+def process_chunk(chunk, batch, batch_info, caches, ctx_cache=None):
+    ctx_cache, label_cache = caches
+    engine = SubmissionEngine(batch_info, ctx_cache=ctx_cache)
+    label = engine.add_chunk(chunk, batch)
+    if label is None:
+        return (ctx_cache, label_cache), 0
+    engine.save()
+    label_cache[chunk['id']] = label.id
+    return (ctx_cache, label_cache), 1
+
 
-        mv = {}
-        for tm_code in sent_text_markers:
-            marker_code = "_".join(tm_code.split("_")[:-1])
-            if marker_code not in mv:
-                marker_variants = MarkerVariant.objects.filter(project=batch_info.project, marker__code=marker_code)
-                mv[marker_code] = marker_variants
+def process_inputs(batch, batch_info, short_text_markers=None, long_text_markers=None,
+    numbers=None, ranges=None, radios=None, checkboxes=None, ctx_cache=None):
+    engine = SubmissionEngine(batch_info, ctx_cache=ctx_cache)
+    engine.add_inputs(
+        batch, short_text_markers=short_text_markers, long_text_markers=long_text_markers,
+        numbers=numbers, ranges=ranges, radios=radios, checkboxes=checkboxes
+    )
+    engine.save()
+
+
+def process_chunks_and_relations(batch, batch_info, ctx_cache=None):
+    engine = SubmissionEngine(batch_info, ctx_cache=ctx_cache)
+    engine.add_chunks_and_relations(batch)
+    engine.save()
 
-            for m in mv[marker_code]:
-                if m.code == tm_code:
-                    Label.objects.create(context=ctx, marker=m, batch=batch)
-                    break
+
+def process_marker_groups(batch, batch_info, ctx_cache=None):
+    engine = SubmissionEngine(batch_info, ctx_cache=ctx_cache)
+    engine.add_marker_groups(batch)
+    engine.save()
+
+
+def process_text_markers(batch, batch_info, text_markers=None, ctx_cache=None):
+    engine = SubmissionEngine(batch_info, ctx_cache=ctx_cache)
+    engine.add_text_markers(batch, text_markers=text_markers)
+    engine.save()
 
 
 def follow_json_path(obj, path):
@@ -538,13 +734,13 @@ def follow_json_path(obj, path):
 
 def process_recorded_search_args(request_dict):
     try:
-        page = int(request_dict.get("p", 1))
+        page = request_dict.get("p", "")
         scope = request_dict.get("scope")
         search_type = request_dict.get("search_type")
         batch_ids = request_dict.get("batch_ids")
         search_flagged = request_dict.get("search_flagged")
     except ValueError:
-        page, scope, search_type, batch_ids = 1, -1, None, None
+        page, scope, search_type, batch_ids = "", -1, None, None
     query = request_dict.get("query")
 
     if scope is None:
@@ -8,10 +8,11 @@ import logging
 import itertools
 from collections import defaultdict
 
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, StreamingHttpResponse, FileResponse, Http404
+from django.db import transaction
 from django.db.models import Q
-from django.db.models.fields.json import KeyTransform
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.views import generic
 from django.conf import settings
 from django.views.decorators.http import require_http_methods
@@ -21,6 +22,7 @@ from django.template.loader import render_to_string, get_template
 from django.contrib.auth.decorators import login_required
 from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from celery.result import AsyncResult
 
@@ -35,10 +37,11 @@ import projects.export as Tex
 from Textinator.ext import rawqueryset_count
 from Textinator.jinja2 import to_markdown, to_formatted_text
 from .view_helpers import (
-    BatchInfo, process_inputs, process_marker_groups, process_text_markers,
+    BatchInfo, SubmissionEngine, process_inputs, process_marker_groups, process_text_markers,
     process_chunks_and_relations, process_chunk, render_editing_board
 )
 from .tasks import get_label_lengths_stats, get_user_timings_stats, get_user_progress_stats, get_data_source_sizes_stats
+from .tasks import export_annotations
 
 PT2MM = 0.3527777778
 MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
@@ -190,12 +193,11 @@ class DetailView(LoginRequiredMixin, generic.DetailView):
                             is_skipped=False
                         )
 
-                try:
-                    logs = Tm.DataAccessLog.objects.filter(user=u, project=proj, datasource=d, is_submitted=True).count()
-                except Tm.DataAccessLog.DoesNotExist:
-                    print("DataAccessLog does not exist")
+                logs = Tm.StatsCounter.total(proj, name='submitted', user=u, datasource=d)
+
+            proj.schedule_prefetch(u)
 
-        menu_items, project_markers = {}, Tm.MarkerVariant.objects.filter(project=proj)
+        menu_items, project_markers = {}, proj.markervariant_set.select_related('marker')
         for m in project_markers:
             menu_items[m.marker.code] = [item.to_json() for item in Tm.MarkerContextMenuItem.objects.filter(marker=m).all()]
 
@@ -216,7 +218,10 @@ class DetailView(LoginRequiredMixin, generic.DetailView):
                 text = dp_info.text
 
             if not dp_info.no_data:
-                text = Th.apply_premarkers(proj, text).strip()
+                if dp_info.rendered_text is not None:
+                    text = dp_info.rendered_text.strip()
+                else:
+                    text = Th.apply_premarkers(proj, text).strip()
 
         ctx = {
             'text': text,
@@ -275,14 +280,22 @@ def record_datapoint(request, proj):
             else:
                 dal.is_submitted = True
                 dal.is_delayed = False
+                dal.is_lease_expired = False
                 dal.save()
+                batch_info.project.finish_lease(batch_info.user, batch_info.data_source, dal.datapoint)
+
+        with transaction.atomic():
+            batch = Tm.Batch.objects.create(uuid=uuid.uuid4(), user=batch_info.user)
 
-        batch = Tm.Batch.objects.create(uuid=uuid.uuid4(), user=batch_info.user)
+            engine = SubmissionEngine(batch_info, ctx_cache=ctx_cache)
+            engine.add_inputs(batch)
+            engine.add_marker_groups(batch)
+            engine.add_text_markers(batch) # markers for the whole text
+            engine.add_chunks_and_relations(batch)
+            engine.save()
 
-        process_inputs(batch, batch_info, ctx_cache=ctx_cache)
-        process_marker_groups(batch, batch_info, ctx_cache=ctx_cache)
-        process_text_markers(batch, batch_info, ctx_cache=ctx_cache) # markers for the whole text
-        process_chunks_and_relations(batch, batch_info, ctx_cache=ctx_cache)
+        if batch_info.project.auto_text_switch and not batch_info.data_source.is_interactive:
+            batch_info.project.schedule_prefetch(batch_info.user)
     elif mode == 'e' or mode == "rev":
         # editing (e) or reviewing (rev)
         batch_uuid = data.get('batch')
@@ -391,10 +404,13 @@ def record_datapoint(request, proj):
                                 process_inputs(revised_batch, batch_info, **kwargs)
 
             if inputs:
-                if mode == "e" or batch.revision_of_id is not None:
-                    Tm.Input.objects.bulk_update(inputs, ['content'])
-                elif mode == "rev":
-                    Tm.Input.objects.bulk_create(inputs)
+                with transaction.atomic():
+                    if mode == "e" or batch.revision_of_id is not None:
+                        Tm.Input.objects.bulk_update(inputs, ['content'])
+                        Tm.StatsCounter.track(inputs)
+                    elif mode == "rev":
+                        Tm.Input.objects.bulk_create(inputs)
+                        Tm.StatsCounter.track(inputs, created=True)
 
             # First save new labels, before deleting old
             # To avoid the case that when all labels have been removed from the batch
@@ -501,7 +517,7 @@ def recorded_search(request, proj):
 @login_required
 @require_http_methods(["GET"])
 def editing(request, proj):
-    page = int(request.GET.get("p", 1))
+    page = request.GET.get("p", "")
     project = get_object_or_404(Tm.Project, pk=proj)
     return JsonResponse({
         'partial': False,
@@ -515,10 +531,9 @@ def review(request, proj):
     try:
         ds = int(request.GET.get('ds', -1))
         dp = int(request.GET.get('dp', -1))
-        page = int(request.GET.get("p", 1))
     except ValueError:
         ds, dp = -1, -1
-        page = 1
+    page = request.GET.get("p", "")
     project = get_object_or_404(Tm.Project, pk=proj)
     return JsonResponse({
         'template': render_editing_board(
@@ -761,6 +776,7 @@ def new_article(request, proj):
             dp_id = request.POST.get('dpId')
             save_for_later = request.POST.get('saveForLater') == "true"
             if dp_id:
+                is_submitted = False
                 try:
                     log = Tm.DataAccessLog.objects.get(
                         user=request.user, project=project,
@@ -769,6 +785,7 @@ def new_article(request, proj):
                     log.is_skipped = not save_for_later
                     log.is_delayed = save_for_later
                     log.save()
+                    is_submitted = log.is_submitted
                 except Tm.DataAccessLog.DoesNotExist:
                     Tm.DataAccessLog.objects.create(
                         user=request.user, project=project,
@@ -777,6 +794,9 @@ def new_article(request, proj):
                         is_delayed=save_for_later
                     )
 
+                if not is_submitted:
+                    project.return_to_pool(request.user, data_source, dp_id, save_for_later=save_for_later)
+
     dp_info = project.data(request.user, True)
     request.session['dp_info_{}'.format(proj)] = dp_info.to_json()
 
@@ -794,14 +814,24 @@ def new_article(request, proj):
             log.is_delayed = False
             log.save()
         else:
-            Tm.DataAccessLog.objects.get_or_create(
+            log, _ = Tm.DataAccessLog.objects.get_or_create(
                 user=request.user, datapoint=str(dp_info.id),
                 project=project, datasource=data_source,
                 is_submitted=False, is_skipped=False,
-                is_delayed=False
+                is_delayed=False, is_deleted=False
             )
+            if log.is_lease_expired:
+                # the datapoint was drawn again, so the log belongs to the new lease
+                log.is_lease_expired = False
+                log.save()
 
-        text = Th.apply_premarkers(project, dp_info.text)
+        # prepare the next one while the annotator works on this one
+        project.schedule_prefetch(request.user)
+
+        if dp_info.rendered_text is not None:
+            text = dp_info.rendered_text
+        else:
+            text = Th.apply_premarkers(project, dp_info.text)
 
         if dp_info.source_formatting == 'md':
             text = to_markdown(text)
@@ -875,47 +905,53 @@ def undo_last(request, proj):
     })
 
 
-@login_required
-@require_http_methods(["GET"])
-def data_explorer(request, proj):
-    project = Tm.Project.objects.filter(pk=proj).get()
-
+def explorer_access(request, proj):
+    project = get_object_or_404(Tm.Project, pk=proj)
     is_author, is_shared = project.author == request.user, project.shared_with(request.user)
     if is_author or is_shared or project.has_participant(request.user):
-        is_admin = is_author or is_shared
+        return project, is_author or is_shared
+    raise Http404
 
-        flagged_datapoints = Tm.DataAccessLog.objects.filter(project=project).annotate(
-            terrors=KeyTransform('text_errors', 'flags')
-        ).exclude(terrors={}).exclude(terrors="").order_by('-dt_updated')
-        if not is_admin:
-            flagged_datapoints = flagged_datapoints.filter(user=request.user)
 
-        relations = Tm.LabelRelation.objects.filter(first_label__marker__project=project, undone=False)
-        labels = Tm.Label.objects.filter(marker__project=project, undone=False)
-        if not is_admin:
-            labels = labels.filter(batch__user=request.user)
-            relations = relations.filter(batch__user=request.user)
+def export_access(request, proj):
+    # exports contain the annotations of all participants, so only project admins may get them
+    project, is_admin = explorer_access(request, proj)
+    if not is_admin:
+        raise Http404
+    return project
 
-        inputs = Tm.Input.objects.filter(marker__project=project)
-        batch_ids = set(list(inputs.values_list('batch', flat=True).distinct())) | set(list(labels.values_list('batch', flat=True).distinct()))
-        total_relations = relations.count()
 
-        context_ids = set(list(inputs.values_list('context_id', flat=True).distinct())) | set(list(labels.values_list('context_id', flat=True).distinct()))
-        contexts = Tm.Context.objects.filter(id__in=context_ids).all()
+@login_required
+@require_http_methods(["GET"])
+def data_explorer(request, proj):
+    project, is_admin = explorer_access(request, proj)
+    flagged_datapoints = Tvh.flagged_logs(project, None if is_admin else request.user).order_by('-dt_updated')
+    return render(request, 'projects/data_explorer.html', {
+        'project': project,
+        'flagged_datapoints': flagged_datapoints[:300]
+    })
 
-        ctx = {
-            'project': project,
-            'total_labels': labels.count(),
-            'total_relations': total_relations,
-            'total_inputs': inputs.count(),
-            'total_batches': len(batch_ids),
-            'flagged_datapoints': flagged_datapoints[:300],
-            'flagged_num': flagged_datapoints.count(),
-            'contexts': contexts
-        }
-        return render(request, 'projects/data_explorer.html', ctx)
-    else:
-        raise Http404
+
+@login_required
+@require_http_methods(["GET"])
+def data_explorer_summary(request, proj):
+    project, is_admin = explorer_access(request, proj)
+    return JsonResponse(Tvh.explorer_summary(project, request.user, is_admin))
+
+
+@login_required
+@require_http_methods(["GET"])
+def data_explorer_contexts(request, proj):
+    project, is_admin = explorer_access(request, proj)
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        after = 0
+    contexts, next_cursor = Tvh.explorer_contexts(project, request.user, is_admin, after=after)
+    return JsonResponse({
+        'contexts': contexts,
+        'next': next_cursor
+    })
 
 
 @login_required
@@ -941,22 +977,130 @@ def async_delete_input(request, proj, inp):
     return redirect(request.META.get('HTTP_REFERER', '/'))
 
 
+def export_options(request):
+    return {
+        'consolidate_clusters': request.GET.get('consolidate_clusters') == 'on',
+        'include_usernames': request.GET.get('include_usernames') == 'on',
+        'include_batch_no': request.GET.get('include_batch_no') == 'on',
+        'include_flags': request.GET.get('include_flags') == 'on'
+    }
+
+
 @login_required
 @require_http_methods(["GET"])
 def export(request, proj):
     try:
         project = Tm.Project.objects.get(pk=proj)
-        exporter = Tex.AnnotationExporter(project, config={
-            'consolidate_clusters': request.GET.get('consolidate_clusters') == 'on',
-            'include_usernames': request.GET.get('include_usernames') == 'on',
-            'include_batch_no': request.GET.get('include_batch_no') == 'on',
-            'include_flags': request.GET.get('include_flags') == 'on'
-        })
+        exporter = Tex.AnnotationExporter(project, config=export_options(request))
+        export_format = request.GET.get('format', 'json')
+        if export_format == 'jsonl':
+            response = StreamingHttpResponse(
+                Tex.stream_json_lines(exporter.stream()), content_type='application/jsonl'
+            )
+            response['Content-Disposition'] = 'attachment; filename="export.jsonl"'
+            return response
+        elif export_format == 'json_stream':
+            response = StreamingHttpResponse(
+                Tex.stream_json_array(exporter.stream()), content_type='application/json'
+            )
+            response['Content-Disposition'] = 'attachment; filename="export.json"'
+            return response
         return JsonResponse({"data": exporter.export()})
     except Tm.Project.DoesNotExist:
         raise Http404
 
 
+@login_required
+@require_http_methods(["GET"])
+def export_changes(request, proj):
+    project = export_access(request, proj)
+    since = request.GET.get('since')
+    if since:
+        since = parse_datetime(since)
+        if since is None:
+            return JsonResponse({'error': 'The watermark should be an ISO 8601 datetime'}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since, dt.timezone.utc)
+
+    exporter = Tex.AnnotationExporter(project, config=export_options(request))
+    watermark, batches, tombstones = exporter.changes(since=since)
+    return StreamingHttpResponse(
+        Tex.stream_changes(watermark, batches, tombstones), content_type='application/json'
+    )
+
+
+@login_required
+@require_http_methods(["GET"])
+def export_start(request, proj):
+    project = export_access(request, proj)
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in Tex.EXPORT_FORMATS:
+        export_format = 'jsonl'
+    compression = request.GET.get('compression', settings.EXPORT_COMPRESSION)
+    if compression not in Tex.EXPORT_COMPRESSIONS:
+        compression = 'gzip'
+
+    options = export_options(request)
+    config = {'options': options, 'format': export_format, 'compression': compression}
+    fingerprint = Tex.AnnotationExporter(project, config=options).fingerprint(
+        export_format=export_format, compression=compression
+    )
+
+    # the project has not changed since the last export with the same configuration
+    previous = Tm.CeleryTask.objects.filter(
+        task='export', project=project, fingerprint=fingerprint, finished=True
+    ).exclude(result='').exclude(result__isnull=True).order_by('-dt_created').first()
+    if previous and previous.result.storage.exists(previous.result.name):
+        return JsonResponse({'task': previous.pk, 'ready': True})
+
+    ctask, is_created = Tm.CeleryTask.objects.get_or_create(
+        task='export', project=project, fingerprint=fingerprint, finished=False,
+        defaults={'config': config}
+    )
+    if is_created:
+        r = export_annotations.delay(ctask.pk)
+        ctask.token = r.task_id
+        ctask.save()
+    return JsonResponse({'task': ctask.pk, 'ready': False})
+
+
+@login_required
+@require_http_methods(["GET"])
+def export_status(request, proj):
+    export_access(request, proj)
+    ctask = get_object_or_404(Tm.CeleryTask, pk=request.GET.get('task'), task='export', project_id=proj)
+    response = {
+        'ready': ctask.finished,
+        'progress': ctask.progress,
+        'error': False
+    }
+    if ctask.finished:
+        if ctask.result:
+            response['url'] = reverse('projects:export_download', kwargs={'proj': proj, 'task': ctask.pk})
+        else:
+            response['error'] = True
+    elif ctask.token:
+        res = AsyncResult(ctask.token)
+        if res.ready() and not res.successful():
+            response['ready'] = True
+            response['error'] = True
+            logger.error(res.traceback)
+    return JsonResponse(response)
+
+
+@login_required
+@require_http_methods(["GET"])
+def export_download(request, proj, task):
+    export_access(request, proj)
+    ctask = get_object_or_404(Tm.CeleryTask, pk=task, task='export', project_id=proj, finished=True)
+    if not ctask.result or not ctask.result.storage.exists(ctask.result.name):
+        raise Http404
+    return FileResponse(
+        ctask.result.open('rb'), as_attachment=True,
+        filename=os.path.basename(ctask.result.name)
+    )
+
+
 #@login_required
 #@require_http_methods(["GET"])
 #def export_settings(request):
@@ -1051,6 +1195,7 @@ def flagged_search(request, proj):
     project = Tm.Project.objects.get(pk=proj)
     data = json.loads(request.body)
     text_search = data.get("text_search")
+    fuzzy_search = data.get("fuzzy_search")
     query = data.get('query')
 
     is_author, is_shared = project.author == request.user, project.shared_with(request.user)
@@ -1062,17 +1207,36 @@ def flagged_search(request, proj):
             flags="")
         if not is_admin:
             flagged = flagged.filter(user=request.user)
+    else:
+        raise Http404
 
     if query:
         if text_search:
+            if fuzzy_search:
+                # fragments or similar fragments, both found via the trigram index
+                Tvh.set_fuzzy_search_threshold()
+                rank_sql = "word_similarity(%s, pc.content)"
+                match_sql = "(pc.content ILIKE %s OR %s <%% pc.content)"
+                sql_params = [query, "%{}%".format(Tvh.escape_like(query)), query]
+            else:
+                rank_sql = "ts_rank(pc.content_vector, phraseto_tsquery(pc.search_config, %s))"
+                match_sql = "pc.content_vector @@ phraseto_tsquery(pc.search_config, %s)"
+                sql_params = [query, query]
+
+            user_sql = ""
+            sql_params.append(project.pk)
+            if not is_admin:
+                user_sql = "AND pda.user_id = %s"
+                sql_params.append(request.user.pk)
+
             raw_sql = """
-                SELECT pda.id, ts_rank(pc.content_vector, phraseto_tsquery(pc.search_config, %s)) AS rank, (pda.flags->'text_errors')
+                SELECT pda.id, {} AS rank, (pda.flags->'text_errors')
                 FROM projects_dataaccesslog pda
                 INNER JOIN projects_context pc
                 ON (pda.datasource_id=pc.datasource_id AND pda.datapoint=pc.datapoint)
-                WHERE (pda.flags->'text_errors') <> '{}' AND (pda.flags->'text_errors' IS NOT NULL) AND pc.content_vector @@ phraseto_tsquery(pc.search_config, %s)
-                ORDER BY rank DESC"""
-            sql_params = [query, query]
+                WHERE (pda.flags->'text_errors') <> '{{}}' AND (pda.flags->'text_errors' IS NOT NULL) AND {}
+                    AND pda.project_id = %s {}
+                ORDER BY rank DESC""".format(rank_sql, match_sql, user_sql)
             res = Tm.DataAccessLog.objects.raw(raw_sql, sql_params)
             res.raw_count = rawqueryset_count(raw_sql, sql_params)
             res.count = lambda: res.raw_count
@@ -1098,23 +1262,26 @@ def flagged_search(request, proj):
 
 
 @login_required
+@require_http_methods(["GET"])
 def time_report(request, proj):
-    def calc_time(ll, dp_created):
-        for b1, b2 in zip(ll[:len(ll)], ll[1:]):
-            l1, l2 = b1[1][0], b2[1][0]
-            try:
-                if l1 and l2 and l1.dt_created and l2.dt_created and l1.dt_created.month == l2.dt_created.month and\
-                    l1.dt_created.day == l2.dt_created.day and l1.dt_created.year == l2.dt_created.year:
-                    timing = round((l2.dt_created - l1.dt_created).total_seconds() / 60. / 60, 2)
-                    if timing <= 2:
-                        time_spent[u][f"{l1.dt_created.year}/{l1.dt_created.month}"] += timing
-                    dp_created[u][f"{l1.dt_created.year}/{l1.dt_created.month}"] += len(b2[1])
-            except:
-                pass
-
-    project = Tm.Project.objects.filter(pk=proj).get()
+    project = get_object_or_404(Tm.Project, pk=proj)
+    if project.author != request.user and not project.shared_with(request.user):
+        raise Http404
+
+    rows = project.time_report()
+    usernames = dict(Tm.User.objects.filter(
+        pk__in={r[0] for r in rows}
+    ).values_list('pk', 'username'))
+
+    report = defaultdict(dict)
+    for user_id, month, hours, items in rows:
+        report[usernames[user_id]][month] = {
+            'hours': float(hours),
+            'items': items
+        }
+    # TODO: render as a PDF again?
     # return FileResponse(buffer, as_attachment=True, filename='time_report.pdf')
-    return JsonResponse({})
+    return JsonResponse({'report': report})
 
 
 @login_required
@@ -1193,10 +1360,12 @@ def importer(request):
             content = []
             for tk in text_keys:
                 content.extend(list(Tvh.follow_json_path(obj, tk.strip().split("."))))
+            ctx_content = "\n\n".join(content)
             ctx, _ = Tm.Context.objects.get_or_create(
                 datasource=ds,
                 datapoint=i,
-                content="\n\n".join(content)
+                content_hash=Th.hash_text(ctx_content),
+                defaults={'content': ctx_content}
             )
 
             mv_items = mv_mapping.items()
@@ -45,7 +45,11 @@
   const explorer = {
     init: function () {
       this.textWidget = document.querySelector("#textWidget");
-      this.textSelector = this.textWidget.querySelector("select#text");
+      this.textList = this.textWidget.querySelector("#textList");
+      this.selectedText = null;
+      // the cursor of the next page of texts, null when all texts are loaded
+      this.nextTexts = 0;
+      this.isLoadingTexts = false;
       this.textContentArea = this.textWidget.querySelector("div#text");
       this.annotatorSelectors = {
         an1: document.querySelector("select#an1"),
@@ -61,18 +65,29 @@
       };
 
       this.initEvents();
+      this.loadSummary();
+      this.loadTexts();
     },
     initEvents: function () {
       let ctx = this;
 
-      this.textSelector.addEventListener("change", function (e) {
-        let target = e.target;
+      this.textList.addEventListener("click", function (e) {
+        let target = e.target.closest("a.panel-block");
+        if (!utils.isDefined(target)) return;
+
+        let prev = ctx.textList.querySelector("a.panel-block.is-active");
+        if (utils.isDefined(prev)) prev.classList.remove("is-active");
+        target.classList.add("is-active");
 
         utils.removeAllChildren(ctx.textContentArea);
+        ctx.selectedText = target.getAttribute("data-id");
+        ctx.loadText(ctx.selectedText);
+      });
 
-        if (target.selectedIndex !== 0) {
-          ctx.loadText(target.options[target.selectedIndex].value);
-        }
+      this.textList.addEventListener("scroll", function () {
+        let list = ctx.textList;
+        if (list.scrollTop + list.clientHeight >= list.scrollHeight - 50)
+          ctx.loadTexts();
       });
 
       for (let s in this.annotatorSelectors) {
@@ -83,16 +98,9 @@
 
             utils.removeAllChildren(ctx.annotationAreas[target.id]);
 
-            if (
-              target.selectedIndex !== 0 &&
-              ctx.textSelector.selectedIndex !== 0
-            ) {
-              let userSelected = target.options[target.selectedIndex].value,
-                textSelected =
-                  ctx.textSelector.options[ctx.textSelector.selectedIndex]
-                    .value;
-
-              ctx.loadAnnotations(textSelected, userSelected, target.id);
+            if (target.selectedIndex !== 0 && ctx.selectedText !== null) {
+              let userSelected = target.options[target.selectedIndex].value;
+              ctx.loadAnnotations(ctx.selectedText, userSelected, target.id);
             }
           },
           false
@@ -128,6 +136,51 @@
         );
       }
     },
+    loadSummary: function () {
+      let summary = document.querySelector("#explorerSummary");
+      $.ajax({
+        method: "GET",
+        url: summary.getAttribute("data-url"),
+        dataType: "json",
+        success: function (data) {
+          summary.querySelectorAll("[data-total]").forEach(function (el) {
+            el.innerText = data[el.getAttribute("data-total")];
+          });
+        },
+      });
+    },
+    loadTexts: function () {
+      let ctx = this;
+      if (this.isLoadingTexts || this.nextTexts === null) return;
+
+      this.isLoadingTexts = true;
+      $.ajax({
+        method: "GET",
+        url: this.textList.getAttribute("data-url"),
+        dataType: "json",
+        data: {
+          after: this.nextTexts,
+        },
+        success: function (data) {
+          for (let i = 0, len = data.contexts.length; i < len; i++) {
+            let item = document.createElement("a");
+            item.className = "panel-block";
+            item.setAttribute("data-id", data.contexts[i].id);
+            item.innerText = data.contexts[i].text;
+            ctx.textList.appendChild(item);
+          }
+          ctx.nextTexts = data.next;
+          ctx.isLoadingTexts = false;
+
+          // keep loading until the list becomes scrollable
+          if (ctx.textList.scrollHeight <= ctx.textList.clientHeight)
+            ctx.loadTexts();
+        },
+        error: function () {
+          ctx.isLoadingTexts = false;
+        },
+      });
+    },
     loadText: function (textId) {
       let ctx = this;
       $.ajax({
@@ -301,7 +354,14 @@
 
     $("a[download]").on("click", function () {
       var $btn = $(this),
-        $form = $btn.closest("form");
+        $form = $btn.closest("form"),
+        params = $form.serializeObject();
+
+      if (params.format !== undefined && params.format != "json") {
+        // streamed exports are downloaded directly by the browser
+        window.location.href = $btn.attr("data-url") + "?" + $.param(params);
+        return;
+      }
 
       $btn.addClass("is-loading");
       $.ajax({
@@ -309,7 +369,7 @@
         url: $btn.attr("data-url"),
         contentType: "application/json; charset=utf-8",
         dataType: "json",
-        data: $form.serializeObject(),
+        data: params,
         success: function (data) {
           const blob = new Blob([JSON.stringify(data)], {
             type: "application/json",
@@ -341,5 +401,47 @@
         },
       });
     });
+
+    $("#backgroundExport").on("click", function () {
+      var $btn = $(this),
+        $status = $("#backgroundExportStatus"),
+        params = $btn.closest("form").serializeObject();
+
+      // background exports are always compressed, so the plain JSON option makes no sense here
+      if (params.format != "jsonl") params.format = "json";
+
+      function onError() {
+        alert("Error while exporting a file!");
+        $status.text("");
+        $btn.removeClass("is-loading");
+      }
+
+      function onReady(res) {
+        $btn.removeClass("is-loading");
+        if (res.error) {
+          onError();
+        } else {
+          $status.text("");
+          window.location.href = res.url;
+        }
+      }
+
+      $btn.addClass("is-loading");
+      $.get($btn.attr("data-start-url"), params, function (data) {
+        let interval = setInterval(function () {
+          $.get($btn.attr("data-status-url"), { task: data.task }, function (res) {
+            if (res.ready) {
+              clearInterval(interval);
+              onReady(res);
+            } else {
+              $status.text("Exported " + res.progress + " item(s)...");
+            }
+          }).fail(function () {
+            clearInterval(interval);
+            onError();
+          });
+        }, data.ready ? 0 : 3000);
+      }).fail(onError);
+    });
   });
 })(window.$);
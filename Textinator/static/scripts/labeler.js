@@ -1211,11 +1211,6 @@
           function (e) {
             let target = e.target;
 
-            if (target.id == "goToPage" && e.keyCode == 13) {
-              document.querySelector('[data-page="#goToPage"]').click();
-              return;
-            }
-
             let selection = window.getSelection();
 
             if (selection && selection.anchorNode != null) {
@@ -1377,12 +1372,12 @@
               if (utils.isDefined(searchForm))
                 searchData = $(searchForm).serializeObjectLists();
 
-              if (page == "#goToPage")
-                page = document.querySelector(page).value;
-
               $.ajax({
                 type: "GET",
-                url: closestPsArea.getAttribute("data-href") + "?p=" + page,
+                url:
+                  closestPsArea.getAttribute("data-href") +
+                  "?p=" +
+                  encodeURIComponent(page),
                 dataType: "json",
                 data: searchData,
                 success: function (d) {
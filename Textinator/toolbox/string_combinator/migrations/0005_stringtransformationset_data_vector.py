@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 5.0.1 on 2026-10-18 16:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolbox_string_combinator', '0004_alter_stringtransformationrule_s_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stringtransformationset',
+            name='data_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('data', config='english_lite'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='stringtransformationset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['data_vector'], name='toolbox_str_data_ve_828cd0_gin'),
+        ),
+    ]
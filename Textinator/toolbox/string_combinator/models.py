@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.contrib.postgres.indexes import GinIndex
 from django.utils.translation import gettext_lazy as _
 
 
@@ -37,10 +39,20 @@ class StringTransformationSet(models.Model):
     class Meta:
         verbose_name = _('string transformation')
         verbose_name_plural = _('string transformations')
+        indexes = [
+            GinIndex(fields=['data_vector'])
+        ]
+
+    SEARCH_CONFIG = 'english_lite'
 
     rules = models.ManyToManyField(StringTransformationRule)
     disabled = models.JSONField(null=True, blank=True)
     data = models.JSONField()
+    data_vector = models.GeneratedField(
+        expression=SearchVector('data', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True
+    )
     owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, verbose_name=_("owner"))
     batch = models.UUIDField()
 
@@ -9,7 +9,8 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.template.loader import render_to_string
 from django.contrib.staticfiles.storage import staticfiles_storage
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
+from django.db.models import F
+from django.contrib.postgres.search import SearchQuery, SearchRank
 
 import toolbox.string_combinator.models as SCm
 from toolbox.decorators import toolbox_required
@@ -140,26 +141,18 @@ def search_generations(request):
         'phr': 'phrase',   # phrase
         'web': 'websearch' # web-like
     }
-    # TODO: make language-dependent
-    search_config = "{}_lite".format('english')
     if search_query:
-        vector = SearchVector("data", config=search_config)
-
         query = SearchQuery(
             search_query,
             search_type=search_types.get(search_type, search_types['int']),
-            config=search_config
+            config=SCm.StringTransformationSet.SEARCH_CONFIG
         )
-        if search_query:
-            if search_type == "phr":
-                # phrase queries
-                tr_sets = SCm.StringTransformationSet.objects.annotate(
-                    search=vector
-                ).filter(search=query)
-            else:
-                tr_sets = SCm.StringTransformationSet.objects.annotate(
-                    rank=SearchRank(vector, query)
-                ).filter(rank__gt=1e-3) # some of them get like 1e-20, which is why > 0 doesn't work'
+        # the stored vectors are matched first, so that PostgreSQL can use the GIN index
+        tr_sets = SCm.StringTransformationSet.objects.filter(data_vector=query)
+        if search_type != "phr":
+            tr_sets = tr_sets.annotate(
+                rank=SearchRank(F('data_vector'), query)
+            ).filter(rank__gt=1e-3) # some of them get like 1e-20, which is why > 0 doesn't work'
     else:
         tr_sets = None
     return JsonResponse({
@@ -22,6 +22,14 @@ def get_datapoint():
     })
 
 
+@app.route("/get_datapoints", methods=['GET'])
+def get_datapoints():
+    keys = [k for k in request.args['keys'].split(',') if k]
+    return jsonify({
+        'texts': {k: texts[int(k)] for k in keys if 0 <= int(k) < len(texts)}
+    })
+
+
 @app.route("/get_random_datapoint", methods=['GET'])
 def get_random_datapoint():
     idx = random.randint(0, len(texts)-1)